@@ -50,7 +50,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'django.urls'
+ROOT_URLCONF = 'AdventureCueProject.urls'
 
 TEMPLATES = [
     {
@@ -68,7 +68,8 @@ TEMPLATES = [
     },
 ]
 
-WSGI_APPLICATION = 'django.wsgi.application'
+WSGI_APPLICATION = 'AdventureCueProject.wsgi.application'
+ASGI_APPLICATION = 'AdventureCueProject.asgi.application'
 
 
 # Database
@@ -122,3 +123,20 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Search pipeline (scripts/main.py)
+
+SCRIPTS_DIR = BASE_DIR.parent / 'scripts'
+
+CREDS_PATH = SCRIPTS_DIR / 'creds.json'
+
+# Seconds a single search may take before the endpoint gives up on it
+SEARCH_TIMEOUT = 45
+
+# Maximum number of trips of a single search looked up at once
+SEARCH_MAX_WORKERS = 8
+
+# Cache of Gemini trip suggestions: "memory" (per process), "disk" (an SQLite file shared by the worker processes)
+# or "tiered" (both), with how long suggestions are kept in seconds and how many are kept in memory
+GEMINI_LOCATION_CACHE = {"backend": "memory", "ttl": 6 * 60 * 60, "size": 1024}
@@ -16,7 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
+from SchedulerHomepage import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/search/', views.search, name='search'),
+    path('api/upstreams/', views.upstreams, name='upstreams'),
 ]
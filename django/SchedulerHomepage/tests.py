@@ -1,3 +1,199 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import types
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.test import SimpleTestCase
+
+from SchedulerHomepage import views
+from AccessPoints import amadeus as amad
+from AccessPoints import gemini as gem
+from AccessPoints import meteoblue as meb
+import init_clients
+from Tools import cache
+from Tools import rate_limit
+from Tools import resilience
+
+TRIPS = [
+    {
+        "location": {"city": "Nice", "state": None, "country": "France", "description": "Seaside town",
+                     "activities": ["beach"], "warnings": None, "culture": "French", "history": "Old"},
+        "destination_airport": "Nice Cote d'Azur Airport",
+        "price": 900
+    }
+]
+OFFER = {
+    "price": {"total": "420.00", "currency": "USD"},
+    "validatingAirlineCodes": ["AF"],
+    "numberOfBookableSeats": 4,
+    "itineraries": [{"duration": "PT9H", "segments": [
+        {"carrierCode": "AF", "departure": {"at": "2030-01-01T10:00:00", "iataCode": "JFK"},
+         "arrival": {"at": "2030-01-01T19:00:00", "iataCode": "NCE"}}
+    ]}]
+}
+DATA_DAY = {column: [1.0, 2.0, 3.0] for fields in meb.Forecast.FIELDS.values() for column in fields.values()}
+
+
+class Gemini:
+    """
+    A stand-in for the genai client, answering every generation with TRIPS.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+        async def generate_content(**kwargs):
+            self.calls += 1
+            return types.SimpleNamespace(text=json.dumps(TRIPS))
+
+        self.aio = types.SimpleNamespace(models=types.SimpleNamespace(generate_content=generate_content))
+
+
+def upstream_handler(weather_status=200):
+    """
+    Get an httpx handler playing the Amadeus and meteoblue APIs.
+    """
+
+    def handle(request):
+        url = str(request.url)
+        if url.startswith(amad.TOKEN_URL):
+            return httpx.Response(200, json={"access_token": "token", "expires_in": 1799})
+        if url.startswith(amad.FLIGHT_OFFERS_URL):
+            return httpx.Response(200, json={"meta": {"count": 1}, "data": [OFFER]})
+        if url.startswith("https://my.meteoblue.com"):
+            if weather_status != 200:
+                return httpx.Response(weather_status, json={"error": True})
+            return httpx.Response(200, json={"data_day": DATA_DAY})
+        return httpx.Response(404, json={"error": url})
+
+    return handle
+
+
+class SearchViewTest(SimpleTestCase):
+
+    def setUp(self):
+        for upstream_cache in (gem.LOCATION_CACHE, amad.OFFER_CACHE, meb.FORECAST_CACHE):
+            upstream_cache.clear()
+        for name in ("amadeus", "meteoblue", "geocoding", "gemini"):
+            upstream = resilience.get_upstream(name)
+            upstream.breaker.record_success()
+            self.enterContext(mock.patch.object(upstream, "limiter", None))
+        self.gemini = Gemini()
+        self.clients = {"gemini": init_clients.Auth(client=self.gemini)}
+        self.enterContext(mock.patch.object(views.pipeline, "clients", self.clients))
+        self.use_upstreams(upstream_handler())
+
+    def use_upstreams(self, handler):
+        transport = httpx.MockTransport(handler)
+        for name in ("amadeus", "meteoblue", "geocoding"):
+            self.clients[name] = init_clients.Auth(key=name, secret="secret",
+                                                   http_config={**init_clients.HTTP_CONFIG, "transport": transport})
+
+    def params(self, **overrides):
+        params = {"origin_airport": "Kennedy", "descriptors": "beach,sun",
+                  "departure_date": (date.today() + timedelta(days=30)).strftime("%m/%d/%Y"),
+                  "max_price": "1000", "adults": "1"}
+        params.update(overrides)
+        return {name: value for name, value in params.items() if value is not None}
+
+    def test_search_with_only_required_params(self):
+        response = self.client.get("/api/search/", self.params())
+        self.assertEqual(response.status_code, 200, response.content)
+        trips = response.json()
+        self.assertEqual(len(trips), 1)
+        self.assertEqual(trips[0]["trip"]["location"]["city"], "Nice")
+        self.assertEqual(trips[0]["flight"]["cost"], "420.00")
+        self.assertEqual(trips[0]["flight"]["departure"]["date"], "2030-01-01")
+        self.assertEqual(trips[0]["flight"]["departure"]["time"], "10:00:00")
+        self.assertEqual((trips[0]["flight"]["duration"], trips[0]["flight"]["stops"]), ("PT9H", 0))
+        self.assertEqual(trips[0]["flight"]["layovers"], [])
+        self.assertEqual(trips[0]["general"]["weather"]["days"], 3)
+
+    def test_search_with_every_param(self):
+        params = self.params(return_date=(date.today() + timedelta(days=37)).strftime("%m/%d/%Y"),
+                             children="1", infants="0", trav_class="Economy", non_stop="false")
+        response = self.client.get("/api/search/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()[0]["trip"]["destination_airport"], TRIPS[0]["destination_airport"])
+
+    def test_invalid_search(self):
+        response = self.client.get("/api/search/", self.params(adults="0"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"]["title"], "InvalidPassengerError")
+
+    def test_weather_down_degrades(self):
+        self.use_upstreams(upstream_handler(weather_status=503))
+        with mock.patch.object(resilience.get_upstream("meteoblue"), "base_delay", 0):
+            response = self.client.get("/api/search/", self.params())
+        self.assertEqual(response.status_code, 200, response.content)
+        general = response.json()[0]["general"]
+        self.assertIsNone(general["weather"])
+        self.assertEqual(general["error"]["title"], "WeatherUnavailableError")
+
+    def test_weather_error_isnt_cached(self):
+        self.use_upstreams(upstream_handler(weather_status=403))
+        response = self.client.get("/api/search/", self.params())
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(response.json()[0]["general"]["weather"])
+        self.assertEqual(len(meb.FORECAST_CACHE), 0)
+        self.use_upstreams(upstream_handler())
+        response = self.client.get("/api/search/", self.params())
+        self.assertEqual(response.json()[0]["general"]["weather"]["days"], 3)
+
+    def test_geocoding_errors_degrade(self):
+        self.enterContext(mock.patch.object(meb, "GEOCODE_CACHE", cache.LRUCache()))
+        # The trip isn't in airports.csv, so its weather needs geocoding
+        self.enterContext(mock.patch.object(views.pipeline, "trip_coordinates", lambda trip, airports: None))
+        answer = upstream_handler()
+        for status, body in ((403, {"status": {"code": 403, "message": "invalid API key"}, "results": []}),
+                             (200, {"status": {"code": 200, "message": "OK"}, "results": []})):
+
+            def handle(request):
+                if str(request.url).startswith("https://api.opencagedata.com"):
+                    return httpx.Response(status, json=body)
+                return answer(request)
+
+            with self.subTest(status=status):
+                self.use_upstreams(handle)
+                response = self.client.get("/api/search/", self.params())
+                self.assertEqual(response.status_code, 200, response.content)
+                trip = response.json()[0]
+                self.assertEqual(trip["flight"]["cost"], "420.00")
+                self.assertIsNone(trip["general"]["weather"])
+                self.assertEqual(trip["general"]["error"]["title"], "WeatherUnavailableError")
+                self.assertEqual(len(meb.GEOCODE_CACHE), 0)
+
+    def test_timeout_cancels_search(self):
+        started = []
+
+        async def slow(*args, **kwargs):
+            started.append(True)
+            await asyncio.sleep(10)
+
+        with mock.patch.object(views.pipeline, "run_search_async", slow), \
+                self.settings(SEARCH_TIMEOUT=1):
+            response = self.client.get("/api/search/", self.params())
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(started, [True])
+        self.assertEqual(views.pipeline.SEARCH_FLIGHTS.stats()["in_flight"], 0)
+
+
+class UpstreamsViewTest(SimpleTestCase):
+
+    def test_reports_every_upstream(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("amadeus", "meteoblue", "geocoding", "gemini"):
+                limiter = rate_limit.TokenBucket(name, rate=10, capacity=10, path=os.path.join(directory, "rl.sqlite3"))
+                self.enterContext(mock.patch.object(resilience.get_upstream(name), "limiter", limiter))
+            resilience.get_upstream("amadeus").limiter.acquire(4)
+            response = self.client.get("/api/upstreams/")
+        self.assertEqual(response.status_code, 200)
+        status = response.json()
+        self.assertEqual(set(status), {"amadeus", "meteoblue", "geocoding", "gemini"})
+        self.assertIn(status["amadeus"]["circuit"], ("closed", "open", "half-open"))
+        self.assertEqual(status["amadeus"]["rate_limit"]["today"], 4)
+        self.assertEqual(status["gemini"]["rate_limit"]["today"], 0)
@@ -1,3 +1,122 @@
-from django.shortcuts import render
+# Description: Views of the scheduler homepage, including the JSON search endpoint backed by scripts/main.py.
+import asyncio
+import sys
 
-# Create your views here.
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+if str(settings.SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(settings.SCRIPTS_DIR))
+
+import main as pipeline
+from AccessPoints import gemini as gem
+from Tools import custom_error as ce
+from Tools import resilience
+
+pipeline.clients.creds_path = str(settings.CREDS_PATH)
+gem.set_location_cache(gem.make_location_cache(**getattr(settings, "GEMINI_LOCATION_CACHE", {})))
+
+SEARCH_PARAMS = ("origin_airport", "descriptors", "departure_date", "max_price", "adults",
+                 "return_date", "children", "infants", "trav_class", "non_stop", "flex_days")
+
+
+class SearchEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder for search results, serializing anything with a __json__ method (errors, forecasts) through it.
+    """
+
+    def default(self, o):
+        """
+        Serialize an object the default encoder can't.
+
+        :param o: The object.
+            :type o: object
+
+        :return: A JSON-serializable form of the object.
+            :rtype: object
+        """
+        if hasattr(o, "__json__"):
+            return o.__json__()
+        if isinstance(o, BaseException):
+            return f"{type(o).__name__}: {o}"
+        return super().default(o)
+
+
+def search_params(request) -> dict:
+    """
+    Read the parameters of main() from the query string.
+    Descriptors can be given comma-delimited, as repeated parameters, or both.
+
+    :param request: The request.
+        :type request: django.http.HttpRequest
+
+    :return: The parameters, None for the missing ones.
+        :rtype: dict
+    """
+    params = {name: request.GET.get(name) for name in SEARCH_PARAMS}
+    descriptors = request.GET.getlist("descriptors")
+    if len(descriptors) > 1:
+        params["descriptors"] = ",".join(descriptors)
+    return params
+
+
+def error_status(error) -> int:
+    """
+    Get the HTTP status of an error returned by main().
+
+    :param error: The error.
+        :type error: Tools.custom_error.CustomException | Tools.custom_error.MultiException
+
+    :return: 400 if the search itself was invalid, 503 if an upstream API is unavailable, 500 otherwise.
+        :rtype: int
+    """
+    errors = error.exceptions if isinstance(error, ce.MultiException) else [error]
+    if all(isinstance(excpt.error, ValueError) for excpt in errors):
+        return 400
+    if any(isinstance(excpt.error, resilience.UpstreamUnavailable) for excpt in errors):
+        return 503
+    return 500
+
+
+@require_GET
+async def search(request):
+    """
+    Search for trips, taking the parameters of main() as query parameters.
+    The pipeline runs natively async on the server's event loop, so a single process serves many searches at once,
+    and each search is cancelled once it exceeds settings.SEARCH_TIMEOUT.
+
+    :param request: The request.
+        :type request: django.http.HttpRequest
+
+    :return: The trips in the return_template.json shape, or {"error": ...} with a 4xx/5xx status.
+        :rtype: django.http.JsonResponse
+    """
+    try:
+        result = await asyncio.wait_for(pipeline.main_async(**search_params(request),
+                                                            max_workers=settings.SEARCH_MAX_WORKERS),
+                                        timeout=settings.SEARCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        error = ce.CustomException("SearchTimeoutError",
+                                   "The search took too long, please try again later",
+                                   TimeoutError(f"The search took longer than {settings.SEARCH_TIMEOUT} seconds"))
+        return JsonResponse({"error": error}, encoder=SearchEncoder, status=504)
+    if isinstance(result, (ce.CustomException, ce.MultiException)):
+        return JsonResponse({"error": result}, encoder=SearchEncoder, status=error_status(result))
+    return JsonResponse(result, encoder=SearchEncoder, safe=False)
+
+
+@require_GET
+def upstreams(request):
+    """
+    Report the health of the upstream APIs: the state of each circuit breaker and the use of each rate limit,
+    the latter shared by every worker process.
+
+    :param request: The request.
+        :type request: django.http.HttpRequest
+
+    :return: The status of each upstream, by name.
+        :rtype: django.http.JsonResponse
+    """
+    return JsonResponse(resilience.status(), encoder=SearchEncoder)
@@ -1,6 +1,199 @@
 # Description: Access point for the Amadeus API.
+import asyncio
+import codecs
+import heapq
 import json
-import requests
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from datetime import date, timedelta
+from Tools import cache
+from Tools import json_stream
+from Tools import resilience
+from Tools import singleflight
+
+TOKEN_URL = "https://test.api.amadeus.com/v1/security/oauth2/token"
+FLIGHT_OFFERS_URL = "https://test.api.amadeus.com/v2/shopping/flight-offers"
+FLIGHT_DESTINATIONS_URL = "https://test.api.amadeus.com/v1/shopping/flight-destinations"
+
+# Circuit breaker and retries shared by every call to the Amadeus API
+AMADEUS = resilience.get_upstream("amadeus")
+
+# Identical searches within OFFER_TTL are served from memory, trading a few minutes of price freshness for
+# upstream calls; OFFER_CACHE.stats() gives the hit/miss counters for tuning it
+OFFER_TTL = 5 * 60
+OFFER_CACHE = cache.LRUCache(512, OFFER_TTL, max_bytes=64 * 1024 * 1024)
+# Identical searches in flight at the same time share one upstream call
+OFFER_FLIGHTS = singleflight.SingleFlight()
+
+# The cheapest price to every destination from an origin, from one flight-destinations call
+DESTINATION_CACHE = cache.LRUCache(256, OFFER_TTL)
+DESTINATION_FLIGHTS = singleflight.SingleFlight()
+MULTI_DESTINATION_WORKERS = 8
+
+# Flexible-date searches query a (2 * flex_days + 1)^2 grid of date pairs, at most FLEX_WORKERS at once
+FLEX_MAX_DAYS = 3
+FLEX_WORKERS = 4
+# The price matrix entry of a date pair left out because it can't beat the best pair
+FLEX_PRUNED = "pruned"
+# What each price-ranked query told about its cheapest fare, whatever its maxPrice: the exact price if it found
+# offers, else a lower bound (its maxPrice). Flexible-date searches use it to skip date pairs that can't win
+FARE_CACHE = cache.LRUCache(4096, OFFER_TTL)
+_FARE_LOCK = threading.Lock()
+
+# Responses are parsed as they stream in, keeping a compact summary of only the OFFER_TOP_K best offers
+OFFER_TOP_K = 5
+OFFER_CHUNK_SIZE = 16 * 1024
+_DURATION = re.compile(r"PT(?:(\d+)H)?(?:(\d+)M)?")
+
+
+def _duration_minutes(duration):
+    """
+    Convert an ISO 8601 itinerary duration (e.g. "PT10H35M") to minutes.
+
+    :param duration: The duration.
+        :type duration: str | None
+
+    :return: The minutes, or infinity if the duration is missing or malformed.
+        :rtype: float
+    """
+    match = _DURATION.fullmatch(duration or "")
+    if match is None or not any(match.groups()):
+        return math.inf
+    return int(match.group(1) or 0) * 60 + int(match.group(2) or 0)
+
+
+# Ways to rank offer summaries, lowest score first
+OFFER_RANKS = {
+    "price": lambda offer: float(offer["price"]),
+    "stops": lambda offer: (offer["stops"], float(offer["price"])),
+    "duration": lambda offer: (_duration_minutes(offer["duration"]), float(offer["price"]))
+}
+
+
+def summarize_offer(offer):
+    """
+    Keep only what is shown of a flight offer: price, carrier, seats, the first and last segment of the
+    outbound itinerary, and the airports it stops at in between.
+
+    :param offer: A flight offer from the Amadeus API.
+        :type offer: dict
+
+    :return: The summary of the offer.
+        :rtype: dict
+    """
+    itinerary = offer["itineraries"][0]
+    segments = itinerary["segments"]
+    carriers = offer.get("validatingAirlineCodes") or [segments[0]["carrierCode"]]
+    return {
+        "price": offer["price"]["total"],
+        "currency": offer["price"].get("currency"),
+        "carrier": carriers[0],
+        "seats": offer.get("numberOfBookableSeats"),
+        "duration": itinerary.get("duration"),
+        "stops": len(segments) - 1,
+        "layovers": [segment["arrival"]["iataCode"] for segment in segments[:-1]],
+        "departure": {"at": segments[0]["departure"]["at"], "iataCode": segments[0]["departure"]["iataCode"]},
+        "arrival": {"at": segments[-1]["arrival"]["at"], "iataCode": segments[-1]["arrival"]["iataCode"]}
+    }
+
+
+class _Ranked:
+    """
+    A summarized offer in OfferSelector's heap, ordered worst first so the heap top is the one to drop.
+    """
+    __slots__ = ("score", "seq", "offer")
+
+    def __init__(self, score, seq, offer):
+        self.score = score
+        self.seq = seq
+        self.offer = offer
+
+    def __lt__(self, other):
+        return (self.score, self.seq) > (other.score, other.seq)
+
+
+class OfferSelector:
+    """
+    Picks the best offers of a flight-offers response as its body streams in.
+    Each offer is parsed on its own, summarized, and only kept if it is among the top_k so far (a bounded heap),
+    so the whole response is never held as a JSON tree.
+
+    :ivar top_k: The number of offers kept.
+        :type top_k: int
+    :ivar rank: The name of the ranking in OFFER_RANKS.
+        :type rank: str
+    :ivar count: The number of offers seen.
+        :type count: int
+    """
+
+    def __init__(self, top_k = OFFER_TOP_K, rank = "price"):
+        """
+        Initialize the OfferSelector class.
+
+        :param top_k: The number of offers kept.
+            :type top_k: int
+        :param rank: The name of the ranking in OFFER_RANKS.
+            :type rank: str
+        """
+        self.top_k = top_k
+        self.rank = rank
+        self.count = 0
+        self._score = OFFER_RANKS[rank]
+        self._heap = []
+        self._parser = json_stream.ArrayStreamParser("data")
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    @property
+    def done(self):
+        """
+        Whether the offers array has closed, so the rest of the response can be skipped.
+
+        :return: Whether it has closed.
+            :rtype: bool
+        """
+        return self._parser.done
+
+    def feed(self, chunk):
+        """
+        Parse the next chunk of the response body.
+
+        :param chunk: The next chunk.
+            :type chunk: bytes | str
+        """
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        for offer in self._parser.feed(chunk):
+            self.add(offer)
+
+    def add(self, offer):
+        """
+        Consider one offer, skipping it if it is malformed.
+
+        :param offer: A flight offer from the Amadeus API.
+            :type offer: dict
+        """
+        self.count += 1
+        try:
+            summary = summarize_offer(offer)
+            ranked = _Ranked(self._score(summary), self.count, summary)
+        except (KeyError, IndexError, TypeError, ValueError):
+            return
+        if len(self._heap) < self.top_k:
+            heapq.heappush(self._heap, ranked)
+        elif self._heap and self._heap[0] < ranked:
+            heapq.heapreplace(self._heap, ranked)
+
+    def result(self):
+        """
+        Get the offers kept, best first.
+
+        :return: The response, as {"data": [offer summaries], "meta": {"count", "rank"}}.
+            :rtype: dict
+        """
+        ranked = sorted(self._heap, reverse=True)
+        return {"data": [item.offer for item in ranked], "meta": {"count": self.count, "rank": self.rank}}
 
 
 def get_auth_token(client):
@@ -13,17 +206,78 @@ def get_auth_token(client):
     :return: The authentication token.
         :rtype: dict
     """
-    url = "https://test.api.amadeus.com/v1/security/oauth2/token"
-    data = {
+    response = AMADEUS.call(lambda: client.session.post(TOKEN_URL, headers=_token_headers(), data=_token_data(client)))
+    return json.loads(response.text)
+
+
+async def get_auth_token_async(client):
+    """
+    Async version of get_auth_token().
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+
+    :return: The authentication token.
+        :rtype: dict
+    """
+    response = await AMADEUS.call_async(
+        lambda: client.async_session.post(TOKEN_URL, headers=_token_headers(), data=_token_data(client)))
+    return json.loads(response.text)
+
+
+def _token_data(client):
+    """
+    Get the form data of a token request.
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+
+    :return: The form data.
+        :rtype: dict
+    """
+    return {
         "grant_type": "client_credentials",
         "client_id": client.key,
         "client_secret": client.secret
     }
-    headers = {
+
+
+def _token_headers():
+    """
+    Get the headers of a token request.
+
+    :return: The headers.
+        :rtype: dict
+    """
+    return {
         "Content-Type": "application/x-www-form-urlencoded"
     }
-    response = requests.post(url, headers=headers, data=data)
-    return json.loads(response.text)
+
+
+def get_access_token(client):
+    """
+    Get a cached access token for the Amadeus API, only fetching a new one when it is about to expire.
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+
+    :return: The access token.
+        :rtype: str
+    """
+    return client.tokens.get(lambda: get_auth_token(client))
+
+
+async def get_access_token_async(client):
+    """
+    Async version of get_access_token().
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+
+    :return: The access token.
+        :rtype: str
+    """
+    return await client.tokens.get_async(lambda: get_auth_token_async(client))
 
 
 def get_flight_data(client,
@@ -36,9 +290,11 @@ def get_flight_data(client,
                     children = None,
                     infants = None,
                     travelClass = None,
-                    nonStopp = None):
+                    nonStopp = None,
+                    top_k = OFFER_TOP_K,
+                    rank = "price"):
     """
-    Get flight data from the Amadeus API.
+    Get the best flight offers from the Amadeus API.
 
     :param client: Client object for the Amadeus API.
         :type client: init_clients.Auth
@@ -62,30 +318,732 @@ def get_flight_data(client,
         :type nonStopp: bool | None
     :param maxPrice: The maximum price.
         :type maxPrice: int
+    :param top_k: The number of offers to return.
+        :type top_k: int
+    :param rank: How to rank the offers, a name in OFFER_RANKS ("price", "stops" or "duration").
+        :type rank: str
+
+    :return: The top_k best offers, summarized, as {"data": [...], "meta": {...}}, or the API's errors.
+        :rtype: dict
+    """
+    data = flight_params(originLocationCode, maxPrice, departure, adults, returnDate,
+                         destinationLocationCode, children, infants, travelClass, nonStopp)
+    key = (offer_key(data), top_k, rank)
+    cached = OFFER_CACHE.get(key)
+    if cached is not None:
+        return cached
+    return OFFER_FLIGHTS.do(key, lambda: _fetch_offers(client, data, key))
+
+
+def _fetch_offers(client, data, key):
+    """
+    Fetch flight offers from the Amadeus API, selecting the best ones as the response streams in,
+    and cache them if the search succeeded.
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+    :param data: The query parameters, from flight_params().
+        :type data: dict
+    :param key: The cache key of the query: its offer_key(), top_k and rank.
+        :type key: tuple
+
+    :return: The best offers, or the API's errors.
+        :rtype: dict
+
+    :raises Tools.resilience.UpstreamUnavailable: If the Amadeus API is unavailable.
+    """
+    token = get_access_token(client)
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+    response = AMADEUS.call(lambda: client.session.get(FLIGHT_OFFERS_URL, headers=headers, params=data, stream=True))
+    if response.status_code == 401:
+        response.close()
+        client.tokens.invalidate(token)
+        headers["Authorization"] = f"Bearer {get_access_token(client)}"
+        response = AMADEUS.call(
+            lambda: client.session.get(FLIGHT_OFFERS_URL, headers=headers, params=data, stream=True))
+    with response:
+        if response.status_code != 200:
+            return response.json()
+        selector = OfferSelector(key[1], key[2])
+        for chunk in response.iter_content(OFFER_CHUNK_SIZE):
+            selector.feed(chunk)
+            if selector.done:
+                break
+    result = selector.result()
+    OFFER_CACHE.set(key, result, cache.json_size(result))
+    note_fare(data, key[2], result)
+    return result
+
+
+async def get_flight_data_async(client,
+                                originLocationCode,
+                                maxPrice,
+                                departure,
+                                adults,
+                                returnDate = None,
+                                destinationLocationCode = None,
+                                children = None,
+                                infants = None,
+                                travelClass = None,
+                                nonStopp = None,
+                                top_k = OFFER_TOP_K,
+                                rank = "price"):
+    """
+    Async version of get_flight_data(), with the same parameters.
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
 
     :return: The flight data.
         :rtype: dict
     """
-    url = "https://test.api.amadeus.com/v2/shopping/flight-offers"
+    data = flight_params(originLocationCode, maxPrice, departure, adults, returnDate,
+                         destinationLocationCode, children, infants, travelClass, nonStopp)
+    key = (offer_key(data), top_k, rank)
+    cached = OFFER_CACHE.get(key)
+    if cached is not None:
+        return cached
+    return await OFFER_FLIGHTS.do_async(key, lambda: _fetch_offers_async(client, data, key))
+
+
+async def _fetch_offers_async(client, data, key):
+    """
+    Async version of _fetch_offers().
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+    :param data: The query parameters, from flight_params().
+        :type data: dict
+    :param key: The cache key of the query: its offer_key(), top_k and rank.
+        :type key: tuple
+
+    :return: The best offers, or the API's errors.
+        :rtype: dict
+
+    :raises Tools.resilience.UpstreamUnavailable: If the Amadeus API is unavailable.
+    """
+    session = client.async_session
+    for attempt in range(2):
+        token = await get_access_token_async(client)
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+        request = session.build_request("GET", FLIGHT_OFFERS_URL, headers=headers, params=data)
+        response = await AMADEUS.call_async(lambda: session.send(request, stream=True))
+        try:
+            if response.status_code == 401 and attempt == 0:
+                client.tokens.invalidate(token)
+                continue
+            if response.status_code != 200:
+                await response.aread()
+                return response.json()
+            selector = OfferSelector(key[1], key[2])
+            async for chunk in response.aiter_bytes(OFFER_CHUNK_SIZE):
+                selector.feed(chunk)
+                if selector.done:
+                    break
+        finally:
+            await response.aclose()
+        result = selector.result()
+        OFFER_CACHE.set(key, result, cache.json_size(result))
+        note_fare(data, key[2], result)
+        return result
+
+
+def flight_params(originLocationCode,
+                  maxPrice,
+                  departure,
+                  adults,
+                  returnDate = None,
+                  destinationLocationCode = None,
+                  children = None,
+                  infants = None,
+                  travelClass = None,
+                  nonStopp = None):
+    """
+    Build the normalized query parameters of a flight-offers search, see get_flight_data() for the parameters.
+    Codes are upper-cased, counts and prices made integers and the travel class put in Amadeus' form
+    ("Premium Economy" -> "PREMIUM_ECONOMY"), so equivalent searches build identical parameters.
+
+    :return: The query parameters.
+        :rtype: dict
+    """
     data = {
-        "originLocationCode": originLocationCode,
-        "destinationLocationCode": destinationLocationCode,
+        "originLocationCode": originLocationCode.strip().upper(),
+        "destinationLocationCode": destinationLocationCode.strip().upper() if destinationLocationCode is not None else None,
         "departureDate": departure,
-        "adults": adults,
-        "maxPrice": maxPrice
+        "adults": int(adults),
+        "maxPrice": int(maxPrice)
     }
     if returnDate is not None:
         data["returnDate"] = returnDate
-    if children is not None:
-        data["children"] = children
-    if infants is not None:
-        data["infants"] = infants
+    if children:
+        data["children"] = int(children)
+    if infants:
+        data["infants"] = int(infants)
     if travelClass is not None:
-        data["travelClass"] = travelClass
+        data["travelClass"] = "_".join(travelClass.upper().split())
     if nonStopp is not None:
-        data["nonStop"] = nonStopp
-    headers = {
-        "Authorization": f"Bearer {get_auth_token(client)['access_token']}"
+        data["nonStop"] = "true" if nonStopp else "false"
+    return data
+
+
+def offer_key(params):
+    """
+    Get the offer cache key of a flight-offers search.
+
+    :param params: The query parameters, from flight_params().
+        :type params: dict
+
+    :return: The cache key.
+        :rtype: tuple
+    """
+    return tuple(sorted(params.items()))
+
+
+def fare_key(params):
+    """
+    Get the FARE_CACHE key of a flight-offers search: its offer_key() without the maxPrice.
+
+    :param params: The query parameters, from flight_params().
+        :type params: dict
+
+    :return: The cache key.
+        :rtype: tuple
+    """
+    return offer_key({name: value for name, value in params.items() if name != "maxPrice"})
+
+
+def note_fare(params, rank, result):
+    """
+    Record in FARE_CACHE what a search's result tells about the cheapest fare of its query.
+    Offers ranked by price give the exact cheapest fare; no offers only tell that it is above the maxPrice.
+
+    :param params: The query parameters, from flight_params().
+        :type params: dict
+    :param rank: How the offers were ranked.
+        :type rank: str
+    :param result: The result of the search.
+        :type result: dict
+    """
+    if rank != "price":
+        return
+    price = _cheapest(result)
+    key = fare_key(params)
+    with _FARE_LOCK:
+        known = FARE_CACHE.get(key)
+        if price is not None or known is None or known["price"] is None and known["bound"] < params["maxPrice"] \
+                or known["price"] is not None and known["price"] <= params["maxPrice"]:
+            FARE_CACHE.set(key, {"price": price, "bound": params["maxPrice"], "result": result})
+
+
+def _cheapest(result):
+    """
+    Get the price of the best offer of a search's result.
+
+    :param result: The result of get_flight_data().
+        :type result: dict
+
+    :return: The price, or None if there is no offer.
+        :rtype: float | None
+    """
+    offers = result.get("data") or []
+    try:
+        return float(offers[0]["price"]) if offers else None
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def destination_params(data):
+    """
+    Build the flight-destinations query matching a flight-offers search.
+    That endpoint prices a single adult in economy, so other searches can't be priced by it.
+
+    :param data: The flight-offers query parameters, from flight_params().
+        :type data: dict
+
+    :return: The flight-destinations query parameters, or None if the search can't be priced by it.
+        :rtype: dict | None
+    """
+    if data["adults"] != 1 or data.get("children") or data.get("infants") or data.get("travelClass", "ECONOMY") != "ECONOMY":
+        return None
+    params = {
+        "origin": data["originLocationCode"],
+        "departureDate": data["departureDate"],
+        "maxPrice": data["maxPrice"],
+        "viewBy": "DESTINATION"
+    }
+    if "returnDate" in data:
+        params["duration"] = (date.fromisoformat(data["returnDate"]) - date.fromisoformat(data["departureDate"])).days
+    else:
+        params["oneWay"] = "true"
+    if "nonStop" in data:
+        params["nonStop"] = data["nonStop"]
+    return params
+
+
+def destination_result(entry, currency):
+    """
+    Turn a flight-destinations entry into the shape of get_flight_data()'s result, with a single priced summary.
+    The endpoint only gives the price and dates, so the carrier, seats, duration, stops and layovers are None.
+
+    :param entry: A flight-destinations entry.
+        :type entry: dict
+    :param currency: The currency of the response.
+        :type currency: str | None
+
+    :return: The result, as {"data": [summary], "meta": {...}}.
+        :rtype: dict
+    """
+    return {
+        "data": [{
+            "price": entry["price"]["total"],
+            "currency": currency,
+            "carrier": None,
+            "seats": None,
+            "duration": None,
+            "stops": None,
+            "layovers": None,
+            "departure": {"at": entry.get("departureDate"), "iataCode": entry["origin"]},
+            "arrival": {"at": None, "iataCode": entry["destination"]}
+        }],
+        "meta": {"count": 1, "source": "flight-destinations", "returnDate": entry.get("returnDate")}
     }
-    response = requests.get(url, headers=headers, params=data)
-    return response.json()
\ No newline at end of file
+
+
+def get_destination_prices(client, params):
+    """
+    Get the cheapest price to every destination reachable from an origin, in one call to flight-destinations.
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+    :param params: The query parameters, from destination_params().
+        :type params: dict
+
+    :return: The result of each destination, by IATA code, empty if the origin isn't covered.
+        :rtype: dict[str, dict]
+    """
+    key = tuple(sorted(params.items()))
+    cached = DESTINATION_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    def fetch():
+        token = get_access_token(client)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = AMADEUS.call(lambda: client.session.get(FLIGHT_DESTINATIONS_URL, headers=headers, params=params))
+        if response.status_code == 401:
+            client.tokens.invalidate(token)
+            headers["Authorization"] = f"Bearer {get_access_token(client)}"
+            response = AMADEUS.call(
+                lambda: client.session.get(FLIGHT_DESTINATIONS_URL, headers=headers, params=params))
+        return _destination_prices(key, response.status_code, response.json())
+
+    return DESTINATION_FLIGHTS.do(key, fetch)
+
+
+async def get_destination_prices_async(client, params):
+    """
+    Async version of get_destination_prices().
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+    :param params: The query parameters, from destination_params().
+        :type params: dict
+
+    :return: The result of each destination, by IATA code, empty if the origin isn't covered.
+        :rtype: dict[str, dict]
+    """
+    key = tuple(sorted(params.items()))
+    cached = DESTINATION_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        token = await get_access_token_async(client)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = await AMADEUS.call_async(
+            lambda: client.async_session.get(FLIGHT_DESTINATIONS_URL, headers=headers, params=params))
+        if response.status_code == 401:
+            client.tokens.invalidate(token)
+            headers["Authorization"] = f"Bearer {await get_access_token_async(client)}"
+            response = await AMADEUS.call_async(
+                lambda: client.async_session.get(FLIGHT_DESTINATIONS_URL, headers=headers, params=params))
+        return _destination_prices(key, response.status_code, response.json())
+
+    return await DESTINATION_FLIGHTS.do_async(key, fetch)
+
+
+def _destination_prices(key, status_code, body):
+    """
+    Demultiplex a flight-destinations response by destination, and cache it.
+    A rejected query (e.g. an origin the endpoint doesn't cover) is cached as an empty price map too, so for
+    OFFER_TTL its destinations go straight to the flight-offers fallback instead of asking again.
+
+    :param key: The cache key of the query.
+        :type key: tuple
+    :param status_code: The HTTP status of the response.
+        :type status_code: int
+    :param body: The response body.
+        :type body: dict
+
+    :return: The result of each destination, by IATA code.
+        :rtype: dict[str, dict]
+    """
+    prices = {}
+    if status_code != 200 or not isinstance(body, dict) or "errors" in body:
+        DESTINATION_CACHE.set(key, prices)
+        return prices
+    currency = body.get("meta", {}).get("currency")
+    for entry in body.get("data", []):
+        try:
+            prices[entry["destination"].upper()] = destination_result(entry, currency)
+        except (KeyError, AttributeError, TypeError):
+            continue
+    DESTINATION_CACHE.set(key, prices)
+    return prices
+
+
+def get_multi_flight_data(client,
+                          destinations,
+                          originLocationCode,
+                          maxPrice,
+                          departure,
+                          adults,
+                          returnDate = None,
+                          children = None,
+                          infants = None,
+                          travelClass = None,
+                          nonStopp = None,
+                          max_workers = MULTI_DESTINATION_WORKERS):
+    """
+    Price several destinations from one origin in as few calls as possible.
+    One flight-destinations call prices every destination it covers. The rest (or all of them, if the search has
+    more than one traveler or a premium class) fall back to a flight-offers search each, at most max_workers at once.
+    A POST flight-offers with several originDestinations isn't used: it prices a single multi-city itinerary,
+    not independent trips. See get_flight_data() for the search parameters.
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+    :param destinations: The IATA codes of the destinations.
+        :type destinations: list[str]
+    :param max_workers: The maximum number of fallback searches made at once.
+        :type max_workers: int
+
+    :return: The result of each destination, by the code given: a flight-destinations price, or get_flight_data()'s result.
+        :rtype: dict[str, dict]
+    """
+    data = flight_params(originLocationCode, maxPrice, departure, adults, returnDate,
+                         None, children, infants, travelClass, nonStopp)
+    params = destination_params(data)
+    prices = get_destination_prices(client, params) if params is not None else {}
+    results = {code: prices[code.strip().upper()] for code in destinations if code.strip().upper() in prices}
+    missing = list(dict.fromkeys(code for code in destinations if code not in results))
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as executor:
+            fallbacks = executor.map(lambda code: get_flight_data(client, originLocationCode, maxPrice, departure, adults,
+                                                                  returnDate, code, children, infants, travelClass,
+                                                                  nonStopp), missing)
+            results.update(zip(missing, fallbacks))
+    return results
+
+
+async def get_multi_flight_data_async(client,
+                                      destinations,
+                                      originLocationCode,
+                                      maxPrice,
+                                      departure,
+                                      adults,
+                                      returnDate = None,
+                                      children = None,
+                                      infants = None,
+                                      travelClass = None,
+                                      nonStopp = None,
+                                      max_workers = MULTI_DESTINATION_WORKERS):
+    """
+    Async version of get_multi_flight_data(), with the same parameters.
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+
+    :return: The result of each destination, by the code given.
+        :rtype: dict[str, dict]
+    """
+    data = flight_params(originLocationCode, maxPrice, departure, adults, returnDate,
+                         None, children, infants, travelClass, nonStopp)
+    params = destination_params(data)
+    prices = await get_destination_prices_async(client, params) if params is not None else {}
+    results = {code: prices[code.strip().upper()] for code in destinations if code.strip().upper() in prices}
+    missing = list(dict.fromkeys(code for code in destinations if code not in results))
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def fallback(code):
+        async with semaphore:
+            return await get_flight_data_async(client, originLocationCode, maxPrice, departure, adults,
+                                               returnDate, code, children, infants, travelClass, nonStopp)
+
+    results.update(zip(missing, await asyncio.gather(*(fallback(code) for code in missing))))
+    return results
+
+
+def flex_grid(departure, returnDate = None, flex_days = 1, today = None):
+    """
+    Get the date pairs of a flexible-date search, nearest to the requested dates first.
+    Pairs departing before tomorrow, or returning on or before their departure, are left out.
+
+    :param departure: The requested departure date, as YYYY-MM-DD.
+        :type departure: str
+    :param returnDate: The requested return date, as YYYY-MM-DD, or None for one-way.
+        :type returnDate: str | None
+    :param flex_days: How many days either side of each date to search.
+        :type flex_days: int
+    :param today: The current date, date.today() if None.
+        :type today: date | None
+
+    :return: The departure dates, the return dates ([None] for one-way), and the pairs to search as
+        (departure index, return index) in search order.
+        :rtype: tuple[list[str], list[str | None], list[tuple[int, int]]]
+    """
+    today = today if today is not None else date.today()
+    offsets = range(-flex_days, flex_days + 1)
+    start = date.fromisoformat(departure)
+    departures = [start + timedelta(days=offset) for offset in offsets]
+    if returnDate is None:
+        returns = [None]
+    else:
+        end = date.fromisoformat(returnDate)
+        returns = [end + timedelta(days=offset) for offset in offsets]
+    cells = [(i, j) for i, dep in enumerate(departures) for j, ret in enumerate(returns)
+             if dep > today and (ret is None or ret > dep)]
+    center = flex_days
+    cells.sort(key=lambda cell: (abs(cell[0] - center) + abs(cell[1] - center if returnDate is not None else 0),
+                                 abs(cell[0] - center)))
+    return ([dep.isoformat() for dep in departures],
+            [ret.isoformat() if ret is not None else None for ret in returns],
+            cells)
+
+
+class _FlexSearch:
+    """
+    The shared state of a flexible-date search: the price matrix and the best cell so far.
+    """
+
+    def __init__(self, args, departures, returns):
+        """
+        Initialize the _FlexSearch class.
+
+        :param args: The arguments of the search, as given to get_flex_flight_data() after the client.
+            :type args: tuple
+        :param departures: The departure dates of the grid.
+            :type departures: list[str]
+        :param returns: The return dates of the grid ([None] for one-way).
+            :type returns: list[str | None]
+        """
+        self.args = args
+        self.departures = departures
+        self.returns = returns
+        self.maxPrice = int(args[1])
+        self.prices = [[None] * len(returns) for _ in departures]
+        self.best = None
+        self.queries = 0
+        self.cached = 0
+        self.pruned = 0
+        self._lock = threading.Lock()
+
+    def cell_args(self, cell, maxPrice):
+        """
+        Get the get_flight_data() arguments of a cell.
+
+        :param cell: The (departure index, return index) of the cell.
+            :type cell: tuple[int, int]
+        :param maxPrice: The maximum price of the query.
+            :type maxPrice: int
+
+        :return: The arguments, after the client.
+            :rtype: tuple
+        """
+        args = self.args
+        return (args[0], maxPrice, self.departures[cell[0]], args[3], self.returns[cell[1]]) + tuple(args[5:])
+
+    def start_query(self):
+        """
+        Count a query and get its maxPrice: the best price so far (rounded up) or the search's own maximum, so
+        Amadeus only returns offers that could beat the best and cells that can't are answered with no offers.
+
+        :return: The maximum price.
+            :rtype: int
+        """
+        with self._lock:
+            self.queries += 1
+            if self.best is None:
+                return self.maxPrice
+            return min(self.maxPrice, math.ceil(self.best["price"]))
+
+    def settle(self, cell):
+        """
+        Settle a cell from FARE_CACHE if possible, i.e. if an earlier search (at any maxPrice) tells its cheapest
+        fare, or tells that it is above the search's maximum price or the best price so far.
+
+        :param cell: The (departure index, return index) of the cell.
+            :type cell: tuple[int, int]
+
+        :return: Whether the cell was settled, otherwise it must be queried.
+            :rtype: bool
+        """
+        fare = FARE_CACHE.get(fare_key(flight_params(*self.cell_args(cell, self.maxPrice))))
+        if fare is None:
+            return False
+        if fare["price"] is not None:
+            self.cached += 1
+            if fare["price"] > self.maxPrice:
+                self.record(cell, {"data": []})
+            else:
+                # The offers were fetched with another maxPrice, keep those within this one
+                offers = [offer for offer in fare["result"]["data"] if float(offer["price"]) <= self.maxPrice]
+                self.record(cell, {"data": offers, "meta": dict(fare["result"].get("meta", {}), count=len(offers))})
+            return True
+        if fare["bound"] >= self.maxPrice:
+            self.cached += 1
+            self.record(cell, {"data": []})
+            return True
+        with self._lock:
+            if self.best is None or fare["bound"] < self.best["price"]:
+                return False
+            self.prices[cell[0]][cell[1]] = FLEX_PRUNED
+            self.pruned += 1
+        return True
+
+    def record(self, cell, result, bound = None):
+        """
+        Record the result of a cell.
+
+        :param cell: The (departure index, return index) of the cell.
+            :type cell: tuple[int, int]
+        :param result: The result of get_flight_data() for the cell.
+            :type result: dict
+        :param bound: The maxPrice the cell was queried with, None if it wasn't queried.
+            :type bound: int | None
+        """
+        price = _cheapest(result)
+        i, j = cell
+        with self._lock:
+            if price is None and bound is not None and bound < self.maxPrice and "errors" not in result \
+                    and isinstance(result.get("data"), list):
+                # No offer under the best price at the time, so the cell couldn't win (an error tells nothing)
+                self.prices[i][j] = FLEX_PRUNED
+                self.pruned += 1
+                return
+            self.prices[i][j] = price
+            if price is not None and (self.best is None or price < self.best["price"]):
+                self.best = {"departure": self.departures[i], "return": self.returns[j], "price": price,
+                             "result": result}
+
+    def result(self, cells):
+        """
+        Get the result of the search.
+
+        :param cells: The cells searched.
+            :type cells: list[tuple[int, int]]
+
+        :return: The search result, see get_flex_flight_data().
+            :rtype: dict
+        """
+        return {"best": self.best,
+                "departures": self.departures,
+                "returns": self.returns,
+                "prices": self.prices,
+                "meta": {"cells": len(cells), "queries": self.queries, "cached": self.cached, "pruned": self.pruned}}
+
+
+def get_flex_flight_data(client,
+                         originLocationCode,
+                         maxPrice,
+                         departure,
+                         adults,
+                         returnDate = None,
+                         destinationLocationCode = None,
+                         children = None,
+                         infants = None,
+                         travelClass = None,
+                         nonStopp = None,
+                         flex_days = 1,
+                         max_workers = FLEX_WORKERS):
+    """
+    Search every departure/return date pair within flex_days of the requested dates, for the cheapest one.
+    The pairs nearest the requested dates are searched first, at most max_workers at once. Pairs whose cheapest fare
+    an earlier search already told (FARE_CACHE, at any maxPrice) aren't queried, nor are pairs known to cost more
+    than the best price found so far. The other pairs are queried with their maxPrice lowered to the best price so
+    far, so those that can't beat it come back empty. See get_flight_data() for the search parameters.
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+    :param flex_days: How many days either side of each date to search, at most FLEX_MAX_DAYS.
+        :type flex_days: int
+    :param max_workers: The maximum number of queries made at once.
+        :type max_workers: int
+
+    :return: {"best": {"departure", "return", "price", "result"} or None, "departures": [...], "returns": [...],
+        "prices": [[price per return date] per departure date], "meta": {"cells", "queries", "cached", "pruned"}},
+        where "result" is get_flight_data()'s result for the best pair. A price is the pair's cheapest fare,
+        FLEX_PRUNED if the pair was found not to beat the best pair, or None if the pair has no offer within maxPrice
+        (or isn't a valid pair of dates).
+        :rtype: dict
+    """
+    args = (originLocationCode, maxPrice, departure, adults, returnDate, destinationLocationCode,
+            children, infants, travelClass, nonStopp)
+    departures, returns, cells = flex_grid(departure, returnDate, min(int(flex_days), FLEX_MAX_DAYS))
+    search = _FlexSearch(args, departures, returns)
+
+    def price(cell):
+        if search.settle(cell):
+            return
+        bound = search.start_query()
+        search.record(cell, get_flight_data(client, *search.cell_args(cell, bound)), bound)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(cells) or 1))) as executor:
+        list(executor.map(price, cells))
+    return search.result(cells)
+
+
+async def get_flex_flight_data_async(client,
+                                     originLocationCode,
+                                     maxPrice,
+                                     departure,
+                                     adults,
+                                     returnDate = None,
+                                     destinationLocationCode = None,
+                                     children = None,
+                                     infants = None,
+                                     travelClass = None,
+                                     nonStopp = None,
+                                     flex_days = 1,
+                                     max_workers = FLEX_WORKERS):
+    """
+    Async version of get_flex_flight_data(), with the same parameters.
+
+    :param client: Client object for the Amadeus API.
+        :type client: init_clients.Auth
+
+    :return: The search result, see get_flex_flight_data().
+        :rtype: dict
+    """
+    args = (originLocationCode, maxPrice, departure, adults, returnDate, destinationLocationCode,
+            children, infants, travelClass, nonStopp)
+    departures, returns, cells = flex_grid(departure, returnDate, min(int(flex_days), FLEX_MAX_DAYS))
+    search = _FlexSearch(args, departures, returns)
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def price(cell):
+        if search.settle(cell):
+            return
+        async with semaphore:
+            # The best price may have dropped while waiting for a slot
+            if search.settle(cell):
+                return
+            bound = search.start_query()
+            search.record(cell, await get_flight_data_async(client, *search.cell_args(cell, bound)), bound)
+
+    await asyncio.gather(*(price(cell) for cell in cells))
+    return search.result(cells)
@@ -1,54 +1,208 @@
 # Description: Access point for the Gemini Flash 2.0 Model API.
-from google.genai import types
-from pydantic import BaseModel
+import functools
+import itertools
 import json
+import os
+from Tools import cache
+from Tools import json_stream
+from Tools import resilience
+from Tools import singleflight
+
+# Suggestions are cached on the normalized search intent, by default in memory for LOCATION_TTL seconds.
+# The GEMINI_LOCATION_CACHE ("memory", "disk" or "tiered"), GEMINI_LOCATION_TTL and GEMINI_LOCATION_CACHE_SIZE
+# environment variables change that, and set_location_cache() replaces the cache altogether
+LOCATION_TTL = 6 * 60 * 60
+LOCATION_CACHE_SIZE = 1024
+LOCATION_CACHE_BACKENDS = ("memory", "disk", "tiered")
+
+
+def make_location_cache(backend: str | None = None, ttl: float | None = None, size: int | None = None):
+    """
+    Build a cache for trip suggestions. Missing settings are read from the environment, then the defaults.
+
+    :param backend: "memory" (an LRUCache in this process), "disk" (an SQLiteCache shared by the processes of
+        the machine) or "tiered" (the LRUCache in front of the SQLiteCache).
+        :type backend: str | None
+    :param ttl: How long suggestions are kept, in seconds.
+        :type ttl: float | None
+    :param size: The maximum number of suggestions kept in memory.
+        :type size: int | None
+
+    :return: The cache.
+        :rtype: Tools.cache.LRUCache | Tools.cache.SQLiteCache | Tools.cache.TieredCache
+
+    :raises ValueError: If the backend is unknown or the TTL or size isn't a number.
+    """
+    backend = backend if backend is not None else os.environ.get("GEMINI_LOCATION_CACHE", "memory")
+    ttl = float(ttl if ttl is not None else os.environ.get("GEMINI_LOCATION_TTL", LOCATION_TTL))
+    size = int(size if size is not None else os.environ.get("GEMINI_LOCATION_CACHE_SIZE", LOCATION_CACHE_SIZE))
+    if backend not in LOCATION_CACHE_BACKENDS:
+        raise ValueError(f"Unknown location cache {backend!r}, expected one of {LOCATION_CACHE_BACKENDS}")
+    memory = cache.LRUCache(size, ttl) if backend != "disk" else None
+    disk = cache.SQLiteCache(cache.CACHE_PATH, "gemini", ttl) if backend != "memory" else None
+    if memory is not None and disk is not None:
+        return cache.TieredCache(memory, disk)
+    return memory if memory is not None else disk
+
+
+def set_location_cache(location_cache):
+    """
+    Replace the cache of trip suggestions.
+
+    :param location_cache: The new cache, anything with get(key), set(key, value) and clear() like the caches of
+        Tools.cache. Keys are strings and values JSON-serializable.
+        :type location_cache: Tools.cache.LRUCache | Tools.cache.SQLiteCache | Tools.cache.TieredCache
+    """
+    global LOCATION_CACHE
+    LOCATION_CACHE = location_cache
+
+
+LOCATION_CACHE = make_location_cache()
+# Concurrent requests with the same key share one generation
+LOCATION_FLIGHTS = singleflight.SingleFlight()
+# Circuit breaker and retries of the Gemini API
+GEMINI = resilience.get_upstream("gemini")
+
+
+@functools.cache
+def _models():
+    """
+    Build the structured-output models, importing pydantic only the first time they are needed.
+
+    :return: The models, by name.
+        :rtype: dict[str, type]
+    """
+    from pydantic import BaseModel
+
+    class Location(BaseModel):
+        """
+        A location
+        Used for Gemini Structured Output.
+
+        :ivar city: The city of the location.
+            :type city: str
+        :ivar state: The state of the location.
+            :type state: str
+        :ivar country: The country of the location.
+            :type country: str
+        :ivar description: A short description of the location.
+            :type description: str
+        :ivar activities: A list of activities that can be done at the location.
+            :type activities: list[str]
+        :ivar warnings: A list of cons/warnings about the location.
+            :type warnings: list[str] | None
+        :ivar culture: str - A short description of the cultural norms of the location.
+            :type culture: str
+        :ivar history: A short description of the historical significance of the location.
+            :type history: str
+        """
+        city: str
+        state: str
+        country: str
+        description: str
+        activities: list[str]
+        warnings: list[str] | None
+        culture: str
+        history: str
+
+    class Trip(BaseModel):
+        """
+        A trip that can be taken.
+        Used for Gemini Structured Output.
+
+        :ivar location: The location of the trip.
+            :type location: Location
+        :ivar destination_airport: The name of the airport to land at.
+            :type destination_airport: str
+        :ivar price: The total price of the trip.
+            :type price: int
+        """
+        location: Location
+        destination_airport: str
+        price: int
+
+    return {"Location": Location, "Trip": Trip}
+
+
+def __getattr__(name):
+    """
+    Resolve Location and Trip lazily, so importing this module doesn't import pydantic.
+
+    :param name: The attribute name.
+        :type name: str
+
+    :return: The model.
+        :rtype: type
+    """
+    if name in ("Location", "Trip"):
+        return _models()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+SYSTEM_INSTRUCTION = "\n".join([
+    "You are a travel assistant that is trying to find the best places for a user to go based on some info.",
+    "",
+    "You get data in json dict format, like this"
+    "{",
+    "   'max_price': int,",
+    "   'origin_airport': str,",
+    "   'descriptors': list[str]",
+    "}.",
+    "Max price is the maximum price the user is willing to pay for the trip, origin_airport is the full name of the airport the user is starting from, and descriptors is a list of strings that describe the trip the user wants to take.",
+    "Your goal is to take this information and plan out the best trip for the user.",
+    "",
+    "You need to return a list of trips (one is okay though), and for each you need:",
+    "   the location with:",
+    "       city",
+    "       state (Optional, return None if there is none)",
+    "       country",
+    "       a short description of the location (general vibe, what's there, etc.)",
+    "       a list of activities that can be done there",
+    "       any cons/warnings about the place (safety, accessibility, etc.)",
+    "       a short description of the cultural norms of the place",
+    "       a short description of the historical significance of the place",
+    "   the full english name of the airport to land at, not IATA code",
+    "   a guestimated total price of the trip, including all the necessary things they might have to pay for (round tickets, hotels, food). For the price, aim for a bit below the maximum to leave some wiggle-room for bad-pricing, etc."
+])
+
+
+def _config():
+    """
+    Get the generation config for trip suggestions.
+
+    :return: The generation config.
+        :rtype: google.genai.types.GenerateContentConfig
+    """
+    from google.genai import types
+    return types.GenerateContentConfig(response_mime_type="application/json",
+                                       response_schema=list[_models()["Trip"]],
+                                       system_instruction=SYSTEM_INSTRUCTION)
+
+
+def location_key(data: str) -> str:
+    """
+    Get the cache key of a get_location request: the descriptors sorted, lower-cased and de-duplicated,
+    the origin airport lower-cased and the maximum price as an integer. The price is kept exact, since trips
+    suggested for a higher budget can cost more than a lower one allows.
+
+    :param data: The data sent to the Gemini model.
+        :type data: str
+
+    :return: The cache key.
+        :rtype: str
+    """
+    try:
+        request = json.loads(data)
+        descriptors = {" ".join(desc.casefold().split()) for desc in request["descriptors"]}
+        key = {
+            "origin_airport": " ".join(str(request["origin_airport"]).casefold().split()),
+            "max_price": int(request["max_price"]),
+            "descriptors": sorted(desc for desc in descriptors if desc)
+        }
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return data
+    return json.dumps(key, sort_keys=True)
 
-class Location(BaseModel):
-    """
-    A location
-    Used for Gemini Structured Output.
-
-    :ivar city: The city of the location.
-        :type city: str
-    :ivar state: The state of the location.
-        :type state: str
-    :ivar country: The country of the location.
-        :type country: str
-    :ivar description: A short description of the location.
-        :type description: str
-    :ivar activities: A list of activities that can be done at the location.
-        :type activities: list[str]
-    :ivar warnings: A list of cons/warnings about the location.
-        :type warnings: list[str] | None
-    :ivar culture: str - A short description of the cultural norms of the location.
-        :type culture: str
-    :ivar history: A short description of the historical significance of the location.
-        :type history: str
-    """
-    city: str
-    state: str
-    country: str
-    description: str
-    activities: list[str]
-    warnings: list[str] | None
-    culture: str
-    history: str
-
-class Trip(BaseModel):
-    """
-    A trip that can be taken.
-    Used for Gemini Structured Output.
-
-    :ivar location: The location of the trip.
-        :type location: Location
-    :ivar destination_airport: The name of the airport to land at.
-        :type destination_airport: str
-    :ivar price: The total price of the trip.
-        :type price: int
-    """
-    location: Location
-    destination_airport: str
-    price: int
 
 def get_location(client, data: str):
     """
@@ -62,38 +216,156 @@ def get_location(client, data: str):
     :return: A list of trips that can be taken.
         :rtype: list[Trip]
     """
+    key = location_key(data)
+    trips = LOCATION_CACHE.get(key)
+    if trips is not None:
+        return trips
+
+    def generate():
+        response = GEMINI.call(lambda: client.client.models.generate_content(
+            model='gemini-2.0-flash',
+            contents=[data],
+            config=_config()
+        ))
+        trips = json.loads(response.text)
+        if trips:
+            LOCATION_CACHE.set(key, trips)
+        return trips
 
-    sys_instruct = "\n".join([
-        "You are a travel assistant that is trying to find the best places for a user to go based on some info.",
-        "",
-        "You get data in json dict format, like this"
-        "{",
-        "   'max_price': int,",
-        "   'origin_airport': str,",
-        "   'descriptors': list[str]",
-        "}.",
-        "Max price is the maximum price the user is willing to pay for the trip, origin_airport is the full name of the airport the user is starting from, and descriptors is a list of strings that describe the trip the user wants to take.",
-        "Your goal is to take this information and plan out the best trip for the user.",
-        "",
-        "You need to return a list of trips (one is okay though), and for each you need:",
-        "   the location with:",
-        "       city",
-        "       state (Optional, return None if there is none)",
-        "       country",
-        "       a short description of the location (general vibe, what's there, etc.)",
-        "       a list of activities that can be done there",
-        "       any cons/warnings about the place (safety, accessibility, etc.)",
-        "       a short description of the cultural norms of the place",
-        "       a short description of the historical significance of the place",
-        "   the full english name of the airport to land at, not IATA code",
-        "   a guestimated total price of the trip, including all the necessary things they might have to pay for (round tickets, hotels, food). For the price, aim for a bit below the maximum to leave some wiggle-room for bad-pricing, etc."
-    ])
-    response = client.client.models.generate_content(
+    return LOCATION_FLIGHTS.do(key, generate)
+
+
+def stream_locations(client, data: str):
+    """
+    Stream the trips from the Gemini model, yielding each trip as soon as its JSON object closes,
+    so work on the first trips can start while the rest are still being generated.
+
+    :param client: Client object for the Gemini API.
+        :type client: client init_clients.Auth
+    :param data: The data to send to the Gemini model.
+        :type data: str
+
+    :return: The trips that can be taken, one at a time.
+        :rtype: Iterator[Trip]
+    """
+    key = location_key(data)
+    trips = LOCATION_CACHE.get(key)
+    if trips is not None:
+        yield from trips
+        return
+    parser = json_stream.ArrayStreamParser()
+    trips = []
+    first, stream = GEMINI.call(lambda: _open_stream(client, data))
+    for chunk in itertools.chain([first] if first is not None else [], stream):
+        for trip in parser.feed(chunk.text or ""):
+            trips.append(trip)
+            yield trip
+    if trips:
+        LOCATION_CACHE.set(key, trips)
+
+
+async def stream_locations_async(client, data: str):
+    """
+    Async version of stream_locations(), using the genai async client.
+
+    :param client: Client object for the Gemini API.
+        :type client: client init_clients.Auth
+    :param data: The data to send to the Gemini model.
+        :type data: str
+
+    :return: The trips that can be taken, one at a time.
+        :rtype: AsyncIterator[Trip]
+    """
+    key = location_key(data)
+    trips = LOCATION_CACHE.get(key)
+    if trips is not None:
+        for trip in trips:
+            yield trip
+        return
+    parser = json_stream.ArrayStreamParser()
+    trips = []
+    first, stream = await GEMINI.call_async(lambda: _open_stream_async(client, data))
+    if first is not None:
+        for trip in parser.feed(first.text or ""):
+            trips.append(trip)
+            yield trip
+    async for chunk in stream:
+        for trip in parser.feed(chunk.text or ""):
+            trips.append(trip)
+            yield trip
+    if trips:
+        LOCATION_CACHE.set(key, trips)
+
+
+def _open_stream(client, data: str):
+    """
+    Start a generation stream and wait for its first chunk.
+    The SDK only sends the request once the stream is iterated, so this is what actually calls the API
+    (and what GEMINI retries and rate limits).
+
+    :param client: Client object for the Gemini API.
+        :type client: client init_clients.Auth
+    :param data: The data to send to the Gemini model.
+        :type data: str
+
+    :return: The first chunk (None if the stream is empty), and the rest of the stream.
+        :rtype: tuple[GenerateContentResponse | None, Iterator[GenerateContentResponse]]
+    """
+    stream = client.client.models.generate_content_stream(
         model='gemini-2.0-flash',
         contents=[data],
-        config=types.GenerateContentConfig(response_mime_type="application/json",
-                                           response_schema=list[Trip],
-                                           system_instruction=sys_instruct)
+        config=_config()
     )
+    return next(stream, None), stream
+
+
+async def _open_stream_async(client, data: str):
+    """
+    Async version of _open_stream(), using the genai async client.
+
+    :param client: Client object for the Gemini API.
+        :type client: client init_clients.Auth
+    :param data: The data to send to the Gemini model.
+        :type data: str
+
+    :return: The first chunk (None if the stream is empty), and the rest of the stream.
+        :rtype: tuple[GenerateContentResponse | None, AsyncIterator[GenerateContentResponse]]
+    """
+    stream = await client.client.aio.models.generate_content_stream(
+        model='gemini-2.0-flash',
+        contents=[data],
+        config=_config()
+    )
+    return await anext(stream, None), stream
+
+
+async def get_location_async(client, data: str):
+    """
+    Async version of get_location(), using the genai async client.
+
+    :param client: Client object for the Gemini API.
+        :type client: client init_clients.Auth
+    :param data: The data to send to the Gemini model.
+        :type data: str
+
+    :return: A list of trips that can be taken.
+        :rtype: list[Trip]
+    """
+    key = location_key(data)
+    trips = LOCATION_CACHE.get(key)
+    if trips is not None:
+        return trips
+
+    async def generate():
+        response = await GEMINI.call_async(lambda: client.client.aio.models.generate_content(
+            model='gemini-2.0-flash',
+            contents=[data],
+            config=_config()
+        ))
+        trips = json.loads(response.text)
+        if trips:
+            LOCATION_CACHE.set(key, trips)
+        return trips
+
+    return await LOCATION_FLIGHTS.do_async(key, generate)
 
-    return json.loads(response.text)
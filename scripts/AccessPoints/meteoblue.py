@@ -1,15 +1,366 @@
-import requests
-import json
-from urllib.parse import quote_plus
+from urllib.parse import quote_plus, urlencode
+from Tools import cache
+from Tools import resilience
+from Tools import singleflight
 
+GEOCODE_TTL = 90 * 24 * 60 * 60
+GEOCODE_CACHE = cache.TieredCache(cache.LRUCache(4096, GEOCODE_TTL),
+                                  cache.SQLiteCache(cache.CACHE_PATH, "geocode", GEOCODE_TTL))
+
+# Forecasts are cached per grid cell: meteoblue's models update a few times a day, so a cell's
+# forecast is fresh for FORECAST_TTL and can be served stale for FORECAST_STALE_TTL while it refreshes
+FORECAST_GRID = 0.1
+FORECAST_UNITS = {"temperature": "F", "windspeed": "mph", "precipitationamount": "inch"}
+FORECAST_TTL = 3 * 60 * 60
+FORECAST_STALE_TTL = 3 * 60 * 60
+FORECAST_CACHE = cache.LRUCache(2048, FORECAST_TTL, FORECAST_STALE_TTL)
+
+# Concurrent lookups of the same place or forecast cell share one upstream call
+GEOCODE_FLIGHTS = singleflight.SingleFlight()
+FORECAST_FLIGHTS = singleflight.SingleFlight()
+# Circuit breakers and retries of the two APIs, so a slow or failing one fails fast instead of holding up searches
+GEOCODING = resilience.get_upstream("geocoding")
+METEOBLUE = resilience.get_upstream("meteoblue")
+
+
+class Forecast(dict):
+    """
+    A daily forecast kept in meteoblue's columnar layout (one array per variable, as in "data_day").
+    It is a dict holding its own JSON form, {"days", "dates", group: {field: [value per day]}}, which refers to
+    meteoblue's arrays instead of copying them, so json.dumps() and any other encoder take it as it is.
+    Indexing it with a day number gives that day, e.g. forecast[0]["real_temp"]["min"], and nothing is built
+    per day unless a day is actually looked at. It covers however many days the package returned.
+
+    :ivar columns: The "data_day" section of the meteoblue response.
+        :type columns: dict[str, list]
+    :ivar days: The number of days.
+        :type days: int
+    """
+
+    # Field groups of a day, as {group: {field: meteoblue column}}
+    FIELDS = {
+        "real_temp": {"min": "temperature_min", "mean": "temperature_mean", "max": "temperature_max"},
+        "felt_temp": {"min": "felttemperature_min", "mean": "felttemperature_mean", "max": "felttemperature_max"},
+        "wind_speed": {"min": "windspeed_min", "mean": "windspeed_mean", "max": "windspeed_max"},
+        "precipitation": {"probability": "precipitation_probability", "amount": "precipitation"}
+    }
+
+    __slots__ = ("columns", "days")
+
+    def __init__(self, columns: dict):
+        """
+        Initialize the Forecast class.
+
+        :param columns: The "data_day" section of the meteoblue response.
+            :type columns: dict[str, list]
+        """
+        self.columns = columns
+        self.days = min(len(columns[column]) for fields in self.FIELDS.values() for column in fields.values())
+        super().__init__(days=self.days, dates=columns.get("time", [])[:self.days],
+                         **{group: {name: self._column(column) for name, column in fields.items()}
+                            for group, fields in self.FIELDS.items()})
+
+    def __getitem__(self, key):
+        """
+        Get a day of the forecast, a slice of days, or an entry of the JSON form.
+
+        :param key: The index of the day, a slice of days, or a key of the JSON form ("days", "dates" or a group).
+            :type key: int | slice | str
+
+        :return: The day, a list of days for a slice, or the entry.
+            :rtype: ForecastDay | list[ForecastDay] | Any
+        """
+        if isinstance(key, slice):
+            return [ForecastDay(self, i) for i in range(*key.indices(self.days))]
+        if not isinstance(key, int) or isinstance(key, bool):
+            return super().__getitem__(key)
+        day = key + self.days if key < 0 else key
+        if not 0 <= day < self.days:
+            raise IndexError("Forecast day out of range")
+        return ForecastDay(self, day)
+
+    @property
+    def dates(self) -> list:
+        """
+        The dates of the days, as meteoblue gives them (empty if the response had no "time" column).
+
+        :return: The dates.
+            :rtype: list[str]
+        """
+        return super().__getitem__("dates")
+
+    def __json__(self):
+        """
+        Return the forecast as a json object, one array per field.
+
+        :return: The forecast as {"days", "dates", group: {field: [value per day]}}.
+            :rtype: dict
+        """
+        return dict(self)
+
+    def _column(self, column: str) -> list:
+        """
+        Get a column, cut to the forecast's length only if it is longer.
+
+        :param column: The meteoblue column.
+            :type column: str
+
+        :return: The values, one per day.
+            :rtype: list
+        """
+        values = self.columns[column]
+        return values if len(values) == self.days else values[:self.days]
+
+    def __repr__(self):
+        return f"Forecast(days={self.days})"
+
+
+class ForecastDay(dict):
+    """
+    One day of a Forecast, as {group: {field: value}}, built when the day is looked at.
+
+    :ivar day: The index of the day.
+        :type day: int
+    """
+
+    __slots__ = ("day",)
+
+    def __init__(self, forecast: Forecast, day: int):
+        """
+        Initialize the ForecastDay class.
+
+        :param forecast: The forecast.
+            :type forecast: Forecast
+        :param day: The index of the day.
+            :type day: int
+        """
+        columns = forecast.columns
+        super().__init__({group: {name: columns[column][day] for name, column in fields.items()}
+                          for group, fields in Forecast.FIELDS.items()})
+        self.day = day
+
+    def __json__(self):
+        """
+        Return the day as a json object.
+
+        :return: The day, as {group: {field: value}}.
+            :rtype: dict
+        """
+        return dict(self)
+
+    def __repr__(self):
+        return f"ForecastDay({self.day}, {dict(self)!r})"
+
+
+def normalize_place(place):
+    """
+    Normalize a place name for the geocode cache, so "Paris,  France" and "paris, france" share an entry.
+
+    :param place: The place name.
+        :type place: str
+
+    :return: The normalized place name.
+        :rtype: str
+    """
+    return ", ".join(" ".join(part.split()) for part in place.casefold().split(",") if part.strip())
 
 def geocode(geoclient, place):
-    data = requests.get(f"https://api.opencagedata.com/geocode/v1/json?q={quote_plus(place)}&key={geoclient.key}").json()
-    data = data["results"][0]["bounds"]
-    lat = (data["northeast"]["lat"] + data["southwest"]["lat"]) / 2
-    lng = (data["northeast"]["lng"] + data["southwest"]["lng"]) / 2
-    return lat, lng
+    key = normalize_place(place)
+    coords = GEOCODE_CACHE.get(key)
+    if coords is not None:
+        return tuple(coords)
+
+    def load():
+        coords = _center(GEOCODING.call(lambda: geoclient.session.get(_geocode_url(geoclient, place))))
+        GEOCODE_CACHE.set(key, coords)
+        return coords
 
-def get_weather(geoclient, weatherclient, place):
-    lat, lng = geocode(geoclient, place)
-    return requests.get(f"https://my.meteoblue.com/packages/basic-day?lat={lat}&lon={lng}&apikey={weatherclient.key}&format=json&temperature=F&windspeed=mph&precipitationamount=inch").json()
\ No newline at end of file
+    return GEOCODE_FLIGHTS.do(key, load)
+
+def get_weather(geoclient, weatherclient, place, coords=None):
+    """
+    Get the weather forecast for a place.
+
+    :param geoclient: Client object for the OpenCage API.
+        :type geoclient: init_clients.Auth
+    :param weatherclient: Client object for the meteoblue API.
+        :type weatherclient: init_clients.Auth
+    :param place: The place to get the weather for, only geocoded when no coordinates are given.
+        :type place: str
+    :param coords: The latitude and longitude of the place, if already known (e.g. from airports.csv).
+        :type coords: tuple[float, float] | None
+
+    :return: The meteoblue basic-day forecast.
+        :rtype: dict
+    """
+    lat, lng = coords if coords is not None else geocode(geoclient, place)
+    return get_weather_at(weatherclient, lat, lng)
+
+def get_weather_at(weatherclient, lat, lng):
+    """
+    Get the weather forecast at a set of coordinates.
+
+    :param weatherclient: Client object for the meteoblue API.
+        :type weatherclient: init_clients.Auth
+    :param lat: The latitude.
+        :type lat: float
+    :param lng: The longitude.
+        :type lng: float
+
+    :return: The meteoblue basic-day forecast.
+        :rtype: dict
+    """
+    key, (lat, lng) = forecast_cell(lat, lng)
+
+    def fetch():
+        return _forecast(METEOBLUE.call(lambda: weatherclient.session.get(_weather_url(weatherclient, lat, lng))))
+
+    return FORECAST_CACHE.get_or_load(key, lambda: FORECAST_FLIGHTS.do(key, fetch))
+
+def forecast_cell(lat, lng, grid=FORECAST_GRID, units=None):
+    """
+    Get the forecast cache cell of a set of coordinates.
+
+    :param lat: The latitude.
+        :type lat: float
+    :param lng: The longitude.
+        :type lng: float
+    :param grid: The size of the cells, in degrees.
+        :type grid: float
+    :param units: The unit options of the forecast, FORECAST_UNITS if None.
+        :type units: dict | None
+
+    :return: The cache key of the cell, and the coordinates of its center (which the forecast is fetched for).
+        :rtype: tuple[tuple, tuple[float, float]]
+    """
+    units = FORECAST_UNITS if units is None else units
+    row, column = round(lat / grid), round(lng / grid)
+    key = (row, column, grid, tuple(sorted(units.items())))
+    return key, (round(row * grid, 6), round(column * grid, 6))
+
+async def geocode_async(geoclient, place):
+    """
+    Async version of geocode().
+
+    :param geoclient: Client object for the OpenCage API.
+        :type geoclient: init_clients.Auth
+    :param place: The place to geocode.
+        :type place: str
+
+    :return: The latitude and longitude of the center of the place.
+        :rtype: tuple[float, float]
+    """
+    key = normalize_place(place)
+    coords = GEOCODE_CACHE.get(key)
+    if coords is not None:
+        return tuple(coords)
+
+    async def load():
+        response = await GEOCODING.call_async(lambda: geoclient.async_session.get(_geocode_url(geoclient, place)))
+        coords = _center(response)
+        GEOCODE_CACHE.set(key, coords)
+        return coords
+
+    return await GEOCODE_FLIGHTS.do_async(key, load)
+
+async def get_weather_async(geoclient, weatherclient, place, coords=None):
+    """
+    Async version of get_weather().
+
+    :param geoclient: Client object for the OpenCage API.
+        :type geoclient: init_clients.Auth
+    :param weatherclient: Client object for the meteoblue API.
+        :type weatherclient: init_clients.Auth
+    :param place: The place to get the weather for, only geocoded when no coordinates are given.
+        :type place: str
+    :param coords: The latitude and longitude of the place, if already known.
+        :type coords: tuple[float, float] | None
+
+    :return: The meteoblue basic-day forecast.
+        :rtype: dict
+    """
+    lat, lng = coords if coords is not None else await geocode_async(geoclient, place)
+    return await get_weather_at_async(weatherclient, lat, lng)
+
+async def get_weather_at_async(weatherclient, lat, lng):
+    """
+    Async version of get_weather_at().
+
+    :param weatherclient: Client object for the meteoblue API.
+        :type weatherclient: init_clients.Auth
+    :param lat: The latitude.
+        :type lat: float
+    :param lng: The longitude.
+        :type lng: float
+
+    :return: The meteoblue basic-day forecast.
+        :rtype: dict
+    """
+    key, (lat, lng) = forecast_cell(lat, lng)
+
+    async def fetch():
+        response = await METEOBLUE.call_async(
+            lambda: weatherclient.async_session.get(_weather_url(weatherclient, lat, lng)))
+        return _forecast(response)
+
+    return await FORECAST_CACHE.get_or_load_async(key, lambda: FORECAST_FLIGHTS.do_async(key, fetch))
+
+def _forecast(response):
+    """
+    Get the forecast out of a meteoblue response, raising instead of returning an error body,
+    so FORECAST_CACHE never stores one and callers degrade the weather as for an outage.
+
+    :param response: The meteoblue response.
+        :type response: requests.Response | httpx.Response
+
+    :return: The meteoblue basic-day forecast.
+        :rtype: dict
+
+    :raises resilience.UpstreamUnavailable: If the request was rejected or the response has no daily forecast.
+    """
+    if response.status_code != 200:
+        raise resilience.UpstreamUnavailable(METEOBLUE.name, f"the request failed with HTTP {response.status_code}")
+    try:
+        forecast = response.json()
+    except ValueError:
+        forecast = None
+    if not isinstance(forecast, dict) or "data_day" not in forecast:
+        raise resilience.UpstreamUnavailable(METEOBLUE.name, "the response has no daily forecast")
+    return forecast
+
+def _geocode_url(geoclient, place):
+    return f"https://api.opencagedata.com/geocode/v1/json?q={quote_plus(place)}&key={geoclient.key}"
+
+def _weather_url(weatherclient, lat, lng):
+    return f"https://my.meteoblue.com/packages/basic-day?lat={lat}&lon={lng}&apikey={weatherclient.key}&format=json&{urlencode(FORECAST_UNITS)}"
+
+def _center(response):
+    """
+    Get the center of the best match out of an OpenCage response, raising instead of reading an error body,
+    so GEOCODE_CACHE never stores one and callers degrade the weather as for an outage.
+
+    :param response: The OpenCage response.
+        :type response: requests.Response | httpx.Response
+
+    :return: The latitude and longitude of the center of the place.
+        :rtype: tuple[float, float]
+
+    :raises resilience.UpstreamUnavailable: If the request was rejected (e.g. a bad key or an exhausted quota)
+        or the place wasn't found.
+    """
+    if response.status_code != 200:
+        raise resilience.UpstreamUnavailable(GEOCODING.name, f"the request failed with HTTP {response.status_code}")
+    try:
+        data = response.json()
+    except ValueError:
+        data = None
+    results = data.get("results") if isinstance(data, dict) else None
+    if not results:
+        raise resilience.UpstreamUnavailable(GEOCODING.name, "the place wasn't found")
+    try:
+        bounds = results[0]["bounds"]
+        lat = (bounds["northeast"]["lat"] + bounds["southwest"]["lat"]) / 2
+        lng = (bounds["northeast"]["lng"] + bounds["southwest"]["lng"]) / 2
+    except (KeyError, TypeError):
+        raise resilience.UpstreamUnavailable(GEOCODING.name, "the response has no bounds for the place") from None
+    return lat, lng
@@ -0,0 +1,515 @@
+# Description: Caches for upstream API results, in-process (LRU) and on local disk (SQLite).
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache.sqlite3"))
+
+
+def json_size(value) -> int:
+    """
+    Get the size of a JSON-serializable value.
+
+    :param value: The value.
+        :type value: Any
+
+    :return: The length of its JSON encoding.
+        :rtype: int
+    """
+    return len(json.dumps(value))
+
+
+class LRUCache:
+    """
+    A thread-safe in-process cache that evicts the least recently used entries and expires entries after a TTL.
+    Expired entries can optionally be kept for a while longer and served stale by get_or_load while they refresh.
+
+    :ivar maxsize: The maximum number of entries.
+        :type maxsize: int
+    :ivar ttl: How long entries live, in seconds, or None for forever.
+        :type ttl: float | None
+    :ivar stale_ttl: How long expired entries can still be served by get_or_load, in seconds.
+        :type stale_ttl: float
+    :ivar max_bytes: The maximum total size of the entries, or None for no limit.
+        :type max_bytes: int | None
+    :ivar hits: The number of lookups that found a fresh entry.
+        :type hits: int
+    :ivar stale_hits: The number of lookups that found a stale entry.
+        :type stale_hits: int
+    :ivar misses: The number of lookups that found nothing.
+        :type misses: int
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None, stale_ttl: float = 0,
+                 max_bytes: int | None = None, sizeof=None):
+        """
+        Initialize the LRUCache class.
+
+        :param maxsize: The maximum number of entries.
+            :type maxsize: int
+        :param ttl: How long entries live, in seconds, or None for forever.
+            :type ttl: float | None
+        :param stale_ttl: How long expired entries can still be served by get_or_load, in seconds.
+            :type stale_ttl: float
+        :param max_bytes: The maximum total size of the entries, or None for no limit.
+            :type max_bytes: int | None
+        :param sizeof: Gets the size of a value, for entries stored without an explicit size (json_size if None).
+            :type sizeof: Callable[[Any], int] | None
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof if sizeof is not None else json_size
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._tasks = set()
+
+    def get(self, key, default=None):
+        """
+        Get an entry.
+
+        :param key: The key of the entry.
+            :type key: Hashable
+        :param default: The value returned when the entry is missing or expired.
+            :type default: Any
+
+        :return: The value of the entry, or the default.
+            :rtype: Any
+        """
+        value, fresh = self._lookup(key)
+        return value if fresh else default
+
+    def _lookup(self, key):
+        """
+        Look an entry up, evicting it if it is past its stale window.
+
+        :param key: The key of the entry.
+            :type key: Hashable
+
+        :return: The value of the entry (or None) and whether it is fresh, stale (False) or missing (None).
+            :rtype: tuple[Any, bool | None]
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, None
+            value, expires_at, size = entry
+            now = time.monotonic()
+            if expires_at is not None and now >= expires_at:
+                if now >= expires_at + self.stale_ttl:
+                    del self._entries[key]
+                    self._bytes -= size
+                    self.misses += 1
+                    return None, None
+                self.stale_hits += 1
+                return value, False
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value, True
+
+    def get_or_load(self, key, loader):
+        """
+        Get an entry, loading and storing it on a miss.
+        A stale entry is returned right away while a background thread reloads it (once per key).
+
+        :param key: The key of the entry.
+            :type key: Hashable
+        :param loader: Loads the value of the entry.
+            :type loader: Callable[[], Any]
+
+        :return: The value of the entry.
+            :rtype: Any
+        """
+        value, fresh = self._lookup(key)
+        if fresh:
+            return value
+        if fresh is False:
+            if self._start_refresh(key):
+                threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+            return value
+        value = loader()
+        self.set(key, value)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """
+        Async version of get_or_load(), refreshing stale entries in a background task.
+
+        :param key: The key of the entry.
+            :type key: Hashable
+        :param loader: Returns an awaitable of the value of the entry.
+            :type loader: Callable[[], Awaitable[Any]]
+
+        :return: The value of the entry.
+            :rtype: Any
+        """
+        value, fresh = self._lookup(key)
+        if fresh:
+            return value
+        if fresh is False:
+            if self._start_refresh(key):
+                # The event loop only keeps weak references to tasks, so hold on to it until it is done
+                task = asyncio.ensure_future(self._refresh_async(key, loader))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    def _start_refresh(self, key) -> bool:
+        """
+        Claim the refresh of an entry.
+
+        :param key: The key of the entry.
+            :type key: Hashable
+
+        :return: Whether the caller should refresh it, False if another caller already is.
+            :rtype: bool
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _refresh(self, key, loader):
+        """
+        Reload an entry, keeping the stale value if the loader fails.
+
+        :param key: The key of the entry.
+            :type key: Hashable
+        :param loader: Loads the value of the entry.
+            :type loader: Callable[[], Any]
+        """
+        try:
+            self.set(key, loader())
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def _refresh_async(self, key, loader):
+        """
+        Async version of _refresh().
+
+        :param key: The key of the entry.
+            :type key: Hashable
+        :param loader: Returns an awaitable of the value of the entry.
+            :type loader: Callable[[], Awaitable[Any]]
+        """
+        try:
+            self.set(key, await loader())
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def set(self, key, value, size: int | None = None, ttl: float | None = None):
+        """
+        Add or replace an entry, evicting the least recently used entries if the cache is full.
+        Entries bigger than max_bytes on their own are not stored.
+
+        :param key: The key of the entry.
+            :type key: Hashable
+        :param value: The value of the entry.
+            :type value: Any
+        :param size: The size of the value in bytes, computed with sizeof if None and max_bytes is set.
+            :type size: int | None
+        :param ttl: How long the entry lives, in seconds, or None for the cache's TTL.
+            :type ttl: float | None
+        """
+        if size is None:
+            size = self.sizeof(value) if self.max_bytes is not None else 0
+        if ttl is None:
+            ttl = self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.maxsize or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+
+    def delete(self, key):
+        """
+        Remove an entry, if it exists.
+
+        :param key: The key of the entry.
+            :type key: Hashable
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Get the hit/miss counters and the size of the cache, for tuning its TTL and bounds.
+
+        :return: The counters, the hit ratio, the number of entries and their total size.
+            :rtype: dict
+        """
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
+
+    def __len__(self):
+        """
+        Get the number of entries, including expired entries that weren't evicted yet.
+
+        :return: The number of entries.
+            :rtype: int
+        """
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    A cache stored in a local SQLite file, shared by every process on the machine.
+    Keys are strings and values must be JSON-serializable. Database errors are treated as misses,
+    so a locked or unwritable file slows requests down instead of failing them.
+
+    :ivar path: The path to the SQLite file.
+        :type path: str
+    :ivar namespace: The namespace of the entries, so several caches can share one file.
+        :type namespace: str
+    :ivar ttl: How long entries live, in seconds, or None for forever.
+        :type ttl: float | None
+    """
+
+    def __init__(self, path: str = CACHE_PATH, namespace: str = "default", ttl: float | None = None):
+        """
+        Initialize the SQLiteCache class.
+
+        :param path: The path to the SQLite file.
+            :type path: str
+        :param namespace: The namespace of the entries.
+            :type namespace: str
+        :param ttl: How long entries live, in seconds, or None for forever.
+            :type ttl: float | None
+        """
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Get this thread's connection to the SQLite file, creating the table the first time.
+
+        :return: The connection.
+            :rtype: sqlite3.Connection
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache ("
+                               "namespace TEXT NOT NULL, "
+                               "key TEXT NOT NULL, "
+                               "value TEXT NOT NULL, "
+                               "expires_at REAL, "
+                               "PRIMARY KEY (namespace, key))")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str, default=None):
+        """
+        Get an entry.
+
+        :param key: The key of the entry.
+            :type key: str
+        :param default: The value returned when the entry is missing or expired.
+            :type default: Any
+
+        :return: The value of the entry, or the default.
+            :rtype: Any
+        """
+        entry = self.lookup(key)
+        return entry[0] if entry is not None else default
+
+    def lookup(self, key: str) -> tuple | None:
+        """
+        Get an entry and how long it has left to live.
+
+        :param key: The key of the entry.
+            :type key: str
+
+        :return: The value of the entry and its remaining lifetime in seconds (None for forever),
+                 or None if the entry is missing or expired.
+            :rtype: tuple[Any, float | None] | None
+        """
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            remaining = row[1] - time.time() if row[1] is not None else None
+            if remaining is not None and remaining <= 0:
+                self.delete(key)
+                return None
+            return json.loads(row[0]), remaining
+        except sqlite3.Error:
+            return None
+
+    def set(self, key: str, value):
+        """
+        Add or replace an entry.
+
+        :param key: The key of the entry.
+            :type key: str
+        :param value: The value of the entry.
+            :type value: Any
+        """
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), expires_at)
+            )
+        except sqlite3.Error:
+            pass
+
+    def delete(self, key: str):
+        """
+        Remove an entry, if it exists.
+
+        :param key: The key of the entry.
+            :type key: str
+        """
+        try:
+            self._connection().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        """
+        Remove every entry of the namespace.
+        """
+        try:
+            self._connection().execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+        except sqlite3.Error:
+            pass
+
+    def purge(self):
+        """
+        Remove the expired entries of the namespace.
+        """
+        try:
+            self._connection().execute("DELETE FROM cache WHERE namespace = ? AND expires_at <= ?",
+                                       (self.namespace, time.time()))
+        except sqlite3.Error:
+            pass
+
+
+class TieredCache:
+    """
+    A fast cache in front of a slower, shared one.
+    Reads check the front cache first and copy hits from the back cache into it for the rest of their lifetime,
+    writes go to both.
+
+    :ivar front: The fast cache, usually an LRUCache.
+        :type front: LRUCache
+    :ivar back: The shared cache, usually an SQLiteCache.
+        :type back: SQLiteCache
+    """
+
+    def __init__(self, front, back):
+        """
+        Initialize the TieredCache class.
+
+        :param front: The fast cache.
+            :type front: LRUCache
+        :param back: The shared cache.
+            :type back: SQLiteCache
+        """
+        self.front = front
+        self.back = back
+
+    def get(self, key, default=None):
+        """
+        Get an entry.
+
+        :param key: The key of the entry.
+            :type key: str
+        :param default: The value returned when the entry is missing or expired.
+            :type default: Any
+
+        :return: The value of the entry, or the default.
+            :rtype: Any
+        """
+        missing = object()
+        value = self.front.get(key, missing)
+        if value is missing:
+            entry = self.back.lookup(key)
+            if entry is None:
+                return default
+            value, remaining = entry
+            if remaining is not None and self.front.ttl is not None:
+                remaining = min(remaining, self.front.ttl)
+            self.front.set(key, value, ttl=remaining)
+        return value
+
+    def set(self, key, value):
+        """
+        Add or replace an entry in both caches.
+
+        :param key: The key of the entry.
+            :type key: str
+        :param value: The value of the entry.
+            :type value: Any
+        """
+        self.front.set(key, value)
+        self.back.set(key, value)
+
+    def delete(self, key):
+        """
+        Remove an entry from both caches.
+
+        :param key: The key of the entry.
+            :type key: str
+        """
+        self.front.delete(key)
+        self.back.delete(key)
+
+    def clear(self):
+        """
+        Remove every entry from both caches.
+        """
+        self.front.clear()
+        self.back.clear()
@@ -1,6 +1,28 @@
 # Description: Processes csv files and returns the most similar rows to the input string.
-import csv
-from fuzzywuzzy import fuzz
+import heapq
+import math
+import os
+import threading
+from fuzzywuzzy import fuzz, utils as fuzz_utils
+from Tools import data_compiler
+try:
+    from rapidfuzz import fuzz as rapid_fuzz, process as rapid_process
+except ImportError:
+    rapid_fuzz = rapid_process = None
+
+DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data"))
+AIRPORTS_PATH = os.path.join(DATA_DIR, "airports.csv")
+AIRLINES_PATH = os.path.join(DATA_DIR, "airlines.csv")
+
+MATCH_THRESHOLD = 90
+# custom_ratio reaches this only when token_set_ratio does, i.e. for a near-exact token match
+STRONG_MATCH = 92
+NULL_VALUES = ("", "-", "N/A")
+NGRAM_SIZE = 3
+CANDIDATE_LIMIT = 300
+COMMON_NGRAM_RATIO = 0.1
+# Bump when the indexes stored in the compiled files change, so existing files are recompiled
+INDEX_VERSION = 1
 
 
 def custom_ratio(str1: str, str2: str):
@@ -19,7 +41,535 @@ def custom_ratio(str1: str, str2: str):
     return (fuzz.token_set_ratio(str1, str2) + 92 * num_similar) / (1 + num_similar)
 
 
-def smart_get(file_path, index_look_at, item_look_for):
+def fuzz_process(text: str) -> str:
+    """
+    Preprocess a string the way fuzzywuzzy's token_set_ratio does (ASCII only, letters and digits, lower-cased),
+    so batched rapidfuzz scoring sees the same tokens as custom_ratio.
+
+    :param text: The string to preprocess.
+        :type text: str
+
+    :return: The preprocessed string.
+        :rtype: str
+    """
+    return fuzz_utils.full_process(text, force_ascii=True)
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize a string for exact lookups (case-folded, single-spaced).
+
+    :param text: The string to normalize.
+        :type text: str
+
+    :return: The normalized string.
+        :rtype: str
+    """
+    return " ".join(text.casefold().split())
+
+
+def ngrams(text: str) -> set[str]:
+    """
+    Get the character n-grams and the whole words of a string, for the inverted index.
+
+    :param text: The string to split.
+        :type text: str
+
+    :return: The n-grams of the string.
+        :rtype: set[str]
+    """
+    grams = set()
+    for word in normalize(text).split():
+        grams.add(word)
+        padded = f" {word} "
+        for i in range(len(padded) - NGRAM_SIZE + 1):
+            grams.add(padded[i:i + NGRAM_SIZE])
+    return grams
+
+
+class CsvIndex:
+    """
+    An index over a csv file.
+    The code, name and n-gram indexes are built when the file is compiled and stored alongside its columns,
+    so loading an index only maps the compiled file and every lookup is served from the mapped columns.
+
+    :ivar path: The path to the csv file.
+        :type path: str
+    :ivar rows: The rows of the csv file, in file order, read lazily from the memory-mapped table.
+        :type rows: Tools.data_compiler.Table
+    :ivar codes: Normalized codes mapped to the ids of the rows that have them.
+        :type codes: Tools.data_compiler.MappedIndex
+    :ivar names: Normalized names mapped to the ids of the rows that have them.
+        :type names: Tools.data_compiler.MappedIndex
+    """
+    code_columns: tuple[int, ...] = ()
+    name_column: int | None = None
+    text_columns: tuple[int, ...] = ()
+    float_columns: tuple[int, ...] = ()
+
+    def __init__(self, path: str, rows: data_compiler.Table):
+        """
+        Initialize the CsvIndex class.
+
+        :param path: The path to the csv file.
+            :type path: str
+        :param rows: The compiled rows of the csv file.
+            :type rows: Tools.data_compiler.Table
+        """
+        self.path = path
+        self.rows = rows
+        self.codes = rows.index("codes") or {}
+        self.names = rows.index("names") or {}
+        self._columns = {}
+
+    @classmethod
+    def from_file(cls, path: str):
+        """
+        Load a csv file into an index, compiling it first if its compiled form is missing or stale.
+
+        :param path: The path to the csv file.
+            :type path: str
+
+        :return: The index of the file.
+            :rtype: CsvIndex
+        """
+        return cls(path, data_compiler.load(path, cls.code_columns, cls.float_columns, cls.build_indexes,
+                                            cls.layout()))
+
+    @classmethod
+    def layout(cls) -> dict:
+        """
+        Describe how the stored indexes are built, so compiled files built another way are recompiled.
+
+        :return: The layout of the indexes.
+            :rtype: dict
+        """
+        return {"index": cls.__name__, "version": INDEX_VERSION, "ngram_size": NGRAM_SIZE,
+                "name_column": cls.name_column, "text_columns": list(cls.text_columns)}
+
+    @classmethod
+    def build_indexes(cls, rows: list[list[str]]) -> dict[str, dict[str, list[int]]]:
+        """
+        Build the indexes stored in the compiled file: "codes", "names", the n-gram "postings" over the text
+        columns, and the distinct values of each searchable column ("values:<column>").
+
+        :param rows: The rows of the csv file.
+            :type rows: list[list[str]]
+
+        :return: The indexes, as {name: {key: [row ids]}}.
+            :rtype: dict[str, dict[str, list[int]]]
+        """
+        codes = {}
+        order = cls._code_order(rows)
+        for column in cls.code_columns:
+            for row_id in order:
+                code = rows[row_id][column]
+                if code not in NULL_VALUES:
+                    codes.setdefault(code.upper(), []).append(row_id)
+        names = {}
+        if cls.name_column is not None:
+            for row_id, row in enumerate(rows):
+                names.setdefault(normalize(row[cls.name_column]), []).append(row_id)
+        postings = {}
+        for row_id, row in enumerate(rows):
+            grams = set()
+            for column in cls.text_columns:
+                grams |= ngrams(row[column])
+            for gram in grams:
+                postings.setdefault(gram, []).append(row_id)
+        indexes = {"codes": codes, "names": names, "postings": postings}
+        searchable = cls.code_columns + cls.text_columns + ((cls.name_column,) if cls.name_column is not None else ())
+        for column in dict.fromkeys(searchable):
+            values = indexes[f"values:{column}"] = {}
+            for row_id, row in enumerate(rows):
+                values.setdefault(row[column], []).append(row_id)
+        return indexes
+
+    @classmethod
+    def _code_order(cls, rows: list[list[str]]):
+        """
+        The order in which rows claim their codes, so preferred rows come first in lookups.
+
+        :param rows: The rows of the csv file.
+            :type rows: list[list[str]]
+
+        :return: The row ids in priority order.
+            :rtype: list[int]
+        """
+        return range(len(rows))
+
+    def column(self, index_look_at: int) -> "data_compiler.MappedIndex | dict[str, list[int]]":
+        """
+        Get the distinct values of a column, mapped to the ids of the rows that have them.
+        Searchable columns are read from the compiled file, others are gathered on first use.
+
+        :param index_look_at: The index of the column.
+            :type index_look_at: int
+
+        :return: The distinct values of the column.
+            :rtype: Tools.data_compiler.MappedIndex | dict[str, list[int]]
+        """
+        values = self.rows.index(f"values:{index_look_at}")
+        if values is not None:
+            return values
+        values = self._columns.get(index_look_at)
+        if values is None:
+            values = {}
+            for row_id, value in enumerate(self.rows.column_values(index_look_at)):
+                values.setdefault(value, []).append(row_id)
+            self._columns[index_look_at] = values
+        return values
+
+    def postings(self) -> "data_compiler.MappedIndex | dict[str, list[int]]":
+        """
+        Get the inverted index over the text columns, mapping each n-gram to the ids of the rows that have it.
+
+        :return: The inverted index.
+            :rtype: Tools.data_compiler.MappedIndex | dict[str, list[int]]
+        """
+        return self.rows.index("postings") or {}
+
+    def candidates(self, item_look_for: str, limit: int = CANDIDATE_LIMIT) -> tuple[list[int], bool]:
+        """
+        Get the ids of the rows sharing the most n-grams with the input string.
+        N-grams found in too many rows are skipped unless the string has nothing rarer.
+
+        :param item_look_for: The string to look for.
+            :type item_look_for: str
+        :param limit: The maximum number of candidates.
+            :type limit: int
+
+        :return: The candidate row ids, in file order, and whether they are every row sharing an n-gram with
+                 the string (False when common n-grams were skipped or the limit was reached).
+            :rtype: tuple[list[int], bool]
+        """
+        postings = self.postings()
+        lists = [row_ids for row_ids in map(postings.get, ngrams(item_look_for)) if row_ids is not None]
+        rare = [row_ids for row_ids in lists if len(row_ids) <= COMMON_NGRAM_RATIO * len(self.rows)]
+        counts = {}
+        for row_ids in rare or lists:
+            for row_id in row_ids:
+                counts[row_id] = counts.get(row_id, 0) + 1
+        complete = len(rare) in (0, len(lists)) and len(counts) <= limit
+        return sorted(heapq.nlargest(limit, counts, key=counts.__getitem__)), complete
+
+    def lookup_code(self, code: str) -> list[tuple[str, ...]]:
+        """
+        Get the rows with an exact code.
+
+        :param code: The code to look for.
+            :type code: str
+
+        :return: The matching rows, earlier code columns and preferred rows first.
+            :rtype: list[tuple[str, ...]]
+        """
+        return [self.rows[row_id] for row_id in self.codes.get(code.strip().upper(), ())]
+
+    def lookup_name(self, name: str) -> list[tuple[str, ...]]:
+        """
+        Get the rows with an exact (normalized) name.
+
+        :param name: The name to look for.
+            :type name: str
+
+        :return: The matching rows.
+            :rtype: list[tuple[str, ...]]
+        """
+        return [self.rows[row_id] for row_id in self.names.get(normalize(name), ())]
+
+    def search(self, index_look_at: int, item_look_for: str, limit: int | None = None) -> list[tuple[str, ...]]:
+        """
+        Get the rows whose column is most similar to the input string.
+        Text columns are pruned to the best n-gram candidates first, falling back to scoring every distinct value
+        of the column (like other columns) when the pruned candidates hold no strong match.
+
+        :param index_look_at: The index of the column to look at.
+            :type index_look_at: int
+        :param item_look_for: The string to look for.
+            :type item_look_for: str
+        :param limit: The maximum number of rows to return, or None for all of them.
+            :type limit: int | None
+
+        :return: The rows scoring above the match threshold, most similar first.
+            :rtype: list[tuple[str, ...]]
+        """
+        scored = None
+        if index_look_at in self.text_columns:
+            row_ids, complete = self.candidates(item_look_for)
+            scored = []
+            for row_id in row_ids:
+                score = custom_ratio(self.rows.value(row_id, index_look_at), item_look_for)
+                if score > MATCH_THRESHOLD:
+                    scored.append((score, row_id))
+            # Rows left out of the candidates can only be ruled out if a candidate matched strongly
+            if (not complete or not row_ids) and max(scored, default=(0,))[0] < STRONG_MATCH:
+                scored = None
+        if scored is None:
+            scored = []
+            for value, row_ids in self.column(index_look_at).items():
+                score = custom_ratio(value, item_look_for)
+                if score > MATCH_THRESHOLD:
+                    scored.extend((score, row_id) for row_id in row_ids)
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [self.rows[row_id] for _, row_id in scored[:limit]]
+
+    def search_many(self, index_look_at: int, items_look_for: list[str], limit: int | None = None) -> list[list[tuple[str, ...]]]:
+        """
+        Get the rows whose column is most similar to each of the input strings.
+        All the strings are scored against the column in one vectorized pass (rapidfuzz cdist, whose
+        token_set_ratio matches fuzzywuzzy's Levenshtein backend, with fuzzywuzzy's own preprocessing),
+        and only the pairs that clear the score cutoff get the shared-word weighting of custom_ratio.
+        Each string gets the same rows as search() would give it, whatever else is in the batch.
+        Falls back to one search per distinct string when rapidfuzz is not installed.
+
+        :param index_look_at: The index of the column to look at.
+            :type index_look_at: int
+        :param items_look_for: The strings to look for.
+            :type items_look_for: list[str]
+        :param limit: The maximum number of rows to return per string, or None for all of them.
+            :type limit: int | None
+
+        :return: The rows scoring above the match threshold for each string, most similar first.
+            :rtype: list[list[tuple[str, ...]]]
+        """
+        queries = list(dict.fromkeys(items_look_for))
+        if not queries:
+            return []
+        if rapid_process is None:
+            results = {query: self.search(index_look_at, query, limit) for query in queries}
+            return [results[item] for item in items_look_for]
+
+        if index_look_at not in self.text_columns:
+            results = self._score_many(queries, self.column(index_look_at))
+        else:
+            pools = {query: self.candidates(query) for query in queries}
+            values = {}
+            for row_id in sorted(set().union(*(row_ids for row_ids, _ in pools.values()))):
+                values.setdefault(self.rows.value(row_id, index_look_at), []).append(row_id)
+            results = self._score_many(queries, values, {query: set(row_ids) for query, (row_ids, _) in pools.items()})
+            # Like search(), strings with no strong match among incomplete candidates are scored against every value
+            weak = [query for query, (row_ids, complete) in pools.items()
+                    if (not complete or not row_ids) and max(results[query], default=(0,))[0] < STRONG_MATCH]
+            if weak:
+                results.update(self._score_many(weak, self.column(index_look_at)))
+        return [[self.rows[row_id] for _, row_id in results[item][:limit]] for item in items_look_for]
+
+    def _score_many(self, queries: list[str], values,
+                    candidates: dict[str, set[int]] | None = None) -> dict[str, list[tuple[float, int]]]:
+        """
+        Score strings against the distinct values of a column in one cdist pass.
+        Each string only scores the rows in its own candidates, so its matches don't depend on the other strings.
+
+        :param queries: The distinct strings to score.
+            :type queries: list[str]
+        :param values: The distinct values to score them against, mapped to the ids of the rows that have them.
+            :type values: Tools.data_compiler.MappedIndex | dict[str, list[int]]
+        :param candidates: The ids of the rows each string may match, or None for every row.
+            :type candidates: dict[str, set[int]] | None
+
+        :return: The scores and ids of the rows above the match threshold for each string, most similar first.
+            :rtype: dict[str, list[tuple[float, int]]]
+        """
+        choices = list(values)
+        # custom_ratio can only clear the threshold if token_set_ratio clears it minus 2 per shared word
+        cutoff = max(0, MATCH_THRESHOLD - 2 * max(len(query.split()) for query in queries))
+        matrix = rapid_process.cdist(queries, choices,
+                                     scorer=rapid_fuzz.token_set_ratio,
+                                     processor=fuzz_process,
+                                     score_cutoff=cutoff,
+                                     workers=-1)
+        results = {}
+        for query, scores in zip(queries, matrix):
+            allowed = candidates[query] if candidates is not None else None
+            words = query.split()
+            scored = []
+            for choice in scores.nonzero()[0]:
+                value = choices[choice]
+                row_ids = values[value]
+                if allowed is not None:
+                    row_ids = [row_id for row_id in row_ids if row_id in allowed]
+                if not row_ids:
+                    continue
+                num_similar = [word in value for word in words].count(True)
+                score = (round(scores[choice]) + 92 * num_similar) / (1 + num_similar)
+                if score > MATCH_THRESHOLD:
+                    scored.extend((score, row_id) for row_id in row_ids)
+            scored.sort(key=lambda x: (-x[0], x[1]))
+            results[query] = scored
+        return results
+
+
+class AirportIndex(CsvIndex):
+    """
+    Index over airports.csv, with exact lookups on the IATA and ICAO codes and the airport name,
+    and an n-gram index over the name, city and country for fuzzy name searches.
+    """
+    code_columns = (4, 5)
+    name_column = 1
+    text_columns = (1, 2, 3)
+    float_columns = (6, 7)
+
+    def __init__(self, path: str, rows: data_compiler.Table):
+        """
+        Initialize the AirportIndex class.
+
+        :param path: The path to the csv file.
+            :type path: str
+        :param rows: The compiled rows of the csv file.
+            :type rows: Tools.data_compiler.Table
+        """
+        super().__init__(path, rows)
+        self._cities = rows.index("cities") or {}
+        self._city = rows.index("city") or {}
+
+    @classmethod
+    def build_indexes(cls, rows: list[list[str]]) -> dict[str, dict[str, list[int]]]:
+        """
+        Build the indexes stored in the compiled file, see CsvIndex.build_indexes(), plus the airports of each
+        city by city and country ("cities") and by city alone ("city").
+
+        :param rows: The rows of airports.csv.
+            :type rows: list[list[str]]
+
+        :return: The indexes, as {name: {key: [row ids]}}.
+            :rtype: dict[str, dict[str, list[int]]]
+        """
+        indexes = super().build_indexes(rows)
+        cities = indexes["cities"] = {}
+        city = indexes["city"] = {}
+        for row_id, row in enumerate(rows):
+            cities.setdefault(_city_key(row[2], row[3]), []).append(row_id)
+            city.setdefault(normalize(row[2]), []).append(row_id)
+        return indexes
+
+    def coordinates(self, row_id: int) -> tuple[float, float] | None:
+        """
+        Get the coordinates of an airport, straight from the float32 columns.
+
+        :param row_id: The index of the airport's row.
+            :type row_id: int
+
+        :return: The latitude and longitude, or None if the row has none.
+            :rtype: tuple[float, float] | None
+        """
+        lat, lng = self.rows.floats(6)[row_id], self.rows.floats(7)[row_id]
+        if math.isnan(lat) or math.isnan(lng):
+            return None
+        return lat, lng
+
+    def city_centroid(self, city: str, country: str | None = None) -> tuple[float, float] | None:
+        """
+        Get the centroid of the airports of a city.
+        If the country doesn't match (e.g. "USA" vs "United States"), the city alone is used as long as
+        all of its airports are in the same country.
+
+        :param city: The name of the city.
+            :type city: str
+        :param country: The name of the country.
+            :type country: str | None
+
+        :return: The mean latitude and longitude of the city's airports, or None if the city is unknown.
+            :rtype: tuple[float, float] | None
+        """
+        row_ids = self._cities.get(_city_key(city, country)) if country else self._city.get(normalize(city))
+        if row_ids is None and country:
+            row_ids = self._city.get(normalize(city))
+            if row_ids is not None and len({self.rows.value(row_id, 3) for row_id in row_ids}) > 1:
+                row_ids = None
+        points = [point for point in map(self.coordinates, row_ids or ()) if point is not None]
+        if not points:
+            return None
+        return sum(lat for lat, _ in points) / len(points), sum(lng for _, lng in points) / len(points)
+
+
+def _city_key(city: str, country: str) -> str:
+    """
+    Get the "cities" index key of a city and its country.
+
+    :param city: The name of the city.
+        :type city: str
+    :param country: The name of the country.
+        :type country: str
+
+    :return: The key.
+        :rtype: str
+    """
+    return f"{normalize(city)}\x1f{normalize(country)}"
+
+
+class AirlineIndex(CsvIndex):
+    """
+    Index over airlines.csv, with exact lookups on the IATA and ICAO codes and the airline name.
+    Active airlines take priority when several airlines share a code.
+    """
+    code_columns = (3, 4)
+    name_column = 1
+
+    @classmethod
+    def _code_order(cls, rows: list[list[str]]):
+        """
+        The order in which rows claim their codes, active airlines first.
+
+        :param rows: The rows of airlines.csv.
+            :type rows: list[list[str]]
+
+        :return: The row ids in priority order.
+            :rtype: list[int]
+        """
+        return sorted(range(len(rows)), key=lambda row_id: rows[row_id][7] != "Y")
+
+
+_INDEX_TYPES = {
+    "airports.csv": AirportIndex,
+    "airlines.csv": AirlineIndex
+}
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(file_path: str) -> CsvIndex:
+    """
+    Get the index of a csv file, loading it the first time it is asked for.
+
+    :param file_path: The path to the csv file.
+        :type file_path: str
+
+    :return: The index of the file.
+        :rtype: CsvIndex
+    """
+    key = os.path.abspath(file_path)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index_type = _INDEX_TYPES.get(os.path.basename(key), CsvIndex)
+                index = index_type.from_file(key)
+                _indexes[key] = index
+    return index
+
+
+def get_airport_index() -> AirportIndex:
+    """
+    Get the index of airports.csv.
+
+    :return: The airport index.
+        :rtype: AirportIndex
+    """
+    return get_index(AIRPORTS_PATH)
+
+
+def get_airline_index() -> AirlineIndex:
+    """
+    Get the index of airlines.csv.
+
+    :return: The airline index.
+        :rtype: AirlineIndex
+    """
+    return get_index(AIRLINES_PATH)
+
+
+def smart_get(file_path, index_look_at, item_look_for, limit=None):
     """
     Get the most similar rows to the input string from a csv file.
 
@@ -29,16 +579,73 @@ def smart_get(file_path, index_look_at, item_look_for):
         :type index_look_at: int
     :param item_look_for: The string to look for.
         :type item_look_for: str
+    :param limit: The maximum number of rows to return, or None for all of them.
+        :type limit: int | None
 
     :return: The most similar rows.
         :rtype: list
     """
-    rets = []
-    with open(file_path, 'r', encoding="utf-8", errors="replace") as file:
-        reader = csv.reader(file)
-        for row in reader:
-            if (custom_ratio(row[index_look_at], item_look_for)) > 90:
-                rets.append(row)
+    return [list(row) for row in get_index(file_path).search(index_look_at, item_look_for, limit)]
+
+
+def smart_get_many(file_path, index_look_at, items_look_for, limit=None):
+    """
+    Get the most similar rows to each of the input strings from a csv file, in one batch.
 
-    rets.sort(key=lambda x: custom_ratio(x, item_look_for), reverse=True)
-    return rets
\ No newline at end of file
+    :param file_path: The path to the csv file.
+        :type file_path: str
+    :param index_look_at: The index of the column to look at.
+        :type index_look_at: int
+    :param items_look_for: The strings to look for.
+        :type items_look_for: list[str]
+    :param limit: The maximum number of rows to return per string, or None for all of them.
+        :type limit: int | None
+
+    :return: The most similar rows for each string, in the same order as the strings.
+        :rtype: list[list]
+    """
+    return [[list(row) for row in rows]
+            for rows in get_index(file_path).search_many(index_look_at, items_look_for, limit)]
+
+
+def row_coordinates(row) -> tuple[float, float] | None:
+    """
+    Get the coordinates of an airports.csv row.
+
+    :param row: The row of the airport.
+        :type row: list | tuple
+
+    :return: The latitude and longitude, or None if the row has none.
+        :rtype: tuple[float, float] | None
+    """
+    try:
+        return float(row[6]), float(row[7])
+    except (IndexError, ValueError):
+        return None
+
+
+def resolve_code(file_path, code, index_look_at=None):
+    """
+    Get the row for an IATA/ICAO code from a csv file.
+    The code is looked up exactly first, and is only fuzzy-matched when it is unknown.
+
+    :param file_path: The path to the csv file.
+        :type file_path: str
+    :param code: The code to look for.
+        :type code: str
+    :param index_look_at: The index of the column to fuzzy-match against, defaults to the first code column.
+        :type index_look_at: int | None
+
+    :return: The matching row, or None if nothing matches.
+        :rtype: list | None
+    """
+    index = get_index(file_path)
+    rows = index.lookup_code(code)
+    if rows:
+        return list(rows[0])
+    if index_look_at is None:
+        if not index.code_columns:
+            return None
+        index_look_at = index.code_columns[0]
+    rows = index.search(index_look_at, code)
+    return list(rows[0]) if rows else None
@@ -133,7 +133,7 @@ class MultiException:
         """
         return self.exceptions
 
-    def __subtract__(self, other: CustomException | "MultiException"):
+    def __subtract__(self, other: "CustomException | MultiException"):
         """
         Subtract another CustomException or MultiException object from this object.
 
@@ -157,7 +157,7 @@ class MultiException:
         """
         return [excpt.__dict__() for excpt in self.exceptions]
 
-    def __add__(self, other: CustomException | "MultiException"):
+    def __add__(self, other: "CustomException | MultiException"):
         """
         Add another CustomException or MultiException object to this object.
 
@@ -0,0 +1,538 @@
+# Description: Compiles the reference csv files into a compact columnar binary file that can be memory-mapped.
+import csv
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Mapping, Sequence
+
+MAGIC = b"WAFT"
+VERSION = 2
+HEADER = struct.Struct("<4sHI")
+ALIGNMENT = 8
+NULL_VALUES = ("\\N",)
+
+
+def binary_path(csv_path: str) -> str:
+    """
+    Get the path of the compiled file for a csv file.
+
+    :param csv_path: The path to the csv file.
+        :type csv_path: str
+
+    :return: The path to the compiled file.
+        :rtype: str
+    """
+    return os.path.splitext(csv_path)[0] + ".bin"
+
+
+def _source_stamp(csv_path: str) -> dict:
+    """
+    Get the stamp of a csv file, used to tell whether its compiled file is stale.
+
+    :param csv_path: The path to the csv file.
+        :type csv_path: str
+
+    :return: The modification time and size of the file.
+        :rtype: dict
+    """
+    stat = os.stat(csv_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _clean(value: str) -> str:
+    """
+    Clean a csv field, replacing the null sentinels with empty strings.
+
+    :param value: The field to clean.
+        :type value: str
+
+    :return: The cleaned field.
+        :rtype: str
+    """
+    value = value.strip()
+    return "" if value in NULL_VALUES else value
+
+
+def _to_float(value: str) -> float:
+    """
+    Convert a csv field to a float, or NaN if it isn't a number.
+
+    :param value: The field to convert.
+        :type value: str
+
+    :return: The number.
+        :rtype: float
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def _layout(code_columns=(), float_columns=(), layout=None) -> dict:
+    """
+    Get the layout stamp of a compiled file: how its columns are stored and how its indexes were built,
+    so a file compiled with other options is recompiled like a stale one.
+
+    :param code_columns: The indexes of the columns stored as fixed-width codes.
+        :type code_columns: tuple[int, ...]
+    :param float_columns: The indexes of the columns also stored as float32 arrays.
+        :type float_columns: tuple[int, ...]
+    :param layout: What else the caller's indexes depend on, JSON-serializable.
+        :type layout: dict | None
+
+    :return: The layout stamp, as stored in the metadata.
+        :rtype: dict
+    """
+    return json.loads(json.dumps({"code_columns": list(code_columns), "float_columns": list(float_columns),
+                                  "indexes": layout}))
+
+
+def compile_csv(csv_path: str, code_columns=(), float_columns=(), indexes=None, layout=None) -> bytes:
+    """
+    Compile a csv file into the columnar binary format.
+
+    Layout: a header (magic, version, metadata length), a JSON metadata block, then 8-byte aligned sections:
+    one offset array (uint32, rows + 1 entries) per string column into a shared utf-8 string pool,
+    one fixed-width null-padded block per code column, one float32 array per float column, and per index
+    a sorted key offset array into the pool, a start array into its row ids and the row ids (all uint32).
+    Float columns are also kept in the string pool so rows round-trip.
+
+    :param csv_path: The path to the csv file.
+        :type csv_path: str
+    :param code_columns: The indexes of the columns to store as fixed-width codes.
+        :type code_columns: tuple[int, ...]
+    :param float_columns: The indexes of the columns to also store as float32 arrays.
+        :type float_columns: tuple[int, ...]
+    :param indexes: Builds the indexes to store from the rows, as {name: {key: [row ids]}}.
+        :type indexes: Callable[[list[list[str]]], dict[str, dict[str, list[int]]]] | None
+    :param layout: What the indexes depend on besides the rows, stored in the layout stamp.
+        :type layout: dict | None
+
+    :return: The compiled file.
+        :rtype: bytes
+    """
+    stamp = _source_stamp(csv_path)
+    with open(csv_path, 'r', encoding="utf-8", errors="replace", newline="") as file:
+        rows = [[_clean(value) for value in row] for row in csv.reader(file)]
+    n_cols = max((len(row) for row in rows), default=0)
+    for row in rows:
+        row.extend([""] * (n_cols - len(row)))
+
+    sections = []
+    targets = []
+    columns = []
+    pool = bytearray()
+    for column in range(n_cols):
+        encoded = [row[column].encode("utf-8") for row in rows]
+        if column in code_columns:
+            width = max((len(value) for value in encoded), default=0) or 1
+            sections.append(b"".join(value.ljust(width, b"\0") for value in encoded))
+            columns.append({"kind": "code", "width": width})
+        else:
+            offsets = array("I", [len(pool)])
+            for value in encoded:
+                pool += value
+                offsets.append(len(pool))
+            sections.append(offsets.tobytes())
+            columns.append({"kind": "str"})
+        targets.append((columns[-1], "offset"))
+    floats = {}
+    for column in float_columns:
+        sections.append(array("f", [_to_float(row[column]) for row in rows]).tobytes())
+        floats[str(column)] = None
+        targets.append((floats, str(column)))
+    index_meta = {}
+    for name, index in (indexes(rows) if indexes is not None else {}).items():
+        keys = sorted(index, key=lambda key: key.encode("utf-8"))
+        offsets = array("I", [len(pool)])
+        starts = array("I", [0])
+        ids = array("I")
+        for key in keys:
+            pool += key.encode("utf-8")
+            offsets.append(len(pool))
+            ids.extend(index[key])
+            starts.append(len(ids))
+        index_meta[name] = {"keys": len(keys)}
+        for part, section in (("offset", offsets), ("starts", starts), ("ids", ids)):
+            sections.append(section.tobytes())
+            targets.append((index_meta[name], part))
+    sections.append(bytes(pool))
+
+    meta = {
+        "rows": len(rows),
+        "source": stamp,
+        "layout": _layout(code_columns, float_columns, layout),
+        "byteorder": sys.byteorder,
+        "columns": columns,
+        "floats": floats,
+        "indexes": index_meta,
+        "pool": None
+    }
+    targets.append((meta, "pool"))
+    # Offsets depend on the metadata length and vice versa, so lay out until the length settles
+    meta_len = None
+    meta_bytes = json.dumps(meta).encode("utf-8")
+    while len(meta_bytes) != meta_len:
+        meta_len = len(meta_bytes)
+        position = _align(HEADER.size + meta_len)
+        for (target, key), section in zip(targets, sections):
+            target[key] = position
+            position = _align(position + len(section))
+        meta_bytes = json.dumps(meta).encode("utf-8")
+
+    out = bytearray(HEADER.pack(MAGIC, VERSION, len(meta_bytes)) + meta_bytes)
+    for section in sections:
+        out += b"\0" * (_align(len(out)) - len(out))
+        out += section
+    return bytes(out)
+
+
+def _align(position: int) -> int:
+    """
+    Round a position up to the section alignment.
+
+    :param position: The position.
+        :type position: int
+
+    :return: The aligned position.
+        :rtype: int
+    """
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class Table(Sequence):
+    """
+    A compiled csv file, read straight from a memory map (or an in-memory buffer).
+    Indexing a table decodes a single row, so nothing is parsed or copied up front.
+
+    :ivar meta: The metadata of the compiled file.
+        :type meta: dict
+    """
+
+    def __init__(self, buffer):
+        """
+        Initialize the Table class.
+
+        :param buffer: The compiled file.
+            :type buffer: mmap.mmap | bytes
+        """
+        self._buffer = buffer
+        view = memoryview(buffer)
+        self.meta = _parse_meta(bytes(view[:HEADER.size]), lambda size: bytes(view[HEADER.size:HEADER.size + size]))
+        self._view = view
+        self._indexes = {}
+        self._rows = self.meta["rows"]
+        self._pool = view[self.meta["pool"]:]
+        self._columns = []
+        for column in self.meta["columns"]:
+            if column["kind"] == "code":
+                size = self._rows * column["width"]
+                self._columns.append((column["width"], view[column["offset"]:column["offset"] + size]))
+            else:
+                size = (self._rows + 1) * 4
+                self._columns.append((None, view[column["offset"]:column["offset"] + size].cast("I")))
+
+    def __len__(self):
+        """
+        Get the number of rows.
+
+        :return: The number of rows.
+            :rtype: int
+        """
+        return self._rows
+
+    def __getitem__(self, row_id: int) -> tuple[str, ...]:
+        """
+        Get a row.
+
+        :param row_id: The index of the row.
+            :type row_id: int
+
+        :return: The row.
+            :rtype: tuple[str, ...]
+        """
+        if row_id < 0:
+            row_id += self._rows
+        if not 0 <= row_id < self._rows:
+            raise IndexError("Row index out of range")
+        return tuple(self.value(row_id, column) for column in range(len(self._columns)))
+
+    def value(self, row_id: int, column: int) -> str:
+        """
+        Get a single field.
+
+        :param row_id: The index of the row.
+            :type row_id: int
+        :param column: The index of the column.
+            :type column: int
+
+        :return: The field.
+            :rtype: str
+        """
+        width, data = self._columns[column]
+        if width is not None:
+            return bytes(data[row_id * width:(row_id + 1) * width]).rstrip(b"\0").decode("utf-8", "replace")
+        return bytes(self._pool[data[row_id]:data[row_id + 1]]).decode("utf-8", "replace")
+
+    def column_values(self, column: int) -> list[str]:
+        """
+        Get every field of a column.
+
+        :param column: The index of the column.
+            :type column: int
+
+        :return: The fields, in row order.
+            :rtype: list[str]
+        """
+        width, data = self._columns[column]
+        if width is not None:
+            raw = bytes(data)
+            return [raw[i:i + width].rstrip(b"\0").decode("utf-8", "replace") for i in range(0, len(raw), width)]
+        pool = bytes(self._pool[:data[self._rows]])
+        return [pool[data[i]:data[i + 1]].decode("utf-8", "replace") for i in range(self._rows)]
+
+    def floats(self, column: int) -> memoryview:
+        """
+        Get the float32 array of a column, without copying it.
+
+        :param column: The index of the column.
+            :type column: int
+
+        :return: The floats, in row order.
+            :rtype: memoryview
+        """
+        offset = self.meta["floats"][str(column)]
+        return memoryview(self._buffer)[offset:offset + self._rows * 4].cast("f")
+
+    def index(self, name: str) -> "MappedIndex | None":
+        """
+        Get one of the stored indexes, read straight from the buffer.
+
+        :param name: The name of the index.
+            :type name: str
+
+        :return: The index, or None if the table has no index of that name.
+            :rtype: MappedIndex | None
+        """
+        index = self._indexes.get(name)
+        if index is None:
+            meta = self.meta["indexes"].get(name)
+            if meta is None:
+                return None
+            keys = meta["keys"]
+            offsets = self._view[meta["offset"]:meta["offset"] + (keys + 1) * 4].cast("I")
+            starts = self._view[meta["starts"]:meta["starts"] + (keys + 1) * 4].cast("I")
+            ids = self._view[meta["ids"]:meta["ids"] + starts[keys] * 4].cast("I")
+            index = self._indexes[name] = MappedIndex(self._pool, offsets, starts, ids)
+        return index
+
+    def is_stale(self, csv_path: str, code_columns=(), float_columns=(), layout=None) -> bool:
+        """
+        Check whether the csv file changed since this table was compiled from it, or the table was compiled
+        with another layout.
+
+        :param csv_path: The path to the csv file.
+            :type csv_path: str
+        :param code_columns: The indexes of the columns that should be stored as fixed-width codes.
+            :type code_columns: tuple[int, ...]
+        :param float_columns: The indexes of the columns that should also be stored as float32 arrays.
+            :type float_columns: tuple[int, ...]
+        :param layout: What the indexes should have been built with, see compile_csv().
+            :type layout: dict | None
+
+        :return: Whether the table is stale.
+            :rtype: bool
+        """
+        return _is_stale(self.meta, csv_path, _layout(code_columns, float_columns, layout))
+
+
+class MappedIndex(Mapping):
+    """
+    A read-only index stored in a compiled table, mapping each key to the ids of its rows.
+    The keys are kept sorted in the table's string pool and looked up by binary search, so nothing is
+    built in memory when the table is loaded.
+    """
+
+    def __init__(self, pool: memoryview, offsets: memoryview, starts: memoryview, ids: memoryview):
+        """
+        Initialize the MappedIndex class.
+
+        :param pool: The table's string pool.
+            :type pool: memoryview
+        :param offsets: The pool offsets of the sorted keys (keys + 1 entries).
+            :type offsets: memoryview
+        :param starts: Where the row ids of each key start in ids (keys + 1 entries).
+            :type starts: memoryview
+        :param ids: The row ids of every key, one key after the other.
+            :type ids: memoryview
+        """
+        self._pool = pool
+        self._offsets = offsets
+        self._starts = starts
+        self._ids = ids
+        self._keys = len(offsets) - 1
+
+    def _key(self, position: int) -> bytes:
+        """
+        Get the encoded key at a position.
+
+        :param position: The position of the key.
+            :type position: int
+
+        :return: The key, utf-8 encoded.
+            :rtype: bytes
+        """
+        return bytes(self._pool[self._offsets[position]:self._offsets[position + 1]])
+
+    def __getitem__(self, key: str) -> memoryview:
+        """
+        Get the row ids of a key.
+
+        :param key: The key.
+            :type key: str
+
+        :return: The row ids, in the order they were indexed.
+            :rtype: memoryview
+        """
+        encoded = key.encode("utf-8")
+        low, high = 0, self._keys
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._keys or self._key(low) != encoded:
+            raise KeyError(key)
+        return self._ids[self._starts[low]:self._starts[low + 1]]
+
+    def __iter__(self):
+        return (self._key(position).decode("utf-8") for position in range(self._keys))
+
+    def __len__(self):
+        return self._keys
+
+    def items(self):
+        """
+        Get every key and its row ids, in key order, without looking each key up.
+
+        :return: The keys and their row ids.
+            :rtype: Iterator[tuple[str, memoryview]]
+        """
+        return ((self._key(position).decode("utf-8"), self._ids[self._starts[position]:self._starts[position + 1]])
+                for position in range(self._keys))
+
+
+def _parse_meta(header: bytes, read) -> dict:
+    """
+    Parse the metadata of a compiled file.
+
+    :param header: The header of the file.
+        :type header: bytes
+    :param read: Reads the given number of bytes of metadata, which follow the header.
+        :type read: Callable[[int], bytes]
+
+    :return: The metadata.
+        :rtype: dict
+
+    :raises ValueError: If the file isn't a compiled table of this version and byte order.
+    """
+    if len(header) < HEADER.size:
+        raise ValueError("Not a compiled table")
+    magic, version, meta_len = HEADER.unpack_from(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a compiled table, or an outdated one")
+    meta = json.loads(read(meta_len))
+    if meta["byteorder"] != sys.byteorder:
+        raise ValueError("The compiled table was built on a machine with a different byte order")
+    return meta
+
+
+def _is_stale(meta: dict, csv_path: str, layout: dict) -> bool:
+    """
+    Check whether a compiled file is stale.
+
+    :param meta: The metadata of the compiled file.
+        :type meta: dict
+    :param csv_path: The path to the csv file.
+        :type csv_path: str
+    :param layout: The layout stamp the file should have, from _layout().
+        :type layout: dict
+
+    :return: Whether the file is stale.
+        :rtype: bool
+    """
+    return meta["source"] != _source_stamp(csv_path) or meta.get("layout") != layout
+
+
+def _open(bin_path: str, csv_path: str | None = None, layout: dict | None = None) -> Table | None:
+    """
+    Memory-map a compiled file.
+    When a csv path is given, the metadata is read first and a stale file is not mapped at all.
+
+    :param bin_path: The path to the compiled file.
+        :type bin_path: str
+    :param csv_path: The path to the csv file it was compiled from, to check it isn't stale.
+        :type csv_path: str | None
+    :param layout: The layout stamp the file should have, from _layout().
+        :type layout: dict | None
+
+    :return: The table, or None if it is stale.
+        :rtype: Table | None
+    """
+    with open(bin_path, "rb") as file:
+        if csv_path is not None:
+            if _is_stale(_parse_meta(file.read(HEADER.size), file.read), csv_path, layout):
+                return None
+        return Table(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def load(csv_path: str, code_columns=(), float_columns=(), indexes=None, layout=None) -> Table:
+    """
+    Load the compiled form of a csv file, (re)compiling it first if it is missing, older than the csv,
+    or compiled with another layout. Only an up-to-date file is memory-mapped.
+    The file is written atomically so concurrent workers never see a partial table, and if it can't be
+    written at all the table is served from memory instead.
+
+    :param csv_path: The path to the csv file.
+        :type csv_path: str
+    :param code_columns: The indexes of the columns to store as fixed-width codes.
+        :type code_columns: tuple[int, ...]
+    :param float_columns: The indexes of the columns to also store as float32 arrays.
+        :type float_columns: tuple[int, ...]
+    :param indexes: Builds the indexes to store from the rows, see compile_csv().
+        :type indexes: Callable[[list[list[str]]], dict[str, dict[str, list[int]]]] | None
+    :param layout: What the indexes depend on besides the rows, see compile_csv().
+        :type layout: dict | None
+
+    :return: The table.
+        :rtype: Table
+    """
+    bin_path = binary_path(csv_path)
+    try:
+        table = _open(bin_path, csv_path, _layout(code_columns, float_columns, layout))
+        if table is not None:
+            return table
+    except (OSError, ValueError):
+        pass
+
+    data = compile_csv(csv_path, code_columns, float_columns, indexes, layout)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(bin_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, bin_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return _open(bin_path)
+    except OSError:
+        return Table(data)
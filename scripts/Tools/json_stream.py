@@ -0,0 +1,171 @@
+# Description: Incremental JSON parsing, for acting on the items of a JSON array before the whole document arrives.
+import codecs
+import json
+import re
+
+_TOKENS = re.compile(r'[\[\]{}",:]')
+_SEPARATORS = re.compile(r'[\s,]*')
+_SCALAR_ENDS = " \t\n\r,]"
+
+
+class ArrayStreamParser:
+    """
+    An incremental parser for the items of one JSON array.
+    Feed it the document chunk by chunk, and it returns each item of the target array as soon as the item is
+    complete. Tokens are only scanned until the target array opens; from there each item is decoded by the json
+    module in one go, and only the text of the current item is kept in memory.
+
+    :ivar key: The key of the target array in the top-level object, or None if the document is the array itself.
+        :type key: str | None
+    :ivar done: Whether the target array has closed.
+        :type done: bool
+    """
+
+    def __init__(self, key: str | None = None):
+        """
+        Initialize the ArrayStreamParser class.
+
+        :param key: The key of the target array in the top-level object, or None if the document is the array itself.
+            :type key: str | None
+        """
+        self.key = key
+        self.done = False
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = 0
+        self._last_string = None
+        self._pending_key = None
+        self._in_array = False
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk: str) -> list:
+        """
+        Parse the next chunk of the document.
+
+        :param chunk: The next chunk.
+            :type chunk: str
+
+        :return: The items completed in this chunk, parsed.
+            :rtype: list
+        """
+        if self.done:
+            return []
+        buffer = self._buffer + chunk
+        i = self._pos
+        if not self._in_array:
+            i = self._find_array(buffer, i)
+            if not self._in_array:
+                keep = min(i, self._string_start) if self._in_string else i
+                self._string_start -= keep
+                self._buffer = buffer[keep:]
+                self._pos = i - keep
+                return []
+
+        items = []
+        while True:
+            i = _SEPARATORS.match(buffer, i).end()
+            if i == len(buffer):
+                break
+            if buffer[i] == "]":
+                self.done = True
+                self._buffer = ""
+                return items
+            try:
+                item, end = self._decoder.raw_decode(buffer, i)
+            except json.JSONDecodeError:
+                break
+            # A number is only complete once something follows it, the next chunk may add digits
+            if buffer[i] not in '{["' and (end == len(buffer) or buffer[end] not in _SCALAR_ENDS):
+                break
+            items.append(item)
+            i = end
+        self._buffer = buffer[i:]
+        self._pos = 0
+        return items
+
+    def _find_array(self, buffer: str, i: int) -> int:
+        """
+        Scan the tokens of the document up to the opening of the target array.
+
+        :param buffer: The buffered document.
+            :type buffer: str
+        :param i: The position to scan from.
+            :type i: int
+
+        :return: The position scanned up to, just after the "[" if the target array opened.
+            :rtype: int
+        """
+        while i < len(buffer):
+            if self._in_string:
+                end = buffer.find('"', i)
+                if end == -1:
+                    return len(buffer)
+                backslashes = 0
+                while buffer[end - 1 - backslashes] == "\\":
+                    backslashes += 1
+                i = end + 1
+                if backslashes % 2 == 0:
+                    self._in_string = False
+                    self._last_string = buffer[self._string_start:end]
+                continue
+            match = _TOKENS.search(buffer, i)
+            if match is None:
+                return len(buffer)
+            token = match.group()
+            i = match.end()
+            if token == '"':
+                self._in_string = True
+                self._string_start = i
+            elif token == ":":
+                if self._depth == 1:
+                    self._pending_key = self._last_string
+            elif token == ",":
+                if self._depth == 1:
+                    self._pending_key = None
+            elif token in "[{":
+                if token == "[" and self._is_target():
+                    self._in_array = True
+                    return i
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth <= 0:
+                    # The top-level value closed without the target array
+                    self.done = True
+                    return len(buffer)
+        return i
+
+    def _is_target(self) -> bool:
+        """
+        Check whether an array opening at the current position is the target array.
+
+        :return: Whether it is the target array.
+            :rtype: bool
+        """
+        if self.key is None:
+            return self._depth == 0
+        return self._depth == 1 and self._pending_key == self.key
+
+
+def iter_array(chunks, key: str | None = None):
+    """
+    Iterate over the items of a JSON array as its document streams in.
+
+    :param chunks: The chunks of the document.
+        :type chunks: Iterable[str | bytes]
+    :param key: The key of the target array in the top-level object, or None if the document is the array itself.
+        :type key: str | None
+
+    :return: The items of the array, parsed, as soon as each one closes.
+        :rtype: Iterator
+    """
+    parser = ArrayStreamParser(key)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        yield from parser.feed(chunk)
+        if parser.done:
+            return
@@ -0,0 +1,288 @@
+# Description: Token-bucket rate limits for the upstream APIs, shared by every process on the machine through SQLite.
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+RATE_LIMIT_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                                                "rate_limits.sqlite3"))
+
+# Quotas of each upstream's plan: requests per second, burst size, and requests per (UTC) day
+RATE_LIMITS = {
+    "amadeus": {"rate": 10, "capacity": 10},
+    "geocoding": {"rate": 1, "capacity": 1, "daily_limit": 2500},
+    "meteoblue": {"rate": 10, "capacity": 10},
+    "gemini": {"rate": 15 / 60, "capacity": 15, "daily_limit": 1500}
+}
+# How long a caller may queue for a token before giving up, in seconds
+MAX_WAIT = 10
+DAY = 24 * 60 * 60
+
+
+class RateLimited(Exception):
+    """
+    Raised when a call can't be made within its deadline without exceeding the upstream's quota.
+
+    :ivar upstream: The name of the upstream.
+        :type upstream: str
+    :ivar reason: Why the call can't be made.
+        :type reason: str
+    :ivar retry_after: How many seconds until the call could be made.
+        :type retry_after: float
+    """
+
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        """
+        Initialize the RateLimited class.
+
+        :param upstream: The name of the upstream.
+            :type upstream: str
+        :param reason: Why the call can't be made.
+            :type reason: str
+        :param retry_after: How many seconds until the call could be made.
+            :type retry_after: float
+        """
+        super().__init__(f"{upstream} is rate limited: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    A token bucket stored in a local SQLite file, so every worker process draws from the same quota.
+    A caller reserves its tokens in one transaction, even if the bucket is empty, and then sleeps until they are
+    refilled: callers queue in the order they arrive, and nobody polls the file. A caller whose wait would exceed
+    its deadline, or who would exceed the daily quota, is turned away with RateLimited without reserving anything.
+    Database errors let the call through, so a locked or unwritable file can't stop the searches.
+
+    :ivar name: The name of the upstream.
+        :type name: str
+    :ivar rate: The tokens refilled per second.
+        :type rate: float
+    :ivar capacity: The most tokens the bucket holds, i.e. the largest burst.
+        :type capacity: float
+    :ivar daily_limit: The most tokens that can be taken per UTC day, or None for no daily quota.
+        :type daily_limit: int | None
+    :ivar max_wait: How long a caller may queue by default, in seconds.
+        :type max_wait: float
+    :ivar path: The path to the SQLite file.
+        :type path: str
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float, daily_limit: int | None = None,
+                 max_wait: float = MAX_WAIT, path: str = RATE_LIMIT_PATH):
+        """
+        Initialize the TokenBucket class.
+
+        :param name: The name of the upstream.
+            :type name: str
+        :param rate: The tokens refilled per second.
+            :type rate: float
+        :param capacity: The most tokens the bucket holds.
+            :type capacity: float
+        :param daily_limit: The most tokens that can be taken per UTC day, or None for no daily quota.
+            :type daily_limit: int | None
+        :param max_wait: How long a caller may queue by default, in seconds.
+            :type max_wait: float
+        :param path: The path to the SQLite file.
+            :type path: str
+        """
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.daily_limit = daily_limit
+        self.max_wait = max_wait
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Get this thread's connection to the SQLite file, creating the table the first time.
+
+        :return: The connection.
+            :rtype: sqlite3.Connection
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # The buckets are only worth the last few seconds, so there is no need to sync every commit to disk
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS buckets ("
+                               "name TEXT PRIMARY KEY, "
+                               "tokens REAL NOT NULL, "
+                               "updated_at REAL NOT NULL, "
+                               "day INTEGER NOT NULL, "
+                               "day_count INTEGER NOT NULL)")
+            self._local.connection = connection
+        return connection
+
+    def _level(self, row, now: float) -> tuple[float, int]:
+        """
+        Get the state of the bucket at a point in time.
+
+        :param row: The stored state (tokens, updated_at, day, day_count), or None if the bucket was never used.
+            :type row: tuple | None
+        :param now: The point in time, as a Unix timestamp.
+            :type now: float
+
+        :return: The tokens in the bucket (negative while callers are queued), and the tokens taken today.
+            :rtype: tuple[float, int]
+        """
+        if row is None:
+            return self.capacity, 0
+        tokens = min(self.capacity, row[0] + (now - row[1]) * self.rate)
+        return tokens, row[3] if row[2] == int(now // DAY) else 0
+
+    def _reserve(self, tokens: int, max_wait: float) -> float:
+        """
+        Reserve tokens.
+
+        :param tokens: The number of tokens.
+            :type tokens: int
+        :param max_wait: How long the caller may wait for them, in seconds.
+            :type max_wait: float
+
+        :return: How long the caller must wait before using them, in seconds.
+            :rtype: float
+
+        :raises RateLimited: If they can't be had within max_wait, or would exceed the daily quota.
+        """
+        try:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error:
+            return 0.0
+        try:
+            now = time.time()
+            row = connection.execute("SELECT tokens, updated_at, day, day_count FROM buckets WHERE name = ?",
+                                     (self.name,)).fetchone()
+            level, day_count = self._level(row, now)
+            day = int(now // DAY)
+            if self.daily_limit is not None and day_count + tokens > self.daily_limit:
+                raise RateLimited(self.name, "the daily quota is used up", (day + 1) * DAY - now)
+            wait = max(0.0, (tokens - level) / self.rate)
+            if wait > max_wait:
+                raise RateLimited(self.name, f"the queue is {wait:.1f}s long", wait)
+            connection.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated_at, day, day_count) "
+                               "VALUES (?, ?, ?, ?, ?)", (self.name, level - tokens, now, day, day_count + tokens))
+            connection.execute("COMMIT")
+            return wait
+        except sqlite3.Error:
+            _rollback(connection)
+            return 0.0
+        except BaseException:
+            _rollback(connection)
+            raise
+
+    def acquire(self, tokens: int = 1, max_wait: float | None = None) -> float:
+        """
+        Take tokens, queueing until they are available.
+
+        :param tokens: The number of tokens, i.e. of requests about to be made.
+            :type tokens: int
+        :param max_wait: How long to queue at most, in seconds, self.max_wait if None.
+            :type max_wait: float | None
+
+        :return: How long the caller queued, in seconds.
+            :rtype: float
+
+        :raises RateLimited: If the tokens can't be had within max_wait, or would exceed the daily quota.
+        """
+        wait = self._reserve(tokens, self.max_wait if max_wait is None else max_wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int = 1, max_wait: float | None = None) -> float:
+        """
+        Async version of acquire(), queueing without blocking the event loop: the reservation runs in a thread,
+        since it may wait on another process' transaction.
+
+        :param tokens: The number of tokens, i.e. of requests about to be made.
+            :type tokens: int
+        :param max_wait: How long to queue at most, in seconds, self.max_wait if None.
+            :type max_wait: float | None
+
+        :return: How long the caller queued, in seconds.
+            :rtype: float
+
+        :raises RateLimited: If the tokens can't be had within max_wait, or would exceed the daily quota.
+        """
+        wait = await asyncio.to_thread(self._reserve, tokens, self.max_wait if max_wait is None else max_wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def utilization(self) -> dict:
+        """
+        Get the current use of the quota, across every process.
+
+        :return: The tokens left, the share of the burst in use, how long a new caller would queue,
+            and the tokens taken today against the daily quota.
+            :rtype: dict
+        """
+        try:
+            row = self._connection().execute("SELECT tokens, updated_at, day, day_count FROM buckets WHERE name = ?",
+                                             (self.name,)).fetchone()
+        except sqlite3.Error:
+            row = None
+        level, day_count = self._level(row, time.time())
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "tokens": max(0.0, level),
+            "utilization": min(1.0, (self.capacity - level) / self.capacity),
+            "queue_seconds": max(0.0, -level / self.rate),
+            "today": day_count,
+            "daily_limit": self.daily_limit,
+            "daily_utilization": day_count / self.daily_limit if self.daily_limit else None
+        }
+
+
+def _rollback(connection: sqlite3.Connection):
+    """
+    Roll back the open transaction of a connection, if any.
+
+    :param connection: The connection.
+        :type connection: sqlite3.Connection
+    """
+    try:
+        connection.execute("ROLLBACK")
+    except sqlite3.Error:
+        pass
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_limiter(name: str) -> TokenBucket | None:
+    """
+    Get the rate limiter of an upstream, created from RATE_LIMITS on first use.
+
+    :param name: The name of the upstream.
+        :type name: str
+
+    :return: The limiter, or None if the upstream has no quota.
+        :rtype: TokenBucket | None
+    """
+    if name not in RATE_LIMITS:
+        return None
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(name)
+        if limiter is None:
+            limiter = _LIMITERS[name] = TokenBucket(name, **RATE_LIMITS[name])
+        return limiter
+
+
+def utilization() -> dict:
+    """
+    Get the current use of every upstream's quota.
+
+    :return: TokenBucket.utilization() of each upstream, by name.
+        :rtype: dict[str, dict]
+    """
+    return {name: get_limiter(name).utilization() for name in RATE_LIMITS}
@@ -0,0 +1,610 @@
+# Description: Failure isolation for the upstream APIs: circuit breakers, a shared retry budget and jittered retries.
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from Tools import rate_limit
+
+# Statuses that mean the upstream is overloaded or failing, rather than that the request was wrong
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Per-upstream settings, overriding the defaults of Upstream
+UPSTREAM_CONFIG = {
+    "amadeus": {"max_attempts": 3, "failure_threshold": 5, "reset_timeout": 30},
+    "meteoblue": {"max_attempts": 2, "failure_threshold": 3, "reset_timeout": 60},
+    "geocoding": {"max_attempts": 2, "failure_threshold": 3, "reset_timeout": 60},
+    "gemini": {"max_attempts": 2, "failure_threshold": 3, "reset_timeout": 30}
+}
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised when an upstream can't be used right now: its circuit is open, it asked to be left alone
+    (Retry-After), or it kept failing until the retries ran out.
+
+    :ivar upstream: The name of the upstream.
+        :type upstream: str
+    :ivar retry_after: How many seconds until it is worth trying again, if known.
+        :type retry_after: float | None
+    """
+
+    def __init__(self, upstream: str, reason: str, retry_after: float | None = None):
+        """
+        Initialize the UpstreamUnavailable class.
+
+        :param upstream: The name of the upstream.
+            :type upstream: str
+        :param reason: Why it is unavailable.
+            :type reason: str
+        :param retry_after: How many seconds until it is worth trying again, if known.
+            :type retry_after: float | None
+        """
+        super().__init__(f"{upstream} is unavailable: {reason}")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker: after failure_threshold failures in a row the circuit opens and calls fail fast for
+    reset_timeout seconds, then a single trial call is let through (half-open) and its outcome closes or reopens it.
+
+    :ivar failure_threshold: The number of failures in a row that opens the circuit.
+        :type failure_threshold: int
+    :ivar reset_timeout: How long the circuit stays open, in seconds.
+        :type reset_timeout: float
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        Initialize the CircuitBreaker class.
+
+        :param failure_threshold: The number of failures in a row that opens the circuit.
+            :type failure_threshold: int
+        :param reset_timeout: How long the circuit stays open, in seconds.
+            :type reset_timeout: float
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        """
+        The state of the circuit.
+
+        :return: "closed", "open" or "half-open".
+            :rtype: str
+        """
+        with self._lock:
+            if self._open_until == 0.0:
+                return "closed"
+            return "open" if time.monotonic() < self._open_until or self._trial else "half-open"
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may go through, claiming the trial call if the circuit is half-open.
+
+        :return: Whether the call may go through.
+            :rtype: bool
+        """
+        return self.admit() is not None
+
+    def admit(self) -> str | None:
+        """
+        Let a call through if the circuit allows it, claiming the trial call if the circuit is half-open.
+        The caller of the trial must settle it with record_success(), record_failure() or release().
+
+        :return: "closed" for a normal call, "trial" for the trial call, or None if the call may not go through.
+            :rtype: str | None
+        """
+        with self._lock:
+            if self._open_until == 0.0:
+                return "closed"
+            if time.monotonic() < self._open_until or self._trial:
+                return None
+            self._trial = True
+            return "trial"
+
+    def retry_after(self) -> float | None:
+        """
+        Get how long the circuit stays open.
+
+        :return: The seconds left, or None if it isn't open.
+            :rtype: float | None
+        """
+        with self._lock:
+            left = self._open_until - time.monotonic()
+            return left if self._open_until and left > 0 else None
+
+    def record_success(self):
+        """
+        Record a successful call, closing the circuit.
+        """
+        with self._lock:
+            self._failures = 0
+            self._open_until = 0.0
+            self._trial = False
+
+    def record_failure(self):
+        """
+        Record a failed call, opening the circuit if it was the trial call or one failure too many.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._open_until = time.monotonic() + self.reset_timeout
+                self._trial = False
+
+    def hold(self, seconds: float):
+        """
+        Open the circuit for a while, e.g. for an upstream's Retry-After.
+
+        :param seconds: How long to keep it open.
+            :type seconds: float
+        """
+        with self._lock:
+            self._open_until = max(self._open_until, time.monotonic() + seconds)
+            self._trial = False
+
+    def release(self):
+        """
+        Give back the trial call claimed by admit() when it ended without telling anything about the upstream,
+        e.g. it was rate limited or cancelled, so the next call can be the trial instead.
+        """
+        with self._lock:
+            self._trial = False
+
+
+class RetryBudget:
+    """
+    A budget that caps retries to a fraction of the calls made, shared by every upstream, so retries can't
+    multiply the load on an upstream that is already failing.
+    Each call deposits ratio tokens and each retry spends one; a small steady refill lets a quiet process
+    still retry now and then.
+
+    :ivar ratio: The tokens deposited per call, i.e. the retries allowed per call in the long run.
+        :type ratio: float
+    :ivar min_per_second: The tokens refilled per second regardless of calls.
+        :type min_per_second: float
+    :ivar max_tokens: The most tokens that can be saved up.
+        :type max_tokens: float
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_tokens: float = 20):
+        """
+        Initialize the RetryBudget class.
+
+        :param ratio: The tokens deposited per call.
+            :type ratio: float
+        :param min_per_second: The tokens refilled per second regardless of calls.
+            :type min_per_second: float
+        :param max_tokens: The most tokens that can be saved up.
+            :type max_tokens: float
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+
+    def _refill(self, deposit: float = 0.0):
+        """
+        Add the steady refill since the last update, plus a deposit. Must be called with the lock held.
+
+        :param deposit: The tokens to deposit.
+            :type deposit: float
+        """
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second + deposit)
+        self._updated = now
+
+    def deposit(self):
+        """
+        Record a call.
+        """
+        with self._lock:
+            self._refill(self.ratio)
+
+    def try_spend(self) -> bool:
+        """
+        Take a token for a retry.
+
+        :return: Whether there was one, i.e. whether the retry may be made.
+            :rtype: bool
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+RETRY_BUDGET = RetryBudget()
+
+
+def retry_after_seconds(value) -> float | None:
+    """
+    Parse a Retry-After header, given in seconds or as an HTTP date.
+
+    :param value: The header.
+        :type value: str | None
+
+    :return: The seconds to wait, or None if there is no valid header.
+        :rtype: float | None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _status(outcome) -> int | None:
+    """
+    Get the HTTP status of a call's response or exception, if it has one.
+
+    :param outcome: The response, or the exception raised.
+        :type outcome: Any
+
+    :return: The status, or None.
+        :rtype: int | None
+    """
+    for name in ("status_code", "code"):
+        status = getattr(outcome, name, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(outcome, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _transport_error(error: BaseException) -> bool:
+    """
+    Check whether an exception is a network failure (connection, timeout) worth retrying.
+
+    :param error: The exception.
+        :type error: BaseException
+
+    :return: Whether it is.
+        :rtype: bool
+    """
+    if isinstance(error, (OSError, TimeoutError)):
+        return True
+    # httpx' network errors don't derive from OSError, match them by name so httpx needn't be imported
+    return any(cls.__name__ in ("TransportError", "TimeoutException") for cls in type(error).__mro__)
+
+
+def _retry_after(outcome) -> float | None:
+    """
+    Get the Retry-After of a call's response or exception, if it has one.
+
+    :param outcome: The response, or the exception raised.
+        :type outcome: Any
+
+    :return: The seconds to wait, or None.
+        :rtype: float | None
+    """
+    headers = getattr(outcome, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(outcome, "response", None), "headers", None)
+    return retry_after_seconds(headers.get("Retry-After")) if headers is not None else None
+
+
+class Upstream:
+    """
+    The resilience policy of one upstream API.
+    Calls fail fast with UpstreamUnavailable while its circuit is open. Network errors and overloaded/failing
+    responses (RETRY_STATUSES) count as failures and are retried with full-jitter exponential backoff, up to
+    max_attempts and only while the shared retry budget allows. A Retry-After is honoured: a short one is waited
+    out, a long one holds the circuit open for every caller.
+    Every attempt, retries included, first queues for a token of the upstream's rate limiter, if it has one.
+
+    :ivar name: The name of the upstream.
+        :type name: str
+    :ivar breaker: The circuit breaker.
+        :type breaker: CircuitBreaker
+    :ivar budget: The retry budget.
+        :type budget: RetryBudget
+    :ivar max_attempts: The most attempts per call, the first included.
+        :type max_attempts: int
+    :ivar base_delay: The backoff before the first retry is drawn from [0, base_delay], in seconds.
+        :type base_delay: float
+    :ivar max_delay: The longest wait before a retry, in seconds; a longer Retry-After gives up instead.
+        :type max_delay: float
+    :ivar limiter: The rate limiter of the upstream, or None.
+        :type limiter: Tools.rate_limit.TokenBucket | None
+    """
+
+    def __init__(self, name: str, max_attempts: int = 3, base_delay: float = 0.2, max_delay: float = 5,
+                 failure_threshold: int = 5, reset_timeout: float = 30, budget: RetryBudget | None = None,
+                 limiter: rate_limit.TokenBucket | None = None):
+        """
+        Initialize the Upstream class.
+
+        :param name: The name of the upstream.
+            :type name: str
+        :param max_attempts: The most attempts per call, the first included.
+            :type max_attempts: int
+        :param base_delay: The backoff before the first retry is drawn from [0, base_delay], in seconds.
+            :type base_delay: float
+        :param max_delay: The longest wait before a retry, in seconds.
+            :type max_delay: float
+        :param failure_threshold: The number of failures in a row that opens the circuit.
+            :type failure_threshold: int
+        :param reset_timeout: How long the circuit stays open, in seconds.
+            :type reset_timeout: float
+        :param budget: The retry budget, RETRY_BUDGET if None.
+            :type budget: RetryBudget | None
+        :param limiter: The rate limiter of the upstream, or None.
+            :type limiter: Tools.rate_limit.TokenBucket | None
+        """
+        self.name = name
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.budget = budget if budget is not None else RETRY_BUDGET
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = limiter
+
+    def _admit(self, attempt: int) -> bool:
+        """
+        Let an attempt through, or fail fast if the circuit is open.
+
+        :param attempt: The number of the attempt, starting at 1; only first attempts earn retry budget.
+            :type attempt: int
+
+        :return: Whether the attempt is the trial call of a half-open circuit, which it must settle.
+            :rtype: bool
+
+        :raises UpstreamUnavailable: If the circuit is open.
+        """
+        admitted = self.breaker.admit()
+        if admitted is None:
+            raise UpstreamUnavailable(self.name, "circuit open", self.breaker.retry_after())
+        if attempt == 1:
+            self.budget.deposit()
+        return admitted == "trial"
+
+    def _rate_limited(self, error: rate_limit.RateLimited) -> UpstreamUnavailable:
+        """
+        Turn away an attempt that couldn't get a token of the rate limiter in time.
+
+        :param error: The error of the rate limiter.
+            :type error: Tools.rate_limit.RateLimited
+
+        :return: The error to raise.
+            :rtype: UpstreamUnavailable
+        """
+        return UpstreamUnavailable(self.name, error.reason, error.retry_after)
+
+    def _next_delay(self, attempt: int, outcome) -> float:
+        """
+        Record a failed attempt and decide whether and when to retry it.
+
+        :param attempt: The number of the failed attempt, starting at 1.
+            :type attempt: int
+        :param outcome: The failed response, or the exception raised.
+            :type outcome: Any
+
+        :return: The seconds to wait before retrying.
+            :rtype: float
+
+        :raises UpstreamUnavailable: If the call shouldn't be retried.
+        """
+        self.breaker.record_failure()
+        retry_after = _retry_after(outcome)
+        if retry_after is not None and retry_after > self.max_delay:
+            self.breaker.hold(retry_after)
+            raise UpstreamUnavailable(self.name, f"asked to retry after {retry_after:.0f}s", retry_after)
+        status = _status(outcome)
+        reason = f"HTTP {status}" if status is not None else type(outcome).__name__
+        if attempt >= self.max_attempts:
+            raise UpstreamUnavailable(self.name, f"{reason} after {attempt} attempts", retry_after)
+        if not self.budget.try_spend():
+            raise UpstreamUnavailable(self.name, f"{reason}, retry budget exhausted", retry_after)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _failed(self, outcome) -> bool:
+        """
+        Check whether an attempt's response or exception counts as a failure of the upstream.
+
+        :param outcome: The response, or the exception raised.
+            :type outcome: Any
+
+        :return: Whether it does.
+            :rtype: bool
+        """
+        if isinstance(outcome, BaseException):
+            return _transport_error(outcome) or _status(outcome) in RETRY_STATUSES
+        return _status(outcome) in RETRY_STATUSES
+
+    def call(self, fn):
+        """
+        Make a call to the upstream under its policy.
+        Responses that aren't failures (including 4xx other than 429) are returned as-is for the caller to handle,
+        and exceptions that aren't failures are re-raised as-is.
+
+        :param fn: Makes the call, returning its response or result.
+            :type fn: Callable[[], Any]
+
+        :return: The response or result.
+            :rtype: Any
+
+        :raises UpstreamUnavailable: If the circuit is open or the call kept failing.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            trial = self._admit(attempt)
+            settled = False
+            try:
+                if self.limiter is not None:
+                    try:
+                        self.limiter.acquire()
+                    except rate_limit.RateLimited as e:
+                        raise self._rate_limited(e) from e
+                try:
+                    outcome = fn()
+                except Exception as e:
+                    if not self._failed(e):
+                        settled = self._answered(e)
+                        raise
+                    settled = True
+                    try:
+                        delay = self._next_delay(attempt, e)
+                    except UpstreamUnavailable as unavailable:
+                        raise unavailable from e
+                else:
+                    settled = True
+                    if not self._failed(outcome):
+                        self.breaker.record_success()
+                        return outcome
+                    _close(outcome)
+                    delay = self._next_delay(attempt, outcome)
+            finally:
+                # A trial that was rate limited, interrupted or broke on our side says nothing about the upstream
+                if trial and not settled:
+                    self.breaker.release()
+            time.sleep(delay)
+
+    async def call_async(self, fn):
+        """
+        Async version of call().
+
+        :param fn: Makes the call, returning an awaitable of its response or result.
+            :type fn: Callable[[], Awaitable[Any]]
+
+        :return: The response or result.
+            :rtype: Any
+
+        :raises UpstreamUnavailable: If the circuit is open or the call kept failing.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            trial = self._admit(attempt)
+            settled = False
+            try:
+                if self.limiter is not None:
+                    try:
+                        await self.limiter.acquire_async()
+                    except rate_limit.RateLimited as e:
+                        raise self._rate_limited(e) from e
+                try:
+                    outcome = await fn()
+                except Exception as e:
+                    if not self._failed(e):
+                        settled = self._answered(e)
+                        raise
+                    settled = True
+                    try:
+                        delay = self._next_delay(attempt, e)
+                    except UpstreamUnavailable as unavailable:
+                        raise unavailable from e
+                else:
+                    settled = True
+                    if not self._failed(outcome):
+                        self.breaker.record_success()
+                        return outcome
+                    await _aclose(outcome)
+                    delay = self._next_delay(attempt, outcome)
+            finally:
+                # A trial that was rate limited, cancelled or broke on our side says nothing about the upstream
+                if trial and not settled:
+                    self.breaker.release()
+            await asyncio.sleep(delay)
+
+    def _answered(self, error: Exception) -> bool:
+        """
+        Record an exception that isn't a failure of the upstream, if it is an answer of the upstream
+        (e.g. an HTTP 400 raised by an SDK), which shows the upstream is up.
+
+        :param error: The exception.
+            :type error: Exception
+
+        :return: Whether it was recorded, i.e. whether it settled a trial call.
+            :rtype: bool
+        """
+        if _status(error) is None:
+            return False
+        self.breaker.record_success()
+        return True
+
+
+def _close(response):
+    """
+    Release the connection of a response that won't be read, e.g. a streamed one that failed.
+
+    :param response: The response.
+        :type response: Any
+    """
+    close = getattr(response, "close", None)
+    if callable(close):
+        close()
+
+
+async def _aclose(response):
+    """
+    Async version of _close(), for the responses of httpx' async client.
+
+    :param response: The response.
+        :type response: Any
+    """
+    aclose = getattr(response, "aclose", None)
+    if callable(aclose):
+        await aclose()
+
+
+_UPSTREAMS = {}
+_UPSTREAMS_LOCK = threading.Lock()
+
+
+def get_upstream(name: str) -> Upstream:
+    """
+    Get the resilience policy of an upstream, created from UPSTREAM_CONFIG and rate_limit.RATE_LIMITS on first use.
+
+    :param name: The name of the upstream.
+        :type name: str
+
+    :return: The policy.
+        :rtype: Upstream
+    """
+    with _UPSTREAMS_LOCK:
+        upstream = _UPSTREAMS.get(name)
+        if upstream is None:
+            upstream = _UPSTREAMS[name] = Upstream(name, limiter=rate_limit.get_limiter(name),
+                                                   **UPSTREAM_CONFIG.get(name, {}))
+        return upstream
+
+
+def status() -> dict:
+    """
+    Get the health of every upstream in use: the state of its circuit and the use of its rate limit.
+
+    :return: {"circuit": ..., "retry_after": ..., "rate_limit": ...} of each upstream, by name.
+        :rtype: dict[str, dict]
+    """
+    with _UPSTREAMS_LOCK:
+        upstreams = list(_UPSTREAMS.values())
+    return {upstream.name: {"circuit": upstream.breaker.state,
+                            "retry_after": upstream.breaker.retry_after(),
+                            "rate_limit": upstream.limiter.utilization() if upstream.limiter is not None else None}
+            for upstream in upstreams}
@@ -0,0 +1,152 @@
+# Description: Coalesces concurrent identical calls into one, so a burst of the same request only runs it once.
+import asyncio
+import threading
+
+
+class _Call:
+    """
+    An in-flight call, shared by its caller and everyone waiting on it.
+    """
+
+    def __init__(self):
+        """
+        Initialize the _Call class.
+        """
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Task:
+    """
+    An in-flight async call, and the number of callers waiting on it.
+    """
+
+    def __init__(self, task):
+        """
+        Initialize the _Task class.
+
+        :param task: The task running the call.
+            :type task: asyncio.Task
+        """
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time: callers that arrive while a call with their key is in flight wait for it
+    and get its result (or its exception) instead of running their own. Nothing is kept once the call finishes, so
+    this only removes duplicated concurrent work and is meant to sit in front of a cache, not replace one.
+    Results are shared as-is, so callers must not mutate them.
+
+    :ivar calls: The number of calls that ran.
+        :type calls: int
+    :ivar shared: The number of callers that got the result of another caller's call.
+        :type shared: int
+    """
+
+    def __init__(self):
+        """
+        Initialize the SingleFlight class.
+        """
+        self.calls = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+    def do(self, key, fn):
+        """
+        Call fn, or wait for the in-flight call with the same key.
+
+        :param key: The key of the call.
+            :type key: Hashable
+        :param fn: The call.
+            :type fn: Callable[[], Any]
+
+        :return: The result of the call.
+            :rtype: Any
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, fn):
+        """
+        Async version of do(), coalescing the callers on the same event loop.
+        The call runs as its own task, so a caller that is cancelled (e.g. by a timeout) stops waiting without
+        cancelling the call for the others; once every caller has been cancelled, the call is cancelled too.
+
+        :param key: The key of the call.
+            :type key: Hashable
+        :param fn: Returns an awaitable of the result of the call.
+            :type fn: Callable[[], Awaitable[Any]]
+
+        :return: The result of the call.
+            :rtype: Any
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._tasks.get((loop, key))
+            if flight is None:
+                flight = self._tasks[(loop, key)] = _Task(loop.create_task(fn()))
+                flight.task.add_done_callback(lambda done: self._finish((loop, key), done))
+                self.calls += 1
+            else:
+                self.shared += 1
+            flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                abandoned = flight.waiters == 0
+            if abandoned and not flight.task.done():
+                flight.task.cancel()
+
+    def _finish(self, task_key, task):
+        """
+        Forget a finished async call.
+
+        :param task_key: The event loop and key of the call.
+            :type task_key: tuple
+        :param task: The finished task.
+            :type task: asyncio.Task
+        """
+        with self._lock:
+            flight = self._tasks.get(task_key)
+            if flight is not None and flight.task is task:
+                del self._tasks[task_key]
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the coalescing.
+
+        :return: The number of calls that ran, and of callers that shared another caller's call.
+            :rtype: dict
+        """
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls) + len(self._tasks)}
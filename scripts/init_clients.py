@@ -1,39 +1,391 @@
 # Description: This script initializes the clients for the APIs used in the project.
+import asyncio
+import functools
 import json
-from google import genai
+import threading
+import time
+import weakref
+from collections.abc import Mapping
+
+CREDS_PATH = "creds.json"
+HTTP_CONFIG = {
+    "pool_size": 10,
+    "keep_alive": True,
+    "connect_timeout": 3.05,
+    "read_timeout": 30,
+    "gzip": True
+}
+
+
+class TokenManager:
+    """
+    Class for caching an OAuth token until shortly before it expires.
+    Concurrent callers share a single refresh instead of each fetching their own token.
+    Async callers get a lock per event loop, since an asyncio.Lock only works on the loop it was first used on.
+    """
+    def __init__(self, refresh_margin = 60, default_lifetime = 1799):
+        """
+        Initialize the TokenManager object.
+
+        :param refresh_margin: float - How many seconds before expiry the token is refreshed.
+        :param default_lifetime: float - The lifetime of a token that doesn't say when it expires, in seconds.
+        """
+        self.refresh_margin = refresh_margin
+        self.default_lifetime = default_lifetime
+        self._lock = threading.Lock()
+        self._async_locks = weakref.WeakKeyDictionary()
+        self._token = None
+        self._expires_at = 0.0
+
+    def get(self, fetch):
+        """
+        Get the cached token, fetching a new one if it expired or is about to.
+        Inside the refresh margin only one caller refreshes, the others keep using the still-valid token.
+
+        :param fetch: callable - Fetches a new token, returning a dict with "access_token" and "expires_in".
+        :return: str - The token.
+        """
+        now = time.monotonic()
+        if self._token is not None and now < self._expires_at - self.refresh_margin:
+            return self._token
+        if self._token is not None and now < self._expires_at:
+            if not self._lock.acquire(blocking=False):
+                return self._token
+        else:
+            self._lock.acquire()
+        try:
+            if self._token is None or time.monotonic() >= self._expires_at - self.refresh_margin:
+                self._store(fetch())
+            return self._token
+        finally:
+            self._lock.release()
+
+    async def get_async(self, fetch):
+        """
+        Async version of get(), for use on an event loop.
+
+        :param fetch: callable - Returns an awaitable of a new token, a dict with "access_token" and "expires_in".
+        :return: str - The token.
+        """
+        now = time.monotonic()
+        if self._token is not None and now < self._expires_at - self.refresh_margin:
+            return self._token
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            lock = self._async_locks.get(loop)
+            if lock is None:
+                lock = self._async_locks[loop] = asyncio.Lock()
+        if self._token is not None and now < self._expires_at and lock.locked():
+            return self._token
+        async with lock:
+            if self._token is None or time.monotonic() >= self._expires_at - self.refresh_margin:
+                self._store(await fetch())
+            return self._token
+
+    def invalidate(self, token = None):
+        """
+        Drop the cached token, e.g. after the API rejected it.
+        Given the rejected token, only drops it if it is still the cached one, so when concurrent requests are
+        rejected together, the first one's refresh isn't thrown away by the others and only one refresh happens.
+
+        :param token: str | None - The token the API rejected, None to drop whatever token is cached.
+        """
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._expires_at = 0.0
+
+    def _store(self, data):
+        """
+        Store a freshly fetched token.
+
+        :param data: dict - The token response, with "access_token" and optionally "expires_in".
+        """
+        token = data["access_token"]
+        self._expires_at = time.monotonic() + float(data.get("expires_in", self.default_lifetime))
+        self._token = token
+
+
+@functools.cache
+def _session_type():
+    """
+    Build the HttpSession class, importing requests only once the first session is created.
+
+    :return: type - The HttpSession class.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    class HttpSession(requests.Session):
+        """
+        Long-lived pooled HTTP session for one upstream, with keep-alive, default timeouts and gzip.
+        """
+        def __init__(self, pool_size = 10, keep_alive = True, connect_timeout = 3.05, read_timeout = 30, gzip = True):
+            """
+            Initialize the HttpSession object.
+
+            :param pool_size: int - The maximum number of pooled connections.
+            :param keep_alive: bool - Whether connections are kept open between requests.
+            :param connect_timeout: float - The connect timeout, in seconds.
+            :param read_timeout: float - The read timeout, in seconds.
+            :param gzip: bool - Whether to ask for compressed responses.
+            """
+            super().__init__()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.mount("https://", adapter)
+            self.mount("http://", adapter)
+            self.timeout = (connect_timeout, read_timeout)
+            self.headers["Connection"] = "keep-alive" if keep_alive else "close"
+            self.headers["Accept-Encoding"] = "gzip, deflate" if gzip else "identity"
+
+        def request(self, method, url, **kwargs):
+            """
+            Send a request, using the session's timeouts unless the call gives its own.
+
+            :param method: str - The HTTP method.
+            :param url: str - The URL.
+            :return: requests.Response - The response.
+            """
+            kwargs.setdefault("timeout", self.timeout)
+            return super().request(method, url, **kwargs)
+
+    return HttpSession
+
+
+def __getattr__(name):
+    """
+    Resolve HttpSession lazily, so importing this module doesn't import requests.
+
+    :param name: str - The attribute name.
+    :return: type - The HttpSession class.
+    """
+    if name == "HttpSession":
+        return _session_type()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def http_session(pool_size = 10, keep_alive = True, connect_timeout = 3.05, read_timeout = 30, gzip = True,
+                 transport = None):
+    """
+    Create a pooled HTTP session for one upstream, see HttpSession.
+
+    :param pool_size: int - The maximum number of pooled connections.
+    :param keep_alive: bool - Whether connections are kept open between requests.
+    :param connect_timeout: float - The connect timeout, in seconds.
+    :param read_timeout: float - The read timeout, in seconds.
+    :param gzip: bool - Whether to ask for compressed responses.
+    :param transport: httpx.AsyncBaseTransport | None - Ignored, only the async session uses it.
+    :return: HttpSession - The session.
+    """
+    return _session_type()(pool_size, keep_alive, connect_timeout, read_timeout, gzip)
+
+
+def async_http_session(pool_size = 10, keep_alive = True, connect_timeout = 3.05, read_timeout = 30, gzip = True,
+                       transport = None):
+    """
+    Create a pooled async HTTP session for one upstream, with the same options as HttpSession.
+
+    :param pool_size: int - The maximum number of pooled connections.
+    :param keep_alive: bool - Whether connections are kept open between requests.
+    :param connect_timeout: float - The connect timeout, in seconds.
+    :param read_timeout: float - The read timeout, in seconds.
+    :param gzip: bool - Whether to ask for compressed responses.
+    :param transport: httpx.AsyncBaseTransport | None - The transport, the network if None (e.g. a MockTransport in tests).
+    :return: httpx.AsyncClient - The session.
+    """
+    import httpx
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size if keep_alive else 0),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        headers={"Accept-Encoding": "gzip, deflate" if gzip else "identity"},
+        transport=transport
+    )
 
 
 class Auth:
     """
     Class for holding clients and other auth information
     """
-    def __init__(self, key = None, secret = None, client = None):
+    def __init__(self, key = None, secret = None, client = None, session = None, http_config = None):
         """
         Initialize the Auth object.
 
         :param key: str | None - The key.
         :param secret: str | None - The secret.
         :param client: object | None - The client.
+        :param session: HttpSession | None - The HTTP session for the upstream, built from http_config if None.
+        :param http_config: dict | None - The options for the HTTP sessions, HTTP_CONFIG if None.
         """
         self.key = key
         self.secret = secret
         self.client = client
+        self.http_config = http_config if http_config is not None else HTTP_CONFIG
+        self.tokens = TokenManager()
+        self._session = session
+        self._async_sessions = weakref.WeakKeyDictionary()
+        self._async_lock = threading.Lock()
 
+    @property
+    def session(self):
+        """
+        The HTTP session for the upstream, created on first use so requests is only imported by sync callers.
 
-def get_clients():
+        :return: HttpSession - The session.
+        """
+        if self._session is None:
+            with self._async_lock:
+                if self._session is None:
+                    self._session = http_session(**self.http_config)
+        return self._session
+
+    @property
+    def async_session(self):
+        """
+        The async HTTP session for the upstream on the running event loop, created on first use so httpx is only
+        needed by async callers. Its connections belong to the loop, so each loop (e.g. each asyncio.run() or each
+        request of a sync Django worker) gets its own, dropped along with the loop.
+
+        :return: httpx.AsyncClient - The session.
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            session = self._async_sessions.get(loop)
+            if session is None:
+                session = self._async_sessions[loop] = async_http_session(**self.http_config)
+            return session
+
+
+def _gemini(creds, config):
     """
-    Get the clients for the APIs used in the project.
+    Build the Gemini client, importing google-genai only now since it is slow to import.
+
+    :param creds: dict - The contents of the credentials file.
+    :param config: dict - The HTTP options (unused, genai manages its own connections).
+    :return: Auth - The client.
+    """
+    from google import genai
+    return Auth(client=genai.Client(api_key=creds["google"]))
+
+
+def _amadeus(creds, config):
+    """
+    Build the Amadeus client.
 
-    :return: dict - The clients for the APIs.
+    :param creds: dict - The contents of the credentials file.
+    :param config: dict - The HTTP options.
+    :return: Auth - The client.
     """
-    with open("creds.json") as f:
-        data = json.load(f)
-    gemini = Auth(client=(genai.Client(api_key=data["google"])))
-    amadeus = Auth(key=data["amadeus"][0], secret=data["amadeus"][1])
-    meteoblue = Auth(key=data["meteoblue"])
-    geocoding = Auth(key=data["geocoding"])
+    return Auth(key=creds["amadeus"][0], secret=creds["amadeus"][1], http_config=config)
+
+
+def _meteoblue(creds, config):
+    """
+    Build the meteoblue client.
+
+    :param creds: dict - The contents of the credentials file.
+    :param config: dict - The HTTP options.
+    :return: Auth - The client.
+    """
+    return Auth(key=creds["meteoblue"], http_config=config)
+
+
+def _geocoding(creds, config):
+    """
+    Build the OpenCage geocoding client.
+
+    :param creds: dict - The contents of the credentials file.
+    :param config: dict - The HTTP options.
+    :return: Auth - The client.
+    """
+    return Auth(key=creds["geocoding"], http_config=config)
+
+
+CLIENT_FACTORIES = {
+    "gemini": _gemini,
+    "amadeus": _amadeus,
+    "meteoblue": _meteoblue,
+    "geocoding": _geocoding
+}
+
 
-    return {"gemini": gemini,
-            "amadeus": amadeus,
-            "meteoblue": meteoblue,
-            "geocoding": geocoding}
\ No newline at end of file
+class ClientRegistry(Mapping):
+    """
+    Read-only mapping of the API clients that builds each client the first time it is looked up.
+    The credentials file is only read, and heavy client libraries only imported, once a client is actually needed,
+    so importing a module that holds a registry is cheap and works without credentials.
+    """
+    def __init__(self, factories = None, creds_path = None, http_config = None):
+        """
+        Initialize the ClientRegistry object.
+
+        :param factories: dict | None - Name to callable(creds, http_config) returning the Auth, CLIENT_FACTORIES if None.
+        :param creds_path: str | None - The path to the credentials file, CREDS_PATH if None.
+        :param http_config: dict | None - Overrides for HTTP_CONFIG (pool_size, keep_alive, connect_timeout, read_timeout, gzip).
+        """
+        self.factories = dict(factories if factories is not None else CLIENT_FACTORIES)
+        self.creds_path = creds_path if creds_path is not None else CREDS_PATH
+        self.http_config = {**HTTP_CONFIG, **(http_config or {})}
+        self._lock = threading.Lock()
+        self._creds = None
+        self._clients = {}
+
+    def __getitem__(self, name):
+        """
+        Get a client, building it on first use.
+
+        :param name: str - The name of the client.
+        :return: Auth - The client.
+        """
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        if name not in self.factories:
+            raise KeyError(name)
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                if self._creds is None:
+                    with open(self.creds_path) as f:
+                        self._creds = json.load(f)
+                client = self.factories[name](self._creds, self.http_config)
+                self._clients[name] = client
+            return client
+
+    def __iter__(self):
+        return iter(self.factories)
+
+    def __len__(self):
+        return len(self.factories)
+
+    def loaded(self, name):
+        """
+        Check whether a client was already built.
+
+        :param name: str - The name of the client.
+        :return: bool - Whether it was built.
+        """
+        return name in self._clients
+
+    def warm_up(self, names = None):
+        """
+        Build clients ahead of the first request, e.g. when a server process starts.
+
+        :param names: Iterable[str] | None - The clients to build, all of them if None.
+        :return: ClientRegistry - The registry.
+        """
+        for name in (self.factories if names is None else names):
+            self[name]
+        return self
+
+
+def get_clients(http_config = None, creds_path = None):
+    """
+    Get the clients for the APIs used in the project.
+    Each upstream gets its own pooled HTTP session, shared by every call made with its client.
+    Nothing is built until a client is first looked up, call warm_up() on the result to build them all up front.
+
+    :param http_config: dict | None - Overrides for HTTP_CONFIG (pool_size, keep_alive, connect_timeout, read_timeout, gzip).
+    :param creds_path: str | None - The path to the credentials file, CREDS_PATH if None.
+    :return: ClientRegistry - The clients for the APIs, by name.
+    """
+    return ClientRegistry(http_config=http_config, creds_path=creds_path)
@@ -7,38 +7,360 @@ from AccessPoints import meteoblue as meb
 import init_clients
 from Tools import csv_processor as csvp
 from Tools import custom_error as ce
+from Tools import resilience
+from Tools import singleflight
+import asyncio
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+MAX_CONCURRENCY = 8
+# Identical searches running at the same time share one run of the pipeline
+SEARCH_FLIGHTS = singleflight.SingleFlight()
+
 clients = init_clients.get_clients()
 
+
+def warm_up():
+    """
+    Build the API clients and load the reference data ahead of the first search, e.g. when a server process starts.
+    Otherwise each of them is only built the first time a search needs it.
+    """
+    clients.warm_up()
+    gem._models()
+    csvp.get_airport_index()
+    csvp.get_airline_index()
+
 def get_spec_flight_data(data) -> dict:
-    cheapest_offer = data.sort(key=lambda x: float(x["price"]["total"]), reverse=False)[0]
-    cost = cheapest_offer["price"]["total"]
-    airline = cheapest_offer["validatingAirlineCodes"][0]
-    airline = csvp.smart_get("../Data/airlines.csv", 3, airline)[0][1]
-    seats = cheapest_offer["numberOfBookableSeats"]
-    depart_time = cheapest_offer["itineraries"][0]["segments"][0]["departure"]["at"]
-    arrival_time = cheapest_offer["itineraries"][0]["segments"][-1]["arrival"]["at"]
-    depart_airport = cheapest_offer["itineraries"][0]["segments"][0]["departure"]["iataCode"]
-    depart_airport = csvp.smart_get("../Data/airports.csv", 4, depart_airport)[0][1]
-    arrival_airport = cheapest_offer["itineraries"][0]["segments"][-1]["arrival"]["iataCode"]
-    arrival_airport = csvp.smart_get("../Data/airports.csv", 4, arrival_airport)[0][1]
+    """
+    Get the details of the best flight offer, with the next best offers as ranked alternatives.
+
+    :param data: The offer summaries from amadeus.get_flight_data(), best first.
+        :type data: list[dict]
+
+    :return: The details of the best offer, with an "alternatives" list of the others.
+        :rtype: dict
+    """
+    if not data:
+        raise IndexError("No flight offers were found")
+    flight = offer_details(data[0])
+    flight["alternatives"] = [offer_details(offer) for offer in data[1:]]
+    return flight
+
+
+def offer_details(offer: dict) -> dict:
+    """
+    Get the details of a flight offer in the return_template.json shape, with the airline and airports named.
+
+    :param offer: An offer summary from amadeus.get_flight_data(), or a price-only one from get_multi_flight_data().
+        :type offer: dict
+
+    :return: The cost, airline, seats, duration, stops, layovers, departure and arrival of the offer
+        (None where the offer doesn't say).
+        :rtype: dict
+    """
+    airline_row = csvp.resolve_code(csvp.AIRLINES_PATH, offer["carrier"]) if offer["carrier"] else None
+    layovers = offer.get("layovers")
     return {
-        "cost": cost,
-        "airline": airline,
-        "seats": seats,
-        "departure": {
-            "time": depart_time,
-            "airport": depart_airport
-        },
-        "arrival": {
-            "time": arrival_time,
-            "airport": arrival_airport
-        }
+        "cost": offer["price"],
+        "airline": airline_row[1] if airline_row is not None else offer["carrier"],
+        "seats": offer["seats"],
+        "departure": flight_end(offer["departure"]),
+        "arrival": flight_end(offer["arrival"]),
+        "duration": offer.get("duration"),
+        "stops": offer["stops"],
+        "layovers": [airport_name(code) for code in layovers] if layovers is not None else None
     }
 
 
+def flight_end(end: dict) -> dict:
+    """
+    Get the date, time and airport of one end of a flight.
+
+    :param end: The departure or arrival of an offer summary, as {"at": ..., "iataCode": ...}.
+        "at" is a local date-time (YYYY-MM-DDTHH:MM:SS), a date alone for price-only offers, or None.
+        :type end: dict
+
+    :return: The date and time (None where unknown) and the airport name.
+        :rtype: dict
+    """
+    day, _, time = (end["at"] or "").partition("T")
+    return {"date": day or None, "time": time or None, "airport": airport_name(end["iataCode"])}
+
+
+def airport_name(code: str) -> str:
+    """
+    Get the name of an airport.
+
+    :param code: The IATA code of the airport.
+        :type code: str
+
+    :return: The name of the airport, or the code if it isn't in airports.csv.
+        :rtype: str
+    """
+    row = csvp.resolve_code(csvp.AIRPORTS_PATH, code)
+    return row[1] if row is not None else code
+
+
+def get_weather_info(loc: str, coords: tuple[float, float] | None = None) -> dict:
+    """
+    Get the weather forecast for a location.
+
+    :param loc: The location, as "city, state, country" or "city, country".
+        :type loc: str
+    :param coords: The coordinates of the location if known, so it doesn't need geocoding.
+        :type coords: tuple[float, float] | None
+
+    :return: The forecast, as {"weather": Forecast}, or a degraded_weather() section if the weather is unavailable.
+        :rtype: dict
+    """
+    try:
+        weather = meb.get_weather(clients["geocoding"], clients["meteoblue"], loc, coords)
+    except resilience.UpstreamUnavailable as e:
+        return degraded_weather(e)
+    return format_weather(weather["data_day"])
+
+
+async def get_weather_info_async(loc: str, coords: tuple[float, float] | None = None) -> dict:
+    """
+    Async version of get_weather_info().
+
+    :param loc: The location, as "city, state, country" or "city, country".
+        :type loc: str
+    :param coords: The coordinates of the location if known, so it doesn't need geocoding.
+        :type coords: tuple[float, float] | None
+
+    :return: The forecast, as {"weather": Forecast}, or a degraded_weather() section if the weather is unavailable.
+        :rtype: dict
+    """
+    try:
+        weather = await meb.get_weather_async(clients["geocoding"], clients["meteoblue"], loc, coords)
+    except resilience.UpstreamUnavailable as e:
+        return degraded_weather(e)
+    return format_weather(weather["data_day"])
+
+
+def format_weather(weather_data: dict) -> dict:
+    """
+    Format meteoblue's daily forecast.
+    The forecast keeps meteoblue's columns and only builds a day when it is indexed,
+    e.g. format_weather(data)["weather"][0]["real_temp"]["min"].
+
+    :param weather_data: The "data_day" section of a meteoblue basic-day response.
+        :type weather_data: dict
+
+    :return: The forecast, covering every day the response has.
+        :rtype: dict
+    """
+    return {"weather": meb.Forecast(weather_data)}
+
+
+def degraded_weather(error: resilience.UpstreamUnavailable) -> dict:
+    """
+    The general details of a trip whose forecast is unavailable (meteoblue or the geocoding down), so the search
+    still returns the trip and its flights.
+
+    :param error: Why the forecast is unavailable.
+        :type error: Tools.resilience.UpstreamUnavailable
+
+    :return: {"weather": None, "error": ...}.
+        :rtype: dict
+    """
+    return {"weather": None,
+            "error": ce.CustomException("WeatherUnavailableError",
+                                        "The weather forecast is unavailable right now, please try again later",
+                                        error)}
+
+
+def get_trip_details(trip: dict, airports: list, search: dict, flight_info: dict | None = None) -> tuple[dict, dict]:
+    """
+    Get the flight and weather details for a single trip.
+
+    :param trip: The trip suggested by Gemini.
+        :type trip: dict
+    :param airports: The airports.csv rows matching the trip's destination airport, best first.
+        :type airports: list
+    :param search: The validated search parameters (origin_airport, max_price, departure_date, adults,
+        return_date, children, infants, trav_class, non_stop), with the dates already formatted.
+        :type search: dict
+    :param flight_info: The trip's flight data if already fetched (e.g. by amadeus.get_multi_flight_data()).
+        :type flight_info: dict | None
+
+    :return: The flight details and the general (weather) details.
+        :rtype: tuple[dict, dict]
+    """
+    if flight_info is None:
+        flight_info = get_flight_info(search, airports[0][4])
+    return flight_details(flight_info), get_weather_info(trip_location(trip), trip_coordinates(trip, airports))
+
+
+async def get_trip_details_async(trip: dict, airports: list, search: dict,
+                                 flight_info: dict | None = None) -> tuple[dict, dict]:
+    """
+    Async version of get_trip_details(), running the flight and weather lookups concurrently.
+
+    :param trip: The trip suggested by Gemini.
+        :type trip: dict
+    :param airports: The airports.csv rows matching the trip's destination airport, best first.
+        :type airports: list
+    :param search: The validated search parameters.
+        :type search: dict
+    :param flight_info: The trip's flight data if already fetched.
+        :type flight_info: dict | None
+
+    :return: The flight details and the general (weather) details.
+        :rtype: tuple[dict, dict]
+    """
+    if flight_info is None:
+        flight_info, general = await asyncio.gather(
+            get_flight_info_async(search, airports[0][4]),
+            get_weather_info_async(trip_location(trip), trip_coordinates(trip, airports))
+        )
+    else:
+        general = await get_weather_info_async(trip_location(trip), trip_coordinates(trip, airports))
+    return flight_details(flight_info), general
+
+
+def get_flight_info(search: dict, destination: str) -> dict:
+    """
+    Get the flight data of a trip: the best offers for the search's dates, or the flexible-date search result
+    if the search has flex_days.
+
+    :param search: The validated search parameters.
+        :type search: dict
+    :param destination: The IATA code of the destination airport.
+        :type destination: str
+
+    :return: The result of amadeus.get_flight_data() or amadeus.get_flex_flight_data().
+        :rtype: dict
+    """
+    if search.get("flex_days"):
+        return amad.get_flex_flight_data(clients["amadeus"], *flight_query(search, destination),
+                                         flex_days=search["flex_days"])
+    return amad.get_flight_data(clients["amadeus"], *flight_query(search, destination))
+
+
+async def get_flight_info_async(search: dict, destination: str) -> dict:
+    """
+    Async version of get_flight_info().
+
+    :param search: The validated search parameters.
+        :type search: dict
+    :param destination: The IATA code of the destination airport.
+        :type destination: str
+
+    :return: The result of amadeus.get_flight_data_async() or amadeus.get_flex_flight_data_async().
+        :rtype: dict
+    """
+    if search.get("flex_days"):
+        return await amad.get_flex_flight_data_async(clients["amadeus"], *flight_query(search, destination),
+                                                     flex_days=search["flex_days"])
+    return await amad.get_flight_data_async(clients["amadeus"], *flight_query(search, destination))
+
+
+def flight_details(flight_info: dict) -> dict:
+    """
+    Get the flight details of a trip from its flight data.
+    For a flexible-date search, the best date pair's offers are used, and the dates and price matrix are added.
+
+    :param flight_info: The result of get_flight_info() (or amadeus.get_multi_flight_data() for the trip).
+        :type flight_info: dict
+
+    :return: The flight details.
+        :rtype: dict
+    """
+    if "prices" not in flight_info:
+        return get_spec_flight_data(flight_info["data"])
+    best = flight_info["best"]
+    flight = get_spec_flight_data(best["result"]["data"] if best is not None else [])
+    flight["dates"] = {"departure": best["departure"], "return": best["return"]}
+    flight["price_matrix"] = {"departures": flight_info["departures"],
+                              "returns": flight_info["returns"],
+                              "prices": flight_info["prices"]}
+    return flight
+
+
+def flight_query(search: dict, destination: str) -> tuple:
+    """
+    Get the arguments of amadeus.get_flight_data() (after the client) for a search and destination.
+
+    :param search: The validated search parameters.
+        :type search: dict
+    :param destination: The IATA code of the destination airport.
+        :type destination: str
+
+    :return: The arguments, in order.
+        :rtype: tuple
+    """
+    return (search["origin_airport"],
+            search["max_price"],
+            search["departure_date"],
+            search["adults"],
+            search["return_date"],
+            destination,
+            search["children"],
+            search["infants"],
+            search["trav_class"],
+            search["non_stop"])
+
+
+def destinations_query(search: dict) -> dict:
+    """
+    Get the search arguments of amadeus.get_multi_flight_data() (after the client and destinations).
+
+    :param search: The validated search parameters.
+        :type search: dict
+
+    :return: The arguments, by name.
+        :rtype: dict
+    """
+    return {"originLocationCode": search["origin_airport"],
+            "maxPrice": search["max_price"],
+            "departure": search["departure_date"],
+            "adults": search["adults"],
+            "returnDate": search["return_date"],
+            "children": search["children"],
+            "infants": search["infants"],
+            "travelClass": search["trav_class"],
+            "nonStopp": search["non_stop"]}
+
+
+def trip_coordinates(trip: dict, airports: list) -> tuple[float, float] | None:
+    """
+    Get the coordinates of a trip from airports.csv, so the weather lookup can skip geocoding.
+    Uses the resolved destination airport, or else the centroid of the airports of the trip's city.
+
+    :param trip: The trip suggested by Gemini.
+        :type trip: dict
+    :param airports: The airports.csv rows matching the trip's destination airport, best first.
+        :type airports: list
+
+    :return: The latitude and longitude, or None if the trip has to be geocoded.
+        :rtype: tuple[float, float] | None
+    """
+    coords = csvp.row_coordinates(airports[0]) if airports else None
+    if coords is None:
+        coords = csvp.get_airport_index().city_centroid(trip["location"]["city"], trip["location"]["country"])
+    return coords
+
+
+def trip_location(trip: dict) -> str:
+    """
+    Get the place name of a trip, for geocoding.
+
+    :param trip: The trip suggested by Gemini.
+        :type trip: dict
+
+    :return: The location, as "city, state, country" or "city, country".
+        :rtype: str
+    """
+    city = trip["location"]["city"]
+    state = trip["location"]["state"]
+    country = trip["location"]["country"]
+    return ", ".join([city, state, country]) if state is not None else ", ".join([city, country])
+
+
 def valid_date(date: str) -> bool:
     """
     Check if a date is valid.
@@ -103,18 +425,20 @@ def date_compare(date1: str | datetime, date2: str | datetime, format:str="%m/%d
         return 1
 
 
-def main(origin_airport,
-         descriptors,
-         departure_date,
-         max_price,
-         adults,
-         return_date = None,
-         children = None,
-         infants = None,
-         trav_class = None,
-         non_stop = None):
+def validate_search(origin_airport,
+                    descriptors,
+                    departure_date,
+                    max_price,
+                    adults,
+                    return_date = None,
+                    children = None,
+                    infants = None,
+                    trav_class = None,
+                    non_stop = None,
+                    flex_days = None,
+                    origin_rows = None):
     """
-    Main function for the website, does most of the logic.
+    Check and normalize the search parameters of main().
 
     :param origin_airport: The origin airport.
         :type origin_airport: str
@@ -136,144 +460,159 @@ def main(origin_airport,
         :type trav_class: str | None
     :param non_stop: Whether the flight should be non-stop.
         :type non_stop: bool | None
+    :param flex_days: How many days either side of the dates to search for cheaper flights, 0 or None for exact dates.
+        :type flex_days: int | None
+    :param origin_rows: The airports.csv rows matching the origin airport, best first, if already looked up.
+        :type origin_rows: list | None
 
-    :return: The list of trips or an error.
-        :rtype: Tools.custom_error.CustomException | list
+    :return: The validated search parameters, with the dates formatted for the APIs, or an error.
+        :rtype: dict | Tools.custom_error.CustomException | Tools.custom_error.MultiException
     """
-    try:
-        # Check Inputs
+    # Check Inputs
+    if True:
+        # Check missing values (all), the optional ones default to a one-way economy search for adults only
         if True:
-            # Check missing values (all)
-            if True:
-                if children == "" or children is None:
-                    children = None
-                if infants == "" or infants is None:
-                    infants = None
-                if non_stop == "" or non_stop is None:
-                    non_stop = None
-                if return_date == "" or return_date is None:
-                    return_date = None
-                if trav_class == "" or trav_class is None:
-                    trav_class = None
-                if descriptors == "" or descriptors is None:
-                    return ce.CustomException("InvalidDescriptorsError",
-                                              "The descriptors cannot be empty",
-                                              ValueError("The descriptors cannot be empty"))
-                if max_price == "" or max_price is None:
-                    return ce.CustomException("InvalidPriceError",
-                                              "The maximum price cannot be empty",
-                                              ValueError("The maximum price cannot be empty"))
-                if adults == "" or adults is None:
+            if children == "" or children is None:
+                children = 0
+            if infants == "" or infants is None:
+                infants = 0
+            if non_stop == "" or non_stop is None:
+                non_stop = False
+            if return_date == "" or return_date is None:
+                return_date = None
+            if trav_class == "" or trav_class is None:
+                trav_class = None
+            if descriptors == "" or descriptors is None:
+                return ce.CustomException("InvalidDescriptorsError",
+                                          "The descriptors cannot be empty",
+                                          ValueError("The descriptors cannot be empty"))
+            if max_price == "" or max_price is None:
+                return ce.CustomException("InvalidPriceError",
+                                          "The maximum price cannot be empty",
+                                          ValueError("The maximum price cannot be empty"))
+            if adults == "" or adults is None:
+                return ce.CustomException("InvalidPassengerError",
+                                          "The number of passengers cannot be empty",
+                                          ValueError("The number of passengers cannot be empty"))
+            if departure_date == "" or departure_date is None:
+                return ce.CustomException("InvalidDepartureDateError",
+                                          "The departure date cannot be empty",
+                                          ValueError("The departure date cannot be empty"))
+            if origin_airport == "" or origin_airport is None:
+                return ce.CustomException("InvalidAirportError",
+                                          "The origin airport cannot be empty",
+                                          ValueError("The origin airport cannot be empty"))
+        # Check types (all)
+        if True:
+            if not isinstance(origin_airport, str):
+                return ce.CustomException("InvalidAirportError",
+                                          "The origin airport must be a string",
+                                          ValueError("The origin airport must be a string"))
+            if not isinstance(adults, int):
+                if not isinstance(adults, str) or not adults.isnumeric():
                     return ce.CustomException("InvalidPassengerError",
-                                              "The number of passengers cannot be empty",
-                                              ValueError("The number of passengers cannot be empty"))
-                if departure_date == "" or departure_date is None:
-                    return ce.CustomException("InvalidDepartureDateError",
-                                              "The departure date cannot be empty",
-                                              ValueError("The departure date cannot be empty"))
-                if origin_airport == "" or origin_airport is None:
-                    return ce.CustomException("InvalidAirportError",
-                                              "The origin airport cannot be empty",
-                                              ValueError("The origin airport cannot be empty"))
-            # Check types (all)
-            if True:
-                if not isinstance(origin_airport, str):
-                    return ce.CustomException("InvalidAirportError",
-                                              "The origin airport must be a string",
-                                              ValueError("The origin airport must be a string"))
-                if not isinstance(adults, int):
-                    if not isinstance(adults, str) or not adults.isnumeric():
-                        return ce.CustomException("InvalidPassengerError",
-                                                  "The number of passengers must be a number",
-                                                  ValueError("The number of passengers must be a number"))
-                    adults = int(adults)
-                if not isinstance(children, int):
-                    if not isinstance(children, str) or not children.isnumeric():
-                        return ce.CustomException("InvalidPassengerError",
-                                                  "The number of children must be a number",
-                                                  ValueError("The number of children must be a number"))
-                    children = int(children)
-                if not isinstance(infants, int):
-                    if not isinstance(infants, str) or not infants.isnumeric():
-                        return ce.CustomException("InvalidPassengerError",
-                                                  "The number of infants must be a number",
-                                                  ValueError("The number of infants must be a number"))
-                    infants = int(infants)
-                if not isinstance(max_price, int):
-                    if not isinstance(max_price, str) or not max_price.isnumeric():
-                        return ce.CustomException("InvalidPriceError",
-                                                  "The maximum price must be a number",
-                                                  ValueError("The maximum price must be a number"))
-                    max_price = int(max_price)
-                if not isinstance(trav_class, str):
-                    return ce.CustomException("InvalidClass",
-                                              "The travel class must be a string",
-                                              ValueError("The travel class must be a string"))
-                if not isinstance(non_stop, bool):
-                    if isinstance(non_stop, str):
-                        if non_stop.lower() == "true":
-                            non_stop = True
-                        elif non_stop.lower() == "false":
-                            non_stop = False
-                        else:
-                            return ce.CustomException("InvalidNonStopError",
-                                                  "The non-stop value must be a boolean",
-                                                  ValueError("The non-stop value must be a boolean"))
+                                              "The number of passengers must be a number",
+                                              ValueError("The number of passengers must be a number"))
+                adults = int(adults)
+            if not isinstance(children, int):
+                if not isinstance(children, str) or not children.isnumeric():
+                    return ce.CustomException("InvalidPassengerError",
+                                              "The number of children must be a number",
+                                              ValueError("The number of children must be a number"))
+                children = int(children)
+            if not isinstance(infants, int):
+                if not isinstance(infants, str) or not infants.isnumeric():
+                    return ce.CustomException("InvalidPassengerError",
+                                              "The number of infants must be a number",
+                                              ValueError("The number of infants must be a number"))
+                infants = int(infants)
+            if not isinstance(max_price, int):
+                if not isinstance(max_price, str) or not max_price.isnumeric():
+                    return ce.CustomException("InvalidPriceError",
+                                              "The maximum price must be a number",
+                                              ValueError("The maximum price must be a number"))
+                max_price = int(max_price)
+            if trav_class is not None and not isinstance(trav_class, str):
+                return ce.CustomException("InvalidClass",
+                                          "The travel class must be a string",
+                                          ValueError("The travel class must be a string"))
+            if not isinstance(non_stop, bool):
+                if isinstance(non_stop, str):
+                    if non_stop.lower() == "true":
+                        non_stop = True
+                    elif non_stop.lower() == "false":
+                        non_stop = False
                     else:
                         return ce.CustomException("InvalidNonStopError",
-                                                  "The non-stop value must be a boolean",
-                                                  ValueError("The non-stop value must be a boolean"))
-                if not isinstance(departure_date, str):
+                                              "The non-stop value must be a boolean",
+                                              ValueError("The non-stop value must be a boolean"))
+                else:
+                    return ce.CustomException("InvalidNonStopError",
+                                              "The non-stop value must be a boolean",
+                                              ValueError("The non-stop value must be a boolean"))
+            if not isinstance(departure_date, str):
+                return ce.CustomException("InvalidDepartureDateError",
+                                          "The departure date must be a string",
+                                          ValueError("The departure date must be a string"))
+            if return_date is not None and not isinstance(return_date, str):
+                return ce.CustomException("InvalidReturnDateError",
+                                          "The return date must be a string",
+                                          ValueError("The return date must be a string"))
+            if not isinstance(descriptors, str):
+                return ce.CustomException("InvalidDescriptorsError",
+                                          "The descriptors must be a string",
+                                          ValueError("The descriptors must be a string"))
+        # Check values (all)
+        if True:
+            if not origin_airport.isalpha():
+                return ce.CustomException("InvalidAirportError",
+                                          "The origin airport contains invalid characters",
+                                          ValueError("The origin airport contains invalid characters"))
+            airports = origin_rows if origin_rows is not None else csvp.smart_get(csvp.AIRPORTS_PATH, 1, origin_airport)
+            if len(airports) == 0:
+                return ce.CustomException("InvalidAirportError",
+                                          "The specified airport could not be found",
+                                          ValueError("The specified origin airport could not be found"))
+            if max_price <= 0:
+                return ce.CustomException("InvalidPriceError",
+                                          "The maximum price cannot be less than or equal to zero",
+                                          ValueError("The maximum price cannot be less than or equal to zero"))
+            if adults < 1:
+                return ce.CustomException("InvalidPassengerError",
+                                          "There must be at least one adult passenger",
+                                          ValueError("There must be at least one adult passenger"))
+            if children < 0:
+                return ce.CustomException("InvalidPassengerError",
+                                          "The number of children cannot be negative",
+                                          ValueError("The number of children cannot be negative"))
+            if infants < 0:
+                return ce.CustomException("InvalidPassengerError",
+                                          "The number of infants cannot be negative",
+                                          ValueError("The number of infants cannot be negative"))
+            if adults + children > 9:
+                return ce.CustomException("TooManyPassengersError",
+                                          "The number of passengers exceeds the limit of 9",
+                                          ValueError("The number of passengers exceeds the limit of 9"))
+            if infants > adults:
+                return ce.CustomException("TooManyInfantsError",
+                                          "The number of infants exceeds the number of adults",
+                                          ValueError("The number of infants exceeds the number of adults"))
+            if not valid_date(departure_date):
+                return ce.CustomException("InvalidDepartureDateError",
+                                          "The departure date is not a valid date",
+                                          ValueError("The departure date is not a valid date"))
+            match date_compare(departure_date, datetime.now()):
+                case -1:
                     return ce.CustomException("InvalidDepartureDateError",
-                                              "The departure date must be a string",
-                                              ValueError("The departure date must be a string"))
-                if not isinstance(return_date, str):
-                    return ce.CustomException("InvalidReturnDateError",
-                                              "The return date must be a string",
-                                              ValueError("The return date must be a string"))
-                if not isinstance(descriptors, str):
-                    return ce.CustomException("InvalidDescriptorsError",
-                                              "The descriptors must be a string",
-                                              ValueError("The descriptors must be a string"))
-            # Check values (all)
-            if True:
-                if not origin_airport.isalpha():
-                    return ce.CustomException("InvalidAirportError",
-                                              "The origin airport contains invalid characters",
-                                              ValueError("The origin airport contains invalid characters"))
-                airports = csvp.smart_get("../Data/airports.csv", 1, origin_airport)
-                if len(airports) == 0:
-                    return ce.CustomException("InvalidAirportError",
-                                              "The specified airport could not be found",
-                                              ValueError("The specified origin airport could not be found"))
-                if max_price <= 0:
-                    return ce.CustomException("InvalidPriceError",
-                                              "The maximum price cannot be less than or equal to zero",
-                                              ValueError("The maximum price cannot be less than or equal to zero"))
-                if adults < 1:
-                    return ce.CustomException("InvalidPassengerError",
-                                              "There must be at least one adult passenger",
-                                              ValueError("There must be at least one adult passenger"))
-                if children < 0:
-                    return ce.CustomException("InvalidPassengerError",
-                                              "The number of children cannot be negative",
-                                              ValueError("The number of children cannot be negative"))
-                if infants < 0:
-                    return ce.CustomException("InvalidPassengerError",
-                                              "The number of infants cannot be negative",
-                                              ValueError("The number of infants cannot be negative"))
-                if adults + children > 9:
-                    return ce.CustomException("TooManyPassengersError",
-                                              "The number of passengers exceeds the limit of 9",
-                                              ValueError("The number of passengers exceeds the limit of 9"))
-                if infants > adults:
-                    return ce.CustomException("TooManyInfantsError",
-                                              "The number of infants exceeds the number of adults",
-                                              ValueError("The number of infants exceeds the number of adults"))
-                if not valid_date(departure_date):
+                                              "The departure date is before the current date",
+                                              ValueError("The departure date is before the current date"))
+                case 0:
                     return ce.CustomException("InvalidDepartureDateError",
-                                              "The departure date is not a valid date",
-                                              ValueError("The departure date is not a valid date"))
+                                              "The departure date is the current date",
+                                              ValueError("The departure date is the current date"))
+                case 1:
+                    pass
+            if return_date is not None:
                 if not valid_date(return_date):
                     return ce.CustomException("InvalidReturnDateError",
                                               "The return date is not a valid date",
@@ -289,17 +628,6 @@ def main(origin_airport,
                                                   ValueError("The return date is the current date"))
                     case 1:
                         pass
-                match date_compare(departure_date, datetime.now()):
-                    case -1:
-                        return ce.CustomException("InvalidDepartureDateError",
-                                                  "The departure date is before the current date",
-                                                  ValueError("The departure date is before the current date"))
-                    case 0:
-                        return ce.CustomException("InvalidDepartureDateError",
-                                                  "The departure date is the current date",
-                                                  ValueError("The departure date is the current date"))
-                    case 1:
-                        pass
                 if date_compare(departure_date, return_date) >= 0:
                     dep_error = ce.CustomException("InvalidDepartureDateError",
                                                    "The departure date is after the return date",
@@ -308,117 +636,592 @@ def main(origin_airport,
                                                    "The return date is before the departure date",
                                                    ValueError("The return date is before the departure date"))
                     return dep_error + ret_error
-                if trav_class not in [None, "Economy", "Premium Economy", "Business", "First"]:
-                    return ce.CustomException("InvalidClass",
-                                              "The travel class is invalid",
-                                              ValueError("The travel class is invalid"))
-                descs = [desc.strip() for desc in descriptors.split(",")]
-                for i in range(len(descs)):
-                    if descs[i] == "":
-                        descs.pop(i)
-                if len(descs) == 0:
-                    return ce.CustomException("InvalidDescriptorsError",
-                                              "The descriptors cannot be empty",
-                                              ValueError("The descriptors cannot be empty"))
-        trip_list = gem.get_location(clients["gemini"], json.dumps({
-            "max_price": max_price,
-            "origin_airport": airports[0][1],
-            "descriptors": descs
-        }))
-        flight_details = []
-        if not trip_list:
-            return ce.CustomException("NoTripsFoundError",
-                                      "No trips were found with the specified parameters",
-                                      ValueError("No trips were found with the specified parameters"))
-        trip_list = [item["trip"] for item in trip_list]
-        for item in trip_list:
-            airports = csvp.smart_get("../Data/airports.csv", 1, item["destination_airport"])
-            flight_info = amad.get_flight_data(clients["amadeus"],
-                                 origin_airport,
-                                 max_price,
-                                 format_date(departure_date),
-                                 adults,
-                                 format_date(return_date) if return_date is not None else None,
-                                 airports[0][4],
-                                 children,
-                                 infants,
-                                 trav_class,
-                                 non_stop)
-            flight_details.append(get_spec_flight_data(flight_info["data"]))
-        general_info = []
-        for i in range(len(trip_list)):
-            city = trip_list[i]["location"]["city"]
-            state = trip_list[i]["location"]["state"]
-            country = trip_list[i]["location"]["country"]
-            loc = ", ".join([city, state, country]) if state is not None else ", ".join([city, country])
-            weather_data = meb.get_weather(clients["geocoding"], clients["meteoblue"], loc)["data_day"]
-            real_temp = {
-                "min": weather_data["temperature_min"],
-                "mean": weather_data["temperature_mean"],
-                "max": weather_data["temperature_max"]
-            }
-            felt_temp = {
-                "min": weather_data["felttemperature_min"],
-                "mean": weather_data["felttemperature_mean"],
-                "max": weather_data["felttemperature_max"]
-            }
-            wind_speed = {
-                "min": weather_data["windspeed_min"],
-                "mean": weather_data["windspeed_mean"],
-                "max": weather_data["windspeed_max"]
-            }
-            precipitation = {
-                "probability": weather_data["precipitation_probability"],
-                "amount": weather_data["precipitation"]
-            }
-            days = []
-            for i in range(7):
-                days.append = {
-                    "real_temp": {},
-                    "felt_temp": {},
-                    "wind_speed": {},
-                    "precipitation": {}
-                }
-                days[i]["real_temp"] = {
-                    "min": weather_data["temperature_min"][i],
-                    "mean": weather_data["temperature_mean"][i],
-                    "max": weather_data["temperature_max"][i]
-                }
-                days[i]["felt_temp"] = {
-                    "min": weather_data["felttemperature_min"][i],
-                    "mean": weather_data["felttemperature_mean"][i],
-                    "max": weather_data["felttemperature_max"][i]
-                }
-                days[i]["wind_speed"] = {
-                    "min": weather_data["windspeed_min"][i],
-                    "mean": weather_data["windspeed_mean"][i],
-                    "max": weather_data["windspeed_max"][i]
-                }
-                days[i]["precipitation"] = {
-                    "probability": weather_data["precipitation_probability"][i],
-                    "amount": weather_data["precipitation"][i]
-                }
-
-            general_info.append({"weather": days})
-        info = [{
-            "trip": trip_list[i],
-            "flight": flight_details[i],
-            "general": general_info[i]
-        } for i in range(len(trip_list))]
-        return info
+            if trav_class not in [None, "Economy", "Premium Economy", "Business", "First"]:
+                return ce.CustomException("InvalidClass",
+                                          "The travel class is invalid",
+                                          ValueError("The travel class is invalid"))
+            if flex_days == "" or flex_days is None:
+                flex_days = 0
+            if not isinstance(flex_days, int):
+                if not isinstance(flex_days, str) or not flex_days.isnumeric():
+                    return ce.CustomException("InvalidFlexDaysError",
+                                              "The flexible days must be a number",
+                                              ValueError("The flexible days must be a number"))
+                flex_days = int(flex_days)
+            if not 0 <= flex_days <= amad.FLEX_MAX_DAYS:
+                return ce.CustomException("InvalidFlexDaysError",
+                                          f"The flexible days must be between 0 and {amad.FLEX_MAX_DAYS}",
+                                          ValueError(f"The flexible days must be between 0 and {amad.FLEX_MAX_DAYS}"))
+            descs = [desc.strip() for desc in descriptors.split(",")]
+            for i in range(len(descs)):
+                if descs[i] == "":
+                    descs.pop(i)
+            if len(descs) == 0:
+                return ce.CustomException("InvalidDescriptorsError",
+                                          "The descriptors cannot be empty",
+                                          ValueError("The descriptors cannot be empty"))
+    return {
+        "origin_airport": origin_airport,
+        "origin_name": airports[0][1],
+        "descriptors": descs,
+        "max_price": max_price,
+        "departure_date": format_date(departure_date),
+        "adults": adults,
+        "return_date": format_date(return_date) if return_date is not None else None,
+        "children": children,
+        "infants": infants,
+        "trav_class": trav_class,
+        "non_stop": non_stop,
+        "flex_days": flex_days
+    }
+
+
+def location_request(search: dict) -> str:
+    """
+    Build the Gemini request for a validated search.
+
+    :param search: The validated search parameters.
+        :type search: dict
+
+    :return: The JSON payload for gemini.get_location.
+        :rtype: str
+    """
+    return json.dumps({
+        "max_price": search["max_price"],
+        "origin_airport": search["origin_name"],
+        "descriptors": search["descriptors"]
+    })
+
+
+def build_info(trip_list: list, details: list) -> list:
+    """
+    Combine the trips with their flight and general details.
+
+    :param trip_list: The trips suggested by Gemini.
+        :type trip_list: list
+    :param details: The flight and general details of each trip, in the same order.
+        :type details: list[tuple[dict, dict]]
+
+    :return: The list of trips.
+        :rtype: list
+    """
+    return [{
+        "trip": trip_list[i],
+        "flight": details[i][0],
+        "general": details[i][1]
+    } for i in range(len(trip_list))]
+
+
+def no_trips_error() -> ce.CustomException:
+    """
+    The error returned when Gemini didn't suggest any trips.
+
+    :return: The error.
+        :rtype: Tools.custom_error.CustomException
+    """
+    return ce.CustomException("NoTripsFoundError",
+                              "No trips were found with the specified parameters",
+                              ValueError("No trips were found with the specified parameters"))
+
+
+def unexpected_error(error: Exception) -> ce.CustomException:
+    """
+    Get the error returned for a search that failed unexpectedly.
+
+    :param error: The exception raised.
+        :type error: Exception
+
+    :return: The error.
+        :rtype: Tools.custom_error.CustomException
+    """
+    return ce.CustomException(type(error).__name__, "An Unexpected Error Occurred, Please Try Again Later", error)
+
+
+def resolve_trip(trip: dict, search: dict) -> tuple[dict, dict]:
+    """
+    Resolve the destination airport of a single trip, then get its flight and weather details.
+
+    :param trip: The trip suggested by Gemini.
+        :type trip: dict
+    :param search: The validated search parameters.
+        :type search: dict
+
+    :return: The flight details and the general (weather) details.
+        :rtype: tuple[dict, dict]
+    """
+    airports = csvp.smart_get(csvp.AIRPORTS_PATH, 1, trip["destination_airport"], 1)
+    return get_trip_details(trip, airports, search)
+
+
+def stream_trips(search: dict, max_workers = MAX_CONCURRENCY):
+    """
+    Stream the trips of a validated search from Gemini, looking each one up as soon as it arrives.
+    Each trip's info is yielded, in trip order, as soon as it and every trip before it are done.
+
+    :param search: The validated search parameters.
+        :type search: dict
+    :param max_workers: The maximum number of trips looked up at once.
+        :type max_workers: int | None
+
+    :return: The info of each trip.
+        :rtype: Iterator[dict]
+    """
+    with ThreadPoolExecutor(max_workers=max_workers if max_workers is not None and max_workers > 1 else 1) as executor:
+        pending = deque()
+        for trip in gem.stream_locations(clients["gemini"], location_request(search)):
+            pending.append((trip, executor.submit(resolve_trip, trip, search)))
+            while pending and pending[0][1].done():
+                trip, future = pending.popleft()
+                yield build_info([trip], [future.result()])[0]
+        while pending:
+            trip, future = pending.popleft()
+            yield build_info([trip], [future.result()])[0]
+
+
+async def stream_trips_async(search: dict, max_workers = MAX_CONCURRENCY):
+    """
+    Async version of stream_trips().
+
+    :param search: The validated search parameters.
+        :type search: dict
+    :param max_workers: The maximum number of trips looked up at once.
+        :type max_workers: int | None
+
+    :return: The info of each trip.
+        :rtype: AsyncIterator[dict]
+    """
+    semaphore = asyncio.Semaphore(max_workers if max_workers is not None and max_workers > 1 else 1)
+
+    async def resolve(trip):
+        airports = await asyncio.to_thread(csvp.smart_get, csvp.AIRPORTS_PATH, 1, trip["destination_airport"], 1)
+        async with semaphore:
+            return await get_trip_details_async(trip, airports, search)
+
+    pending = deque()
+    try:
+        async for trip in gem.stream_locations_async(clients["gemini"], location_request(search)):
+            pending.append((trip, asyncio.ensure_future(resolve(trip))))
+            while pending and pending[0][1].done():
+                trip, task = pending.popleft()
+                yield build_info([trip], [task.result()])[0]
+        while pending:
+            trip, task = pending[0]
+            details = await task
+            pending.popleft()
+            yield build_info([trip], [details])[0]
+    finally:
+        for _, task in pending:
+            task.cancel()
+
+
+def search_key(search: dict) -> str:
+    """
+    Get the key shared by identical searches: the validated search parameters, with the origin airport and
+    descriptors lower-cased and the descriptors de-duplicated and sorted.
+
+    :param search: The validated search parameters.
+        :type search: dict
+
+    :return: The key.
+        :rtype: str
+    """
+    key = dict(search)
+    key["origin_airport"] = " ".join(search["origin_airport"].casefold().split())
+    key["descriptors"] = sorted({" ".join(desc.casefold().split()) for desc in search["descriptors"]})
+    return json.dumps(key, sort_keys=True)
+
+
+def run_search(search: dict, max_workers = MAX_CONCURRENCY, stream = False, multi_destination = False):
+    """
+    Run the pipeline for a validated search: get the trips from Gemini, then the flight and weather of each trip.
+
+    :param search: The validated search parameters.
+        :type search: dict
+    :param max_workers: The maximum number of trips looked up at once, None or 1 to look them up one by one.
+        :type max_workers: int | None
+    :param stream: Whether to stream the trips from Gemini and start looking each one up as soon as it arrives.
+        :type stream: bool
+    :param multi_destination: Whether to price all the destinations at once with amadeus.get_multi_flight_data().
+        :type multi_destination: bool
+
+    :return: The list of trips or an error.
+        :rtype: Tools.custom_error.CustomException | list
+    """
+    if stream:
+        info = list(stream_trips(search, max_workers))
+        return info if info else no_trips_error()
+    trip_list = gem.get_location(clients["gemini"], location_request(search))
+    if not trip_list:
+        return no_trips_error()
+    destinations = csvp.smart_get_many(csvp.AIRPORTS_PATH, 1, [item["destination_airport"] for item in trip_list], 1)
+    flights = [None] * len(trip_list)
+    if multi_destination:
+        prices = amad.get_multi_flight_data(clients["amadeus"], [airports[0][4] for airports in destinations if airports],
+                                            **destinations_query(search))
+        flights = [prices[airports[0][4]] if airports else None for airports in destinations]
+    if max_workers is None or max_workers <= 1 or len(trip_list) == 1:
+        details = [get_trip_details(item, airports, search, flight)
+                   for item, airports, flight in zip(trip_list, destinations, flights)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(trip_list))) as executor:
+            details = list(executor.map(lambda args: get_trip_details(args[0], args[1], search, args[2]),
+                                        zip(trip_list, destinations, flights)))
+    return build_info(trip_list, details)
+
+
+async def run_search_async(search: dict, max_workers = MAX_CONCURRENCY, stream = False, multi_destination = False):
+    """
+    Async version of run_search().
+
+    :param search: The validated search parameters.
+        :type search: dict
+    :param max_workers: The maximum number of trips looked up at once, None or 1 to look them up one by one.
+        :type max_workers: int | None
+    :param stream: Whether to stream the trips from Gemini and start looking each one up as soon as it arrives.
+        :type stream: bool
+    :param multi_destination: Whether to price all the destinations at once with amadeus.get_multi_flight_data().
+        :type multi_destination: bool
+
+    :return: The list of trips or an error.
+        :rtype: Tools.custom_error.CustomException | list
+    """
+    if stream:
+        info = [item async for item in stream_trips_async(search, max_workers)]
+        return info if info else no_trips_error()
+    trip_list = await gem.get_location_async(clients["gemini"], location_request(search))
+    if not trip_list:
+        return no_trips_error()
+    destinations = await asyncio.to_thread(csvp.smart_get_many, csvp.AIRPORTS_PATH, 1,
+                                           [item["destination_airport"] for item in trip_list], 1)
+    flights = [None] * len(trip_list)
+    if multi_destination:
+        prices = await amad.get_multi_flight_data_async(clients["amadeus"],
+                                                        [airports[0][4] for airports in destinations if airports],
+                                                        **destinations_query(search))
+        flights = [prices[airports[0][4]] if airports else None for airports in destinations]
+    semaphore = asyncio.Semaphore(max_workers if max_workers is not None and max_workers > 1 else 1)
+
+    async def bounded(item, airports, flight):
+        async with semaphore:
+            return await get_trip_details_async(item, airports, search, flight)
+
+    details = await asyncio.gather(*(bounded(item, airports, flight)
+                                     for item, airports, flight in zip(trip_list, destinations, flights)))
+    return build_info(trip_list, details)
+
+
+def main(origin_airport,
+         descriptors,
+         departure_date,
+         max_price,
+         adults,
+         return_date = None,
+         children = None,
+         infants = None,
+         trav_class = None,
+         non_stop = None,
+         max_workers = MAX_CONCURRENCY,
+         stream = False,
+         multi_destination = False,
+         flex_days = None):
+    """
+    Main function for the website, does most of the logic.
+    The flight and weather lookups of each trip run concurrently, at most max_workers trips at a time, and
+    identical searches made while one is already running wait for it and share its result.
+
+    :param origin_airport: The origin airport.
+        :type origin_airport: str
+    :param descriptors: The descriptors for the trip, comma-delimited.
+        :type descriptors: str
+    :param departure_date: The departure date.
+        :type departure_date: str
+    :param max_price: The maximum price.
+        :type max_price: int
+    :param adults: The number of adult passengers.
+        :type adults: int
+    :param return_date: The return date.
+        :type return_date: str | None
+    :param children: The number of child passengers.
+        :type children: int | None
+    :param infants: The number of infant passengers.
+        :type infants: int | None
+    :param trav_class: The travel class.
+        :type trav_class: str | None
+    :param non_stop: Whether the flight should be non-stop.
+        :type non_stop: bool | None
+    :param max_workers: The maximum number of trips looked up at once, None or 1 to look them up one by one.
+        :type max_workers: int | None
+    :param stream: Whether to stream the trips from Gemini and start looking each one up as soon as it arrives.
+        :type stream: bool
+    :param multi_destination: Whether to price all the destinations in one Amadeus call where possible, at the cost
+        of price-only flight details for the destinations priced that way. Ignored when streaming.
+        :type multi_destination: bool
+    :param flex_days: How many days either side of the dates to search for the cheapest date pair (at most
+        amadeus.FLEX_MAX_DAYS), 0 or None for exact dates. Ignored with multi_destination.
+        :type flex_days: int | None
+
+    :return: The list of trips or an error.
+        :rtype: Tools.custom_error.CustomException | list
+    """
+    try:
+        search = validate_search(origin_airport, descriptors, departure_date, max_price, adults,
+                                 return_date, children, infants, trav_class, non_stop, flex_days)
+        if not isinstance(search, dict):
+            return search
+        return SEARCH_FLIGHTS.do((search_key(search), multi_destination),
+                                 lambda: run_search(search, max_workers, stream, multi_destination))
+    except Exception as e:
+        return unexpected_error(e)
+
+
+async def main_async(origin_airport,
+                     descriptors,
+                     departure_date,
+                     max_price,
+                     adults,
+                     return_date = None,
+                     children = None,
+                     infants = None,
+                     trav_class = None,
+                     non_stop = None,
+                     max_workers = MAX_CONCURRENCY,
+                     stream = False,
+                     multi_destination = False,
+                     flex_days = None):
+    """
+    Async version of main(), running the upstream calls on the event loop instead of holding a thread.
+    The flight and weather lookups of each trip run concurrently, at most max_workers trips at a time.
+
+    :param origin_airport: The origin airport.
+        :type origin_airport: str
+    :param descriptors: The descriptors for the trip, comma-delimited.
+        :type descriptors: str
+    :param departure_date: The departure date.
+        :type departure_date: str
+    :param max_price: The maximum price.
+        :type max_price: int
+    :param adults: The number of adult passengers.
+        :type adults: int
+    :param return_date: The return date.
+        :type return_date: str | None
+    :param children: The number of child passengers.
+        :type children: int | None
+    :param infants: The number of infant passengers.
+        :type infants: int | None
+    :param trav_class: The travel class.
+        :type trav_class: str | None
+    :param non_stop: Whether the flight should be non-stop.
+        :type non_stop: bool | None
+    :param max_workers: The maximum number of trips looked up at once, None or 1 to look them up one by one.
+        :type max_workers: int | None
+    :param stream: Whether to stream the trips from Gemini and start looking each one up as soon as it arrives.
+        :type stream: bool
+    :param multi_destination: Whether to price all the destinations in one Amadeus call where possible, at the cost
+        of price-only flight details for the destinations priced that way. Ignored when streaming.
+        :type multi_destination: bool
+    :param flex_days: How many days either side of the dates to search for the cheapest date pair (at most
+        amadeus.FLEX_MAX_DAYS), 0 or None for exact dates. Ignored with multi_destination.
+        :type flex_days: int | None
+
+    :return: The list of trips or an error.
+        :rtype: Tools.custom_error.CustomException | list
+    """
+    try:
+        search = await asyncio.to_thread(validate_search, origin_airport, descriptors, departure_date, max_price,
+                                         adults, return_date, children, infants, trav_class, non_stop, flex_days)
+        if not isinstance(search, dict):
+            return search
+        return await SEARCH_FLIGHTS.do_async((search_key(search), multi_destination),
+                                             lambda: run_search_async(search, max_workers, stream, multi_destination))
     except Exception as e:
-        return ce.CustomException(type(e).__name__, "An Unexpected Error Occurred, Please Try Again Later", e)
+        return unexpected_error(e)
+
+
+def search_batch(queries: list, max_workers = MAX_CONCURRENCY) -> list:
+    """
+    Run many searches at once, sharing the work between them, for precomputation and bulk queries.
+    The origin and destination airports of the whole batch are each resolved in one indexed pass, and every distinct
+    upstream request (Gemini suggestion, flight query, geocode, forecast cell) is made once, at most max_workers at
+    a time, no matter how many searches need it.
+    Each search gets the result main() would give it (without stream or multi_destination): an airport name
+    resolves to the same rows whatever else is in the batch, and an invalid or failing search only fails itself.
+
+    :param queries: The searches, each a dict of the parameters of main() (origin_airport, descriptors, ...).
+        :type queries: list[dict]
+    :param max_workers: The maximum number of upstream requests made at once.
+        :type max_workers: int
+
+    :return: The result of each search, in order: its list of trips or an error.
+        :rtype: list[list | Tools.custom_error.CustomException | Tools.custom_error.MultiException]
+    """
+    results = [None] * len(queries)
+    origins = sorted({query.get("origin_airport") for query in queries
+                      if isinstance(query.get("origin_airport"), str) and query.get("origin_airport").isalpha()})
+    origin_rows = dict(zip(origins, csvp.smart_get_many(csvp.AIRPORTS_PATH, 1, origins, 1)))
+
+    # Validate, then group identical searches
+    searches = {}
+    query_keys = [None] * len(queries)
+    for i, query in enumerate(queries):
+        try:
+            search = validate_search(**query, origin_rows=origin_rows.get(query.get("origin_airport")))
+        except Exception as e:
+            search = unexpected_error(e)
+        if isinstance(search, dict):
+            query_keys[i] = search_key(search)
+            searches.setdefault(query_keys[i], search)
+        else:
+            results[i] = search
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers or 1)) as executor:
+        # Trip suggestions, once per distinct intent
+        requests = {key: location_request(search) for key, search in searches.items()}
+        suggestions = _run_distinct(executor, {
+            gem.location_key(request): (lambda request=request: gem.get_location(clients["gemini"], request))
+            for request in requests.values()
+        })
+        trips = {}
+        for key, request in requests.items():
+            suggestion = suggestions[gem.location_key(request)]
+            if isinstance(suggestion, Exception):
+                trips[key] = unexpected_error(suggestion)
+            elif not suggestion:
+                trips[key] = no_trips_error()
+            else:
+                trips[key] = suggestion
+
+        # Destination airports, in one pass
+        names = sorted({trip["destination_airport"] for trip_list in trips.values() if isinstance(trip_list, list)
+                        for trip in trip_list
+                        if isinstance(trip, dict) and isinstance(trip.get("destination_airport"), str)})
+        destinations = dict(zip(names, csvp.smart_get_many(csvp.AIRPORTS_PATH, 1, names, 1)))
+
+        # Flights and geocodes, once per distinct query/place
+        flight_calls = {}
+        geocode_calls = {}
+        plans = {}
+        for key, trip_list in trips.items():
+            if not isinstance(trip_list, list):
+                continue
+            plan = []
+            try:
+                for trip in trip_list:
+                    airports = destinations[trip["destination_airport"]]
+                    if not airports:
+                        plan.append(None)
+                        continue
+                    query = flight_query(searches[key], airports[0][4])
+                    flight_key = (amad.offer_key(amad.flight_params(*query)), searches[key]["flex_days"])
+                    flight_calls.setdefault(flight_key, lambda search=searches[key], code=airports[0][4]:
+                                            get_flight_info(search, code))
+                    coords = trip_coordinates(trip, airports)
+                    place = None
+                    if coords is None:
+                        place = meb.normalize_place(trip_location(trip))
+                        geocode_calls.setdefault(place, lambda location=trip_location(trip):
+                                                 meb.geocode(clients["geocoding"], location))
+                    plan.append((flight_key, coords, place))
+            except Exception as e:
+                # A malformed trip only fails its own search
+                trips[key] = unexpected_error(e)
+                continue
+            plans[key] = plan
+        flight_futures = {key: executor.submit(call) for key, call in flight_calls.items()}
+        places = _run_distinct(executor, geocode_calls)
+
+        # Forecasts, once per distinct grid cell
+        weather_calls = {}
+        for plan in plans.values():
+            for i, step in enumerate(plan):
+                if step is None:
+                    continue
+                flight_key, coords, place = step
+                if coords is None:
+                    coords = places[place]
+                if isinstance(coords, Exception):
+                    plan[i] = (flight_key, coords, None)
+                    continue
+                cell = meb.forecast_cell(*coords)[0]
+                weather_calls.setdefault(cell, lambda coords=coords: meb.get_weather_at(clients["meteoblue"], *coords))
+                plan[i] = (flight_key, coords, cell)
+        weathers = _run_distinct(executor, weather_calls)
+        flights = _collect(flight_futures)
+
+    # Fan the results back out
+    outcomes = {}
+    for key, trip_list in trips.items():
+        if not isinstance(trip_list, list):
+            outcomes[key] = trip_list
+            continue
+        try:
+            details = []
+            for trip, step in zip(trip_list, plans[key]):
+                if step is None:
+                    raise IndexError(f"No airport matches {trip['destination_airport']!r}")
+                flight_key, coords, cell = step
+                if isinstance(flights[flight_key], Exception):
+                    raise flights[flight_key]
+                weather = coords if cell is None else weathers[cell]
+                if isinstance(weather, resilience.UpstreamUnavailable):
+                    general = degraded_weather(weather)
+                elif isinstance(weather, Exception):
+                    raise weather
+                else:
+                    general = format_weather(weather["data_day"])
+                details.append((flight_details(flights[flight_key]), general))
+            outcomes[key] = build_info(trip_list, details)
+        except Exception as e:
+            outcomes[key] = unexpected_error(e)
+    for i, key in enumerate(query_keys):
+        if key is not None:
+            results[i] = outcomes[key]
+    return results
+
+
+def _run_distinct(executor, calls: dict) -> dict:
+    """
+    Make a set of distinct calls on an executor and wait for all of them.
+
+    :param executor: The executor.
+        :type executor: concurrent.futures.Executor
+    :param calls: The calls, by key.
+        :type calls: dict[Hashable, Callable[[], Any]]
+
+    :return: The result of each call, or the exception it raised, by key.
+        :rtype: dict
+    """
+    return _collect({key: executor.submit(call) for key, call in calls.items()})
+
+
+def _collect(futures: dict) -> dict:
+    """
+    Wait for a set of futures.
+
+    :param futures: The futures, by key.
+        :type futures: dict[Hashable, concurrent.futures.Future]
+
+    :return: The result of each future, or the exception it raised, by key.
+        :rtype: dict
+    """
+    results = {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            results[key] = e
+    return results
+
 
 if __name__ == "__main__":
     print("Welcome to AdventureCue!")
     print("By following these instructions, you will be able to find the perfect trip for you!")
     print("Please enter the following information:")
     origin_airport = input("Enter the airport you will be departing from (eg. O'Hare, John F. Kennedy, etc.): ")
-    airports = csvp.smart_get("../Data/airports.csv", 1, origin_airport)
+    airports = csvp.smart_get(csvp.AIRPORTS_PATH, 1, origin_airport)
     while len(airports) == 0:
         os.system("cls")
         origin_airport = input("The specified airport could not be found. Please enter the airport you will be departing from (eg. O'Hare, John F. Kennedy, etc.): ")
-        airports = csvp.smart_get("../Data/airports.csv", 1, origin_airport)
+        airports = csvp.smart_get(csvp.AIRPORTS_PATH, 1, origin_airport)
     os.system("cls")
     descriptors = input("Enter comma-seperated descriptors for the trip (eg. beach, mountains, etc.): ")
     while descriptors == "":
@@ -527,9 +1330,9 @@ if __name__ == "__main__":
     print("Airline: " + data[0]["flight"]["airline"])
     print("Cost: " + data[0]["flight"]["cost"])
     print("Number of Seats Available: " + data[0]["flight"]["seats"])
-    print("Departure Time: " + data[0]["flight"]["departure"]["time"])
+    print("Departure Time: " + data[0]["flight"]["departure"]["date"] + " " + data[0]["flight"]["departure"]["time"])
     print("Departure Airport: " + data[0]["flight"]["departure"]["airport"])
-    print("Arrival Time: " + data[0]["flight"]["arrival"]["time"])
+    print("Arrival Time: " + data[0]["flight"]["arrival"]["date"] + " " + data[0]["flight"]["arrival"]["time"])
     print("Arrival Airport: " + data[0]["flight"]["arrival"]["airport"])
     print()
     print("Weather Information:")
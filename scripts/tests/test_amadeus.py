@@ -0,0 +1,364 @@
+# Description: Tests of AccessPoints/amadeus.py.
+import asyncio
+import json
+import unittest
+from datetime import date
+from unittest import mock
+
+import httpx
+
+from AccessPoints import amadeus as amad
+import init_clients
+
+
+def offer(price, carrier="AF", stops=0, duration="PT9H", destination="NCE"):
+    """
+    Get a flight offer as returned by the Amadeus API.
+    """
+    segments = [{"carrierCode": carrier, "departure": {"at": "2030-01-01T10:00:00", "iataCode": "JFK"},
+                 "arrival": {"at": "2030-01-01T19:00:00", "iataCode": "CDG"}} for _ in range(stops + 1)]
+    segments[-1]["arrival"]["iataCode"] = destination
+    return {"price": {"total": f"{price:.2f}", "currency": "USD"}, "validatingAirlineCodes": [carrier],
+            "numberOfBookableSeats": 4, "itineraries": [{"duration": duration, "segments": segments}]}
+
+
+def chunks(body, size):
+    """
+    Split a response body into chunks of size bytes, cutting through offers (and multi-byte characters).
+    """
+    data = body.encode()
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class AmadeusTestCase(unittest.TestCase):
+    """
+    A test case with empty Amadeus caches and an Amadeus API played by handle().
+    """
+
+    def setUp(self):
+        for amadeus_cache in (amad.OFFER_CACHE, amad.DESTINATION_CACHE, amad.FARE_CACHE):
+            amadeus_cache.clear()
+            self.addCleanup(amadeus_cache.clear)
+        amad.AMADEUS.breaker.record_success()
+        self.enterContext(mock.patch.object(amad.AMADEUS, "limiter", None))
+        self.requests = []
+
+    def handle(self, request):
+        return httpx.Response(404, json={"errors": [{"status": 404}]})
+
+    def client(self) -> init_clients.Auth:
+        """
+        Get an Amadeus client whose requests are answered by handle().
+        """
+
+        def handle(request):
+            if str(request.url).startswith(amad.TOKEN_URL):
+                return httpx.Response(200, json={"access_token": "token", "expires_in": 1799})
+            self.requests.append(request)
+            return self.handle(request)
+
+        transport = httpx.MockTransport(handle)
+        return init_clients.Auth(key="key", secret="secret",
+                                 http_config={**init_clients.HTTP_CONFIG, "transport": transport})
+
+
+class OfferCacheTest(AmadeusTestCase):
+
+    def handle(self, request):
+        return httpx.Response(200, json={"data": [offer(420)]})
+
+    def test_flight_params_are_normalized(self):
+        self.assertEqual(amad.flight_params(" jfk", "900", "2030-01-01", "2", None, "nce ", 0, None,
+                                            "Premium Economy", False),
+                         {"originLocationCode": "JFK", "destinationLocationCode": "NCE", "departureDate": "2030-01-01",
+                          "adults": 2, "maxPrice": 900, "travelClass": "PREMIUM_ECONOMY", "nonStop": "false"})
+
+    def test_equivalent_params_share_a_key(self):
+        first = amad.flight_params("JFK", 900, "2030-01-01", 2, "2030-01-08", "NCE", None, 0, "PREMIUM_ECONOMY")
+        second = amad.flight_params("jfk", "900", "2030-01-01", "2", "2030-01-08", "Nce", 0, None, "premium  economy")
+        self.assertEqual(amad.offer_key(first), amad.offer_key(second))
+        self.assertNotEqual(amad.offer_key(first), amad.offer_key(dict(second, maxPrice=901)))
+
+    def test_equivalent_searches_hit_the_cache(self):
+        client = self.client()
+
+        async def search():
+            first = await amad.get_flight_data_async(client, "JFK", 900, "2030-01-01", 1, None, "NCE", None, None,
+                                                     "Economy")
+            second = await amad.get_flight_data_async(client, " jfk", "900", "2030-01-01", "1", None, "nce", 0, 0,
+                                                      "ECONOMY")
+            return first, second
+
+        first, second = asyncio.run(search())
+        self.assertEqual(first, second)
+        self.assertEqual(first["data"][0]["price"], "420.00")
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(amad.OFFER_CACHE.stats()["hits"], 1)
+
+    def test_errors_arent_cached(self):
+        client = self.client()
+        self.handle = lambda request: httpx.Response(400, json={"errors": [{"status": 400}]})
+        self.assertIn("errors", asyncio.run(amad.get_flight_data_async(client, "JFK", 900, "2030-01-01", 1)))
+        self.assertIn("errors", asyncio.run(amad.get_flight_data_async(client, "JFK", 900, "2030-01-01", 1)))
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(len(amad.OFFER_CACHE), 0)
+
+
+class MultiFlightTest(AmadeusTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.destinations_status = 200
+
+    def handle(self, request):
+        if str(request.url).startswith(amad.FLIGHT_DESTINATIONS_URL):
+            if self.destinations_status != 200:
+                return httpx.Response(self.destinations_status, json={"errors": [{"status": self.destinations_status}]})
+            return httpx.Response(200, json={"meta": {"currency": "EUR"}, "data": [
+                {"origin": "JFK", "destination": "NCE", "departureDate": "2030-01-01", "price": {"total": "380.00"}},
+                {"origin": "JFK", "destination": "LIS", "departureDate": "2030-01-01", "price": {"total": "290.00"}},
+                {"origin": "JFK", "destination": "MAD", "departureDate": "2030-01-01"}
+            ]})
+        destination = request.url.params["destinationLocationCode"]
+        return httpx.Response(200, json={"data": [offer(510, destination=destination)]})
+
+    def search(self, adults=1):
+        return asyncio.run(amad.get_multi_flight_data_async(self.client(), ["NCE", "lis", "BCN", "MAD"], "JFK", 1000,
+                                                            "2030-01-01", adults))
+
+    def paths(self):
+        return sorted(request.url.path.rsplit("/", 1)[-1] + ":" + request.url.params.get("destinationLocationCode", "")
+                      for request in self.requests)
+
+    def test_one_call_prices_every_covered_destination(self):
+        results = self.search()
+        self.assertEqual(set(results), {"NCE", "lis", "BCN", "MAD"})
+        self.assertEqual(results["NCE"]["data"][0]["price"], "380.00")
+        self.assertEqual(results["lis"]["data"][0]["currency"], "EUR")
+        self.assertEqual(results["lis"]["meta"]["source"], "flight-destinations")
+        # Uncovered and malformed destinations fall back to a flight-offers search each
+        self.assertEqual(results["BCN"]["data"][0]["arrival"]["iataCode"], "BCN")
+        self.assertEqual(results["MAD"]["data"][0]["price"], "510.00")
+        self.assertEqual(self.paths(), ["flight-destinations:", "flight-offers:BCN", "flight-offers:MAD"])
+
+    def test_rejected_query_falls_back_and_is_cached(self):
+        self.destinations_status = 400
+        results = self.search()
+        self.assertEqual({code: result["data"][0]["price"] for code, result in results.items()},
+                         dict.fromkeys(["NCE", "lis", "BCN", "MAD"], "510.00"))
+        self.assertEqual(len(amad.DESTINATION_CACHE), 1)
+        amad.OFFER_CACHE.clear()
+        self.search()
+        self.assertEqual(self.paths().count("flight-destinations:"), 1)
+
+    def test_searches_it_cant_price_skip_destinations(self):
+        self.search(adults=2)
+        self.assertEqual(self.paths(), ["flight-offers:BCN", "flight-offers:LIS", "flight-offers:MAD",
+                                        "flight-offers:NCE"])
+
+
+class FlexGridTest(unittest.TestCase):
+
+    def test_round_trip_nearest_first(self):
+        departures, returns, cells = amad.flex_grid("2030-01-10", "2030-01-17", 1, today=date(2030, 1, 1))
+        self.assertEqual(departures, ["2030-01-09", "2030-01-10", "2030-01-11"])
+        self.assertEqual(returns, ["2030-01-16", "2030-01-17", "2030-01-18"])
+        self.assertEqual(cells[0], (1, 1))
+        self.assertEqual(set(cells[1:5]), {(0, 1), (2, 1), (1, 0), (1, 2)})
+        self.assertEqual(len(cells), 9)
+
+    def test_one_way_and_invalid_pairs(self):
+        departures, returns, cells = amad.flex_grid("2030-01-02", None, 2, today=date(2030, 1, 1))
+        self.assertEqual(returns, [None])
+        # Today and the day before aren't bookable
+        self.assertEqual([departures[i] for i, _ in cells], ["2030-01-02", "2030-01-03", "2030-01-04"])
+        _, _, cells = amad.flex_grid("2030-01-10", "2030-01-11", 1, today=date(2030, 1, 1))
+        self.assertNotIn((2, 0), cells)
+        self.assertNotIn((2, 1), cells)
+
+
+class FlexSearchTest(unittest.TestCase):
+    """
+    get_flex_flight_data() against a stand-in for get_flight_data() pricing each date pair from PRICES.
+    """
+    PRICES = {("2030-01-09", "2030-01-16"): 450, ("2030-01-09", "2030-01-17"): 520, ("2030-01-09", "2030-01-18"): 610,
+              ("2030-01-10", "2030-01-16"): 330, ("2030-01-10", "2030-01-17"): 400, ("2030-01-10", "2030-01-18"): 480,
+              ("2030-01-11", "2030-01-16"): 700, ("2030-01-11", "2030-01-17"): 390, ("2030-01-11", "2030-01-18"): 360}
+    ARGS = ("JFK", 1000, "2030-01-10", 1, "2030-01-17", "NCE")
+
+    def setUp(self):
+        amad.FARE_CACHE.clear()
+        self.addCleanup(amad.FARE_CACHE.clear)
+        self.calls = []
+        self.errors = set()
+        self.enterContext(mock.patch.object(amad, "get_flight_data", self.get_flight_data))
+        self.enterContext(mock.patch.object(amad, "get_flight_data_async", self.get_flight_data_async))
+
+    def get_flight_data(self, client, origin, maxPrice, departure, adults, returnDate, destination, *args):
+        self.calls.append(((departure, returnDate), maxPrice))
+        if (departure, returnDate) in self.errors:
+            return {"errors": [{"status": 500, "title": "SYSTEM ERROR HAS OCCURRED"}]}
+        price = self.PRICES[departure, returnDate]
+        return {"data": [{"price": f"{price:.2f}"}] if price <= maxPrice else [], "meta": {"count": 1}}
+
+    async def get_flight_data_async(self, *args):
+        await asyncio.sleep(0)
+        return self.get_flight_data(*args)
+
+    def note(self, pair, price, bound):
+        params = amad.flight_params("JFK", bound, pair[0], 1, pair[1], "NCE")
+        amad.note_fare(params, "price", {"data": [{"price": f"{price:.2f}"}] if price is not None else []})
+
+    def test_finds_the_cheapest_pair_and_prunes(self):
+        result = amad.get_flex_flight_data(None, *self.ARGS, flex_days=1, max_workers=1)
+        self.assertEqual((result["best"]["departure"], result["best"]["return"], result["best"]["price"]),
+                         ("2030-01-10", "2030-01-16", 330.0))
+        self.assertEqual(result["best"]["result"]["data"][0]["price"], "330.00")
+        # After the requested pair, every query is capped at the best price so far
+        self.assertEqual(self.calls[0], (("2030-01-10", "2030-01-17"), 1000))
+        self.assertTrue(all(bound <= 400 for _, bound in self.calls[1:]))
+        self.assertEqual(result["prices"][1], [330.0, 400.0, amad.FLEX_PRUNED])
+        self.assertEqual(result["meta"], {"cells": 9, "queries": 9, "cached": 0, "pruned": 7})
+
+    def test_errors_arent_pruned(self):
+        self.errors.add(("2030-01-11", "2030-01-18"))
+        result = amad.get_flex_flight_data(None, *self.ARGS, flex_days=1, max_workers=1)
+        self.assertIsNone(result["prices"][2][2])
+        self.assertEqual(result["meta"]["pruned"], 6)
+
+    def test_settles_from_the_fare_cache(self):
+        self.note(("2030-01-10", "2030-01-16"), 330, 900)
+        self.note(("2030-01-11", "2030-01-18"), 1100, 1200)
+        self.note(("2030-01-09", "2030-01-16"), None, 1500)
+        result = amad.get_flex_flight_data(None, *self.ARGS, flex_days=1, max_workers=1)
+        queried = [pair for pair, _ in self.calls]
+        for pair in (("2030-01-10", "2030-01-16"), ("2030-01-11", "2030-01-18"), ("2030-01-09", "2030-01-16")):
+            self.assertNotIn(pair, queried)
+        self.assertEqual(result["best"]["price"], 330.0)
+        # Above the maximum price, and known to have nothing under it
+        self.assertEqual((result["prices"][2][2], result["prices"][0][0]), (None, None))
+        self.assertEqual(result["meta"]["cached"], 3)
+        self.assertEqual(result["meta"]["queries"], 6)
+
+    def test_known_bound_prunes_without_querying(self):
+        # Nothing under 450 on the 11th to the 18th: once 400 is found, that pair can't win
+        self.note(("2030-01-11", "2030-01-18"), None, 450)
+        result = amad.get_flex_flight_data(None, *self.ARGS, flex_days=1, max_workers=1)
+        self.assertNotIn(("2030-01-11", "2030-01-18"), [pair for pair, _ in self.calls])
+        self.assertEqual(result["prices"][2][2], amad.FLEX_PRUNED)
+
+    def test_async_resettles_after_waiting(self):
+        self.note(("2030-01-11", "2030-01-18"), None, 450)
+        result = asyncio.run(amad.get_flex_flight_data_async(None, *self.ARGS, flex_days=1, max_workers=1))
+        # Every pair was waiting for the one slot before any price was known, so it is settled once it gets it
+        self.assertNotIn(("2030-01-11", "2030-01-18"), [pair for pair, _ in self.calls])
+        self.assertEqual(result["prices"][2][2], amad.FLEX_PRUNED)
+        self.assertEqual(result["best"]["price"], 330.0)
+        self.assertEqual(result["meta"]["queries"], 8)
+        self.assertEqual(result, amad.get_flex_flight_data(None, *self.ARGS, flex_days=1, max_workers=1) | {
+            "meta": result["meta"]})
+
+
+class SummarizeOfferTest(unittest.TestCase):
+
+    def test_keeps_the_shown_fields(self):
+        summary = amad.summarize_offer(dict(offer(420, stops=2, duration="PT13H5M"), id="1", source="GDS",
+                                            travelerPricings=[{"fareDetailsBySegment": []}]))
+        self.assertEqual(summary, {
+            "price": "420.00", "currency": "USD", "carrier": "AF", "seats": 4, "duration": "PT13H5M", "stops": 2,
+            "layovers": ["CDG", "CDG"],
+            "departure": {"at": "2030-01-01T10:00:00", "iataCode": "JFK"},
+            "arrival": {"at": "2030-01-01T19:00:00", "iataCode": "NCE"}
+        })
+
+    def test_carrier_falls_back_to_first_segment(self):
+        bare = offer(420, carrier="LH")
+        del bare["validatingAirlineCodes"], bare["numberOfBookableSeats"]
+        summary = amad.summarize_offer(bare)
+        self.assertEqual((summary["carrier"], summary["seats"], summary["layovers"]), ("LH", None, []))
+
+
+class OfferSelectorTest(unittest.TestCase):
+
+    def select(self, offers, size=50, **options):
+        selector = amad.OfferSelector(**options)
+        body = json.dumps({"meta": {"count": len(offers)}, "data": offers, "dictionaries": {"carriers": {"AF": "Ä"}}})
+        for chunk in chunks(body, size):
+            selector.feed(chunk)
+        return selector
+
+    def test_keeps_the_top_k(self):
+        prices = [700, 320, 950, 410, 320, 180, 880, 505]
+        selector = self.select([offer(price) for price in prices], top_k=3)
+        result = selector.result()
+        self.assertEqual([item["price"] for item in result["data"]], ["180.00", "320.00", "320.00"])
+        self.assertEqual(result["meta"], {"count": len(prices), "rank": "price"})
+        self.assertTrue(selector.done)
+
+    def test_ties_keep_response_order(self):
+        offers = [offer(300, carrier="AF"), offer(300, carrier="LH"), offer(300, carrier="BA")]
+        result = self.select(offers, top_k=2).result()
+        self.assertEqual([item["carrier"] for item in result["data"]], ["AF", "LH"])
+
+    def test_custom_ranks(self):
+        offers = [offer(300, stops=2, duration="PT20H"), offer(500, duration="PT8H"),
+                  offer(400, stops=1, duration="PT7H30M"), offer(450, duration="PT8H")]
+        by_stops = self.select(offers, top_k=2, rank="stops").result()
+        self.assertEqual([item["price"] for item in by_stops["data"]], ["450.00", "500.00"])
+        by_duration = self.select(offers, top_k=2, rank="duration").result()
+        self.assertEqual([item["price"] for item in by_duration["data"]], ["400.00", "450.00"])
+        self.assertEqual(by_duration["meta"]["rank"], "duration")
+
+    def test_skips_malformed_offers(self):
+        missing_price = offer(100)
+        del missing_price["price"]
+        no_segments = offer(150)
+        no_segments["itineraries"][0]["segments"] = []
+        bad_price = offer(200)
+        bad_price["price"]["total"] = "free"
+        result = self.select([missing_price, no_segments, bad_price, "offer", offer(600), offer(500)]).result()
+        self.assertEqual([item["price"] for item in result["data"]], ["500.00", "600.00"])
+        self.assertEqual(result["meta"]["count"], 6)
+
+    def test_done_once_offers_close(self):
+        selector = amad.OfferSelector()
+        selector.feed(b'{"data": [' + json.dumps(offer(420)).encode())
+        self.assertFalse(selector.done)
+        selector.feed(b'], "dictionaries": {')
+        self.assertTrue(selector.done)
+        self.assertEqual(len(selector.result()["data"]), 1)
+
+
+class StreamedOffersTest(AmadeusTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(amad, "OFFER_CHUNK_SIZE", 64))
+        self.read = []
+
+    def handle(self, request):
+        offers = [offer(price) for price in (610, 240, 980, 330, 455, 275, 720)]
+        head = json.dumps({"meta": {"count": len(offers)}, "data": offers})[:-1]
+        parts = chunks(head, 64) + chunks(', "dictionaries": {"locations": {' + ", ".join(
+            f'"X{i:02}": {{"cityCode": "X{i:02}"}}' for i in range(200)) + "}}}", 64)
+
+        async def stream():
+            for i, part in enumerate(parts):
+                self.read.append(i)
+                yield part
+
+        self.parts = len(parts)
+        return httpx.Response(200, content=stream())
+
+    def test_streamed_body_selects_best_and_stops_reading(self):
+        result = asyncio.run(amad.get_flight_data_async(self.client(), "JFK", 1000, "2030-01-01", 1, top_k=3))
+        self.assertEqual([item["price"] for item in result["data"]], ["240.00", "275.00", "330.00"])
+        self.assertEqual(result["meta"]["count"], 7)
+        # The dictionaries after the offers are never downloaded
+        self.assertLess(len(self.read), self.parts // 2)
+        self.assertEqual(amad.OFFER_CACHE.get((amad.offer_key(amad.flight_params("JFK", 1000, "2030-01-01", 1)),
+                                               3, "price")), result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,226 @@
+# Description: Tests of Tools/cache.py.
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from Tools import cache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        lru = cache.LRUCache(maxsize=2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        self.assertEqual(lru.get("a"), 1)
+        lru.set("c", 3)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual((lru.get("a"), lru.get("c")), (1, 3))
+        self.assertEqual(len(lru), 2)
+
+    def test_ttl(self):
+        lru = cache.LRUCache(ttl=0.05)
+        lru.set("a", 1)
+        lru.set("b", 2, ttl=10)
+        self.assertEqual(lru.get("a"), 1)
+        time.sleep(0.06)
+        self.assertIsNone(lru.get("a"))
+        self.assertEqual(lru.get("b"), 2)
+        self.assertEqual(len(lru), 1)
+
+    def test_max_bytes(self):
+        lru = cache.LRUCache(maxsize=10, max_bytes=10)
+        lru.set("a", "x", size=4)
+        lru.set("b", "y", size=4)
+        lru.set("c", "z", size=4)
+        self.assertIsNone(lru.get("a"))
+        self.assertEqual(lru.stats()["bytes"], 8)
+        lru.set("huge", "w", size=11)
+        self.assertIsNone(lru.get("huge"))
+        lru.set("b", "y", size=1)
+        self.assertEqual(lru.stats()["bytes"], 5)
+        self.assertEqual(cache.LRUCache(max_bytes=100).sizeof({"a": 1}), len('{"a": 1}'))
+
+    def test_stats(self):
+        lru = cache.LRUCache(ttl=0.05)
+        lru.set("a", 1)
+        lru.get("a")
+        lru.get("b")
+        time.sleep(0.06)
+        lru.get("a")
+        self.assertEqual(lru.stats(), {"hits": 1, "stale_hits": 0, "misses": 2, "hit_ratio": 1 / 3,
+                                       "entries": 0, "bytes": 0})
+
+    def test_get_or_load(self):
+        lru = cache.LRUCache()
+        loads = []
+        self.assertEqual(lru.get_or_load("a", lambda: loads.append(1) or "value"), "value")
+        self.assertEqual(lru.get_or_load("a", lambda: loads.append(1) or "other"), "value")
+        self.assertEqual(len(loads), 1)
+
+    def test_stale_entry_refreshes_in_background(self):
+        lru = cache.LRUCache(ttl=0.05, stale_ttl=10)
+        lru.set("a", "old")
+        time.sleep(0.06)
+        release = threading.Event()
+        loads = []
+
+        def loader():
+            loads.append(1)
+            release.wait(1)
+            return "new"
+
+        self.assertIsNone(lru.get("a"))
+        self.assertEqual(lru.get_or_load("a", loader), "old")
+        # Only one refresh runs per key
+        self.assertEqual(lru.get_or_load("a", loader), "old")
+        release.set()
+        for _ in range(100):
+            if lru.get("a") == "new":
+                break
+            time.sleep(0.01)
+        self.assertEqual(lru.get("a"), "new")
+        self.assertEqual(len(loads), 1)
+
+    def test_stale_entry_refreshes_in_background_task(self):
+        lru = cache.LRUCache(ttl=0.05, stale_ttl=10)
+        lru.set("a", "old")
+        time.sleep(0.06)
+
+        async def loader():
+            await asyncio.sleep(0.01)
+            return "new"
+
+        async def load():
+            value = await lru.get_or_load_async("a", loader)
+            self.assertEqual(len(lru._tasks), 1)
+            await asyncio.sleep(0.05)
+            return value
+
+        self.assertEqual(asyncio.run(load()), "old")
+        self.assertEqual(lru.get("a"), "new")
+        self.assertEqual(lru._tasks, set())
+
+    def test_failed_refresh_keeps_stale_entry(self):
+        lru = cache.LRUCache(ttl=0.05, stale_ttl=10)
+        lru.set("a", "old")
+        time.sleep(0.06)
+
+        async def failing():
+            raise RuntimeError("upstream down")
+
+        async def load():
+            value = await lru.get_or_load_async("a", failing)
+            await asyncio.sleep(0.01)
+            return value
+
+        self.assertEqual(asyncio.run(load()), "old")
+        self.assertEqual(lru.get_or_load("a", lambda: "unused"), "old")
+
+    def test_expired_past_stale_window_loads(self):
+        lru = cache.LRUCache(ttl=0.02, stale_ttl=0.02)
+        lru.set("a", "old")
+        time.sleep(0.05)
+        self.assertEqual(lru.get_or_load("a", lambda: "new"), "new")
+
+
+class SQLiteCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite3")
+
+    def test_round_trip(self):
+        sqlite = cache.SQLiteCache(self.path, "test")
+        sqlite.set("a", {"coords": [1.5, 2.5]})
+        self.assertEqual(sqlite.get("a"), {"coords": [1.5, 2.5]})
+        self.assertEqual(cache.SQLiteCache(self.path, "test").get("a"), {"coords": [1.5, 2.5]})
+        self.assertEqual(sqlite.lookup("a"), ({"coords": [1.5, 2.5]}, None))
+        sqlite.delete("a")
+        self.assertIsNone(sqlite.get("a"))
+        self.assertIsNone(sqlite.lookup("a"))
+
+    def test_namespaces(self):
+        first, second = cache.SQLiteCache(self.path, "first"), cache.SQLiteCache(self.path, "second")
+        first.set("a", 1)
+        second.set("a", 2)
+        first.clear()
+        self.assertIsNone(first.get("a"))
+        self.assertEqual(second.get("a"), 2)
+
+    def test_ttl(self):
+        sqlite = cache.SQLiteCache(self.path, "test", ttl=0.05)
+        sqlite.set("a", 1)
+        sqlite.set("b", 2)
+        value, remaining = sqlite.lookup("a")
+        self.assertEqual(value, 1)
+        self.assertTrue(0 < remaining <= 0.05, remaining)
+        time.sleep(0.06)
+        self.assertEqual(sqlite.get("a", "missing"), "missing")
+        sqlite.purge()
+        self.assertEqual(sqlite._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0], 0)
+
+    def test_unusable_file_is_a_miss(self):
+        sqlite = cache.SQLiteCache(os.path.join(self.path, "missing", "cache.sqlite3"), "test")
+        sqlite.set("a", 1)
+        self.assertEqual(sqlite.get("a", "missing"), "missing")
+
+
+class TieredCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite3")
+
+    def test_back_hits_fill_front(self):
+        back = cache.SQLiteCache(self.path, "test")
+        tiered = cache.TieredCache(cache.LRUCache(), back)
+        back.set("a", [1, 2])
+        self.assertIsNone(tiered.front.get("a"))
+        self.assertEqual(tiered.get("a"), [1, 2])
+        self.assertEqual(tiered.front.get("a"), [1, 2])
+        self.assertEqual(tiered.get("b", "missing"), "missing")
+
+    def test_front_hits_skip_back(self):
+        tiered = cache.TieredCache(cache.LRUCache(), cache.SQLiteCache(self.path, "test"))
+        tiered.front.set("a", 1)
+        self.assertEqual(tiered.get("a"), 1)
+        self.assertIsNone(tiered.back.get("a"))
+
+    def test_promoted_entries_keep_their_expiry(self):
+        back = cache.SQLiteCache(self.path, "test", ttl=0.2)
+        tiered = cache.TieredCache(cache.LRUCache(ttl=60), back)
+        back.set("a", 1)
+        time.sleep(0.1)
+        self.assertEqual(tiered.get("a"), 1)
+        time.sleep(0.12)
+        # Another process may have stored a fresher value by now, so the copy mustn't outlive the original
+        self.assertIsNone(tiered.front.get("a"))
+        self.assertEqual(tiered.get("a", "missing"), "missing")
+
+    def test_promoted_entries_dont_outlive_front_ttl(self):
+        tiered = cache.TieredCache(cache.LRUCache(ttl=0.05), cache.SQLiteCache(self.path, "test", ttl=60))
+        tiered.back.set("a", 1)
+        self.assertEqual(tiered.get("a"), 1)
+        time.sleep(0.06)
+        self.assertIsNone(tiered.front.get("a"))
+        self.assertEqual(tiered.get("a"), 1)
+
+    def test_writes_go_to_both(self):
+        tiered = cache.TieredCache(cache.LRUCache(), cache.SQLiteCache(self.path, "test"))
+        tiered.set("a", 1)
+        self.assertEqual((tiered.front.get("a"), tiered.back.get("a")), (1, 1))
+        tiered.delete("a")
+        self.assertEqual((tiered.front.get("a"), tiered.back.get("a")), (None, None))
+        tiered.set("b", 2)
+        tiered.clear()
+        self.assertEqual((tiered.front.get("b"), tiered.back.get("b")), (None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
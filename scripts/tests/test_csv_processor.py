@@ -0,0 +1,132 @@
+# Description: Tests of Tools/csv_processor.py.
+import unittest
+
+from fuzzywuzzy import fuzz
+
+from Tools import csv_processor as csvp
+
+
+class AirportIndexTest(unittest.TestCase):
+
+    def test_city_centroid(self):
+        index = csvp.get_airport_index()
+        points = [csvp.row_coordinates(row) for row in index.rows if row[2] == "London" and row[3] == "United Kingdom"]
+        lat, lng = index.city_centroid("london", "United Kingdom")
+        self.assertAlmostEqual(lat, sum(point[0] for point in points) / len(points), places=4)
+        self.assertAlmostEqual(lng, sum(point[1] for point in points) / len(points), places=4)
+        self.assertEqual(index.city_centroid("Nice"), index.coordinates(index.codes["NCE"][0]))
+
+    def test_country_mismatch_uses_unambiguous_city(self):
+        index = csvp.get_airport_index()
+        self.assertEqual(index.city_centroid("Nice", "FR"), index.city_centroid("Nice", "France"))
+        # London is in several countries, so a country that doesn't match can't pick one
+        self.assertIsNone(index.city_centroid("London", "Atlantis"))
+        self.assertIsNone(index.city_centroid("Atlantis", "Atlantis"))
+
+
+class AirlineIndexTest(unittest.TestCase):
+
+    def test_active_airlines_rank_first(self):
+        rows = [["1", "Gone Air", "", "GA", "GON", "", "", "N"],
+                ["2", "Going Air", "", "GA", "GOA", "", "", "Y"],
+                ["3", "Other Air", "", "OA", "OTH", "", "", "n"]]
+        self.assertEqual(list(csvp.AirlineIndex._code_order(rows)), [1, 0, 2])
+        self.assertEqual(csvp.AirlineIndex.build_indexes(rows)["codes"]["GA"], [1, 0])
+
+    def test_shared_code_resolves_to_active_airline(self):
+        index = csvp.get_airline_index()
+        self.assertEqual([row[1] for row in index.lookup_code("W9")],
+                         ["Air Bagan", "Abelag Aviation", "Eastwind Airlines"])
+        self.assertEqual(index.lookup_name(" british  AIRWAYS")[0][3], "BA")
+
+
+class ResolveCodeTest(unittest.TestCase):
+
+    def test_exact_iata_and_icao(self):
+        for code in ("JFK", "KJFK", " jfk "):
+            self.assertEqual(csvp.resolve_code(csvp.AIRPORTS_PATH, code)[1], "John F Kennedy International Airport")
+        self.assertEqual(csvp.resolve_code(csvp.AIRLINES_PATH, "ba")[1], "British Airways")
+
+    def test_unknown_code_falls_back_to_fuzzy_match(self):
+        self.assertEqual(csvp.resolve_code(csvp.AIRPORTS_PATH, "(LHR)")[4], "LHR")
+        self.assertIsNone(csvp.resolve_code(csvp.AIRPORTS_PATH, "ZZZZZ"))
+
+
+def full_scan(index, query):
+    """
+    Get the best airport for a name the way the old smart_get did, scoring every name in airports.csv.
+    """
+    scored = [(csvp.custom_ratio(value, query), min(row_ids)) for value, row_ids in index.column(1).items()]
+    score, row_id = min(scored, key=lambda x: (-x[0], x[1]))
+    return index.rows[row_id] if score > csvp.MATCH_THRESHOLD else None
+
+
+def full_scan_many(index, queries):
+    """
+    Vectorized full_scan(), scoring with rapidfuzz (which matches fuzzywuzzy's scores, see SearchManyTest).
+    Names whose token_set_ratio is too low for custom_ratio to clear the match threshold are skipped.
+    """
+    names = index.column(1)
+    choices = list(names)
+    best = []
+    for query in queries:
+        words = query.split()
+        scores = csvp.rapid_process.cdist([query], choices, scorer=csvp.rapid_fuzz.token_set_ratio,
+                                          processor=csvp.fuzz_process,
+                                          score_cutoff=csvp.MATCH_THRESHOLD - 2 * len(words))[0]
+        scored = [(0, 0)]
+        for choice in scores.nonzero()[0]:
+            num_similar = [word in choices[choice] for word in words].count(True)
+            scored.append(((round(scores[choice]) + 92 * num_similar) / (1 + num_similar), min(names[choices[choice]])))
+        score, row_id = min(scored, key=lambda x: (-x[0], x[1]))
+        best.append(index.rows[row_id] if score > csvp.MATCH_THRESHOLD else None)
+    return best
+
+
+class SearchParityTest(unittest.TestCase):
+
+    def best(self, query):
+        rows = csvp.get_airport_index().search(1, query, 1)
+        return rows[0] if rows else None
+
+    def test_weak_pruned_match_falls_back_to_full_scan(self):
+        query = "Honolulu International Airport"
+        self.assertEqual(self.best(query), full_scan(csvp.get_airport_index(), query))
+
+    @unittest.skipIf(csvp.rapid_process is None, "rapidfuzz is not installed")
+    def test_same_best_match_as_full_scan(self):
+        index = csvp.get_airport_index()
+        names = list(index.column(1))[::500]
+        queries = names + [name.lower() for name in names] + ["Charles de Gaulle", "Kennedy", "Dubai International"]
+        self.assertEqual([self.best(query) for query in queries], full_scan_many(index, queries))
+
+
+@unittest.skipIf(csvp.rapid_process is None, "rapidfuzz is not installed")
+class SearchManyTest(unittest.TestCase):
+
+    def test_same_scores_as_fuzzywuzzy(self):
+        for query, value in [("Zürich Airport", "Zurich Airport"), ("São Paulo", "Sao Paulo Guarulhos"),
+                             ("Côte d'Azur", "Cote d Azur"), ("O'Hare", "Chicago O'Hare International Airport")]:
+            rapid = csvp.rapid_fuzz.token_set_ratio(query, value, processor=csvp.fuzz_process)
+            self.assertEqual(round(rapid), fuzz.token_set_ratio(query, value), (query, value))
+
+    def test_same_rows_as_search(self):
+        queries = ["Zürich Airport", "Kennedy", "Charles de Gaulle", "Nice Côte d'Azur Airport", "zzzz"]
+        index = csvp.get_airport_index()
+        self.assertEqual(index.search_many(1, queries, 3), [index.search(1, query, 3) for query in queries])
+
+    def test_batch_doesnt_change_results(self):
+        index = csvp.get_airport_index()
+        batches = [["Honolulu International Airport"],
+                   ["Honolulu International Airport", "Malé International Airport"],
+                   ["Malé International Airport", "Heathrow", "Honolulu International Airport", "Heathrow"],
+                   ["Zürich", "zzzz", "Honolulu International Airport"]]
+        expected = {query: index.search(1, query, 3) for query in set().union(*batches)}
+        for queries in batches:
+            self.assertEqual(index.search_many(1, queries, 3), [expected[query] for query in queries], queries)
+        self.assertEqual(index.search_many(2, ["London", "Pariss"]),
+                         [index.search(2, "London"), index.search(2, "Pariss")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# Description: Tests of Tools/data_compiler.py.
+import os
+import tempfile
+import unittest
+
+from Tools import data_compiler
+
+CSV = "\n".join([
+    '1,"Nice Cote d\'Azur Airport",Nice,France,NCE,LFMN,43.66,7.21',
+    '2,Heathrow Airport,London,United Kingdom,LHR,LFLL,51.47,-0.46',
+    '3,Gatwick Airport,London,United Kingdom,LGW,\\N,51.14,-0.19',
+]) + "\n"
+
+
+def index_cities(rows):
+    """
+    Index the rows by city, upper-cased.
+    """
+    cities = {}
+    for row_id, row in enumerate(rows):
+        cities.setdefault(row[2].upper(), []).append(row_id)
+    return {"cities": cities}
+
+
+class CsvTestCase(unittest.TestCase):
+    """
+    A test case with CSV written to a temporary airports.csv.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.csv_path = os.path.join(directory.name, "airports.csv")
+        with open(self.csv_path, "w", encoding="utf-8") as file:
+            file.write(CSV)
+
+
+class CompileTest(CsvTestCase):
+
+    def test_round_trip(self):
+        table = data_compiler.load(self.csv_path, (4, 5), (6, 7))
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table[0], ("1", "Nice Cote d'Azur Airport", "Nice", "France", "NCE", "LFMN", "43.66", "7.21"))
+        self.assertEqual(table[-1][5], "")
+        self.assertEqual(table.value(1, 4), "LHR")
+        self.assertEqual(table.column_values(2), ["Nice", "London", "London"])
+        self.assertEqual(table.column_values(5), ["LFMN", "LFLL", ""])
+        self.assertAlmostEqual(table.floats(6)[1], 51.47, places=4)
+        with self.assertRaises(IndexError):
+            table[3]
+
+    def test_reuses_compiled_file(self):
+        data_compiler.load(self.csv_path, (4, 5), (6, 7))
+        bin_path = data_compiler.binary_path(self.csv_path)
+        compiled_at = os.stat(bin_path).st_mtime_ns
+        self.assertEqual(data_compiler.load(self.csv_path, (4, 5), (6, 7))[2][1], "Gatwick Airport")
+        self.assertEqual(os.stat(bin_path).st_mtime_ns, compiled_at)
+
+    def test_changed_csv_recompiles(self):
+        table = data_compiler.load(self.csv_path, (4, 5), (6, 7))
+        with open(self.csv_path, "a", encoding="utf-8") as file:
+            file.write("4,Zürich Airport,Zurich,Switzerland,ZRH,LSZH,47.46,8.55\n")
+        self.assertTrue(table.is_stale(self.csv_path, (4, 5), (6, 7)))
+        table = data_compiler.load(self.csv_path, (4, 5), (6, 7))
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table[3][1], "Zürich Airport")
+        self.assertFalse(table.is_stale(self.csv_path, (4, 5), (6, 7)))
+
+    def test_corrupt_file_recompiles(self):
+        with open(data_compiler.binary_path(self.csv_path), "wb") as file:
+            file.write(b"garbage")
+        self.assertEqual(len(data_compiler.load(self.csv_path)), 3)
+
+    def test_in_memory_table(self):
+        table = data_compiler.Table(data_compiler.compile_csv(self.csv_path, (4,)))
+        self.assertEqual(table[2][4], "LGW")
+        with self.assertRaises(ValueError):
+            data_compiler.Table(b"WAFT" + bytes(16))
+
+
+class CompiledIndexTest(CsvTestCase):
+
+    def load(self, **options):
+        return data_compiler.load(self.csv_path, (4, 5), (6, 7), index_cities, **options)
+
+    def test_index_lookups(self):
+        cities = self.load().index("cities")
+        self.assertEqual(list(cities["LONDON"]), [1, 2])
+        self.assertEqual(list(cities.get("NICE")), [0])
+        self.assertIsNone(cities.get("PARIS"))
+        self.assertEqual(list(cities), ["LONDON", "NICE"])
+        self.assertEqual({city: list(row_ids) for city, row_ids in cities.items()}, {"LONDON": [1, 2], "NICE": [0]})
+        self.assertIsNone(self.load().index("names"))
+
+    def test_layout_is_stamped(self):
+        table = self.load(layout={"version": 1})
+        self.assertFalse(table.is_stale(self.csv_path, (4, 5), (6, 7), {"version": 1}))
+        self.assertTrue(table.is_stale(self.csv_path, (4,), (6, 7), {"version": 1}))
+        self.assertTrue(table.is_stale(self.csv_path, (4, 5), (6,), {"version": 1}))
+        self.assertTrue(table.is_stale(self.csv_path, (4, 5), (6, 7), {"version": 2}))
+
+    def test_other_layout_recompiles(self):
+        self.load(layout={"version": 1})
+        table = data_compiler.load(self.csv_path, (4,), (), layout={"version": 2})
+        self.assertEqual(table.meta["layout"], {"code_columns": [4], "float_columns": [], "indexes": {"version": 2}})
+        self.assertEqual(table.meta["indexes"], {})
+        self.assertEqual(table[1][4], "LHR")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# Description: Tests of AccessPoints/gemini.py.
+import json
+import os
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from AccessPoints import gemini as gem
+import init_clients
+from Tools import cache
+
+
+def request(max_price, origin_airport="John F Kennedy International Airport", descriptors=("beach", "sun")):
+    """
+    Get the data sent to the Gemini model for a search.
+    """
+    return json.dumps({"max_price": max_price, "origin_airport": origin_airport, "descriptors": list(descriptors)})
+
+
+class LocationKeyTest(unittest.TestCase):
+
+    def test_same_intent_same_key(self):
+        self.assertEqual(gem.location_key(request(900)),
+                         gem.location_key(request("900", " john f  kennedy International airport",
+                                                  ["Sun", "beach ", "beach"])))
+
+    def test_budget_is_exact(self):
+        self.assertNotEqual(gem.location_key(request(760)), gem.location_key(request(1000)))
+
+
+class LocationCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(mock.patch.object(cache, "CACHE_PATH", os.path.join(directory.name, "cache.sqlite3")))
+        self.enterContext(mock.patch.dict(os.environ))
+        for name in ("GEMINI_LOCATION_CACHE", "GEMINI_LOCATION_TTL", "GEMINI_LOCATION_CACHE_SIZE"):
+            os.environ.pop(name, None)
+
+    def test_backends(self):
+        memory = gem.make_location_cache()
+        self.assertIsInstance(memory, cache.LRUCache)
+        self.assertEqual((memory.maxsize, memory.ttl), (gem.LOCATION_CACHE_SIZE, gem.LOCATION_TTL))
+        disk = gem.make_location_cache("disk", ttl=60)
+        self.assertIsInstance(disk, cache.SQLiteCache)
+        self.assertEqual((disk.path, disk.ttl), (cache.CACHE_PATH, 60))
+        tiered = gem.make_location_cache("tiered", ttl=60, size=10)
+        self.assertEqual((tiered.front.maxsize, tiered.front.ttl, tiered.back.ttl), (10, 60, 60))
+        with self.assertRaises(ValueError):
+            gem.make_location_cache("redis")
+
+    def test_settings_from_environment(self):
+        os.environ.update(GEMINI_LOCATION_CACHE="tiered", GEMINI_LOCATION_TTL="90", GEMINI_LOCATION_CACHE_SIZE="7")
+        tiered = gem.make_location_cache()
+        self.assertEqual((tiered.front.maxsize, tiered.front.ttl, tiered.back.ttl), (7, 90, 90))
+        self.assertEqual(gem.make_location_cache("memory", size=3).maxsize, 3)
+
+    def test_suggestions_use_the_configured_cache(self):
+        calls = []
+
+        def generate_content(**kwargs):
+            calls.append(kwargs)
+            return types.SimpleNamespace(text=json.dumps([{"destination_airport": "Nice Cote d'Azur Airport"}]))
+
+        client = init_clients.Auth(client=types.SimpleNamespace(
+            models=types.SimpleNamespace(generate_content=generate_content)))
+        self.enterContext(mock.patch.object(gem.GEMINI, "limiter", None))
+        self.enterContext(mock.patch.object(gem, "_config", lambda: None))
+        self.addCleanup(gem.set_location_cache, gem.LOCATION_CACHE)
+        gem.set_location_cache(gem.make_location_cache("disk"))
+        trips = gem.get_location(client, request(900))
+        self.assertEqual(gem.get_location(client, request("900")), trips)
+        self.assertEqual(len(calls), 1)
+        # Another process sharing the file gets the suggestions without calling Gemini
+        self.assertEqual(gem.make_location_cache("disk").get(gem.location_key(request(900))), trips)
+
+
+if __name__ == "__main__":
+    unittest.main()
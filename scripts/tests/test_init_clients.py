@@ -0,0 +1,126 @@
+# Description: Tests of init_clients.py.
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import httpx
+
+import init_clients
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_modules(code) -> set:
+    """
+    Get the modules loaded by code run in a fresh interpreter, from a directory without creds.json.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        script = f"import sys; sys.path.insert(0, {SCRIPTS_DIR!r}); {code}; print(' '.join(sys.modules))"
+        result = subprocess.run([sys.executable, "-c", script], cwd=directory, capture_output=True, text=True,
+                                check=True)
+    return set(result.stdout.split())
+
+
+class TokenManagerTest(unittest.TestCase):
+
+    def test_get_async_on_several_loops(self):
+        tokens = init_clients.TokenManager()
+        fetched = []
+
+        async def fetch():
+            fetched.append(True)
+            await asyncio.sleep(0)
+            return {"access_token": f"token-{len(fetched)}", "expires_in": 0}
+
+        async def both():
+            # The second caller waits on the lock, which binds it to the loop
+            return await asyncio.gather(tokens.get_async(fetch), tokens.get_async(fetch))
+
+        # An expired token makes every call refresh, each run on a new loop
+        for run in range(1, 4):
+            self.assertEqual(asyncio.run(both()), [f"token-{2 * run - 1}", f"token-{2 * run}"])
+
+    def test_get_async_shares_refresh(self):
+        tokens = init_clients.TokenManager()
+        fetched = []
+
+        async def fetch():
+            fetched.append(True)
+            await asyncio.sleep(0.01)
+            return {"access_token": "token", "expires_in": 1799}
+
+        async def many():
+            return await asyncio.gather(*(tokens.get_async(fetch) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(many()), ["token"] * 5)
+        self.assertEqual(len(fetched), 1)
+
+    def test_concurrent_rejections_refresh_once(self):
+        tokens = init_clients.TokenManager()
+        fetched = []
+
+        async def fetch():
+            fetched.append(True)
+            await asyncio.sleep(0.01)
+            return {"access_token": f"token-{len(fetched)}", "expires_in": 1799}
+
+        async def call():
+            token = await tokens.get_async(fetch)
+            await asyncio.sleep(0.01)
+            if token == "token-1":
+                # The API rejects the first token
+                tokens.invalidate(token)
+                token = await tokens.get_async(fetch)
+            return token
+
+        async def many():
+            return await asyncio.gather(*(call() for _ in range(5)))
+
+        self.assertEqual(asyncio.run(many()), ["token-2"] * 5)
+        self.assertEqual(len(fetched), 2)
+
+    def test_invalidate_without_token(self):
+        tokens = init_clients.TokenManager()
+        self.assertEqual(tokens.get(lambda: {"access_token": "token"}), "token")
+        tokens.invalidate("other")
+        self.assertEqual(tokens.get(lambda: {"access_token": "new"}), "token")
+        tokens.invalidate()
+        self.assertEqual(tokens.get(lambda: {"access_token": "new"}), "new")
+
+
+class AsyncSessionTest(unittest.TestCase):
+
+    def test_session_per_loop(self):
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"ok": True}))
+        client = init_clients.Auth(key="key", http_config={**init_clients.HTTP_CONFIG, "transport": transport})
+
+        async def get():
+            first, second = client.async_session, client.async_session
+            self.assertIs(first, second)
+            response = await first.get("https://example.com/")
+            return first, response.json()
+
+        session, body = asyncio.run(get())
+        self.assertEqual(body, {"ok": True})
+        other, body = asyncio.run(get())
+        self.assertIsNot(other, session)
+        self.assertEqual(body, {"ok": True})
+
+
+class LazyImportTest(unittest.TestCase):
+
+    def test_importing_main_loads_no_client_library(self):
+        modules = loaded_modules("import main")
+        for name in ("google.genai", "pydantic", "httpx", "requests"):
+            self.assertNotIn(name, modules)
+
+    def test_requests_loads_with_the_first_session(self):
+        self.assertNotIn("requests", loaded_modules("import init_clients; init_clients.Auth(key='key')"))
+        self.assertIn("requests", loaded_modules("import init_clients; init_clients.Auth(key='key').session"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+# Description: Tests of Tools/json_stream.py.
+import json
+import unittest
+
+from Tools import json_stream
+
+DOCUMENT = json.dumps({
+    "meta": {"count": 3, "links": {"self": "https://example.com/?q=[1]"}},
+    "data": [
+        {"id": "1", "price": {"total": "420.00"}, "note": "brackets ] and braces } in \"strings\""},
+        12.5,
+        [1, [2, 3]],
+        {"id": "4", "city": "Zürich"},
+        None,
+        -3e-2,
+        True
+    ],
+    "dictionaries": {"data": ["not", "this", "one"]}
+})
+
+
+def chunked(text, size):
+    """
+    Split a text into chunks of a given size.
+    """
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class ArrayStreamParserTest(unittest.TestCase):
+
+    def test_every_chunk_size(self):
+        expected = json.loads(DOCUMENT)["data"]
+        for size in (1, 2, 3, 7, 64, len(DOCUMENT)):
+            parser = json_stream.ArrayStreamParser("data")
+            items = [item for chunk in chunked(DOCUMENT, size) for item in parser.feed(chunk)]
+            self.assertEqual(items, expected, size)
+            self.assertTrue(parser.done)
+
+    def test_items_arrive_as_they_close(self):
+        parser = json_stream.ArrayStreamParser()
+        self.assertEqual(parser.feed('[{"a": 1}, {"b"'), [{"a": 1}])
+        self.assertEqual(parser.feed(': 2}, 3'), [{"b": 2}])
+        self.assertEqual(parser.feed('4]'), [34])
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.feed('[5]'), [])
+
+    def test_top_level_array(self):
+        self.assertEqual(list(json_stream.iter_array(chunked('[1, "two", {"three": [3]}]', 4))),
+                         [1, "two", {"three": [3]}])
+
+    def test_empty_and_missing_array(self):
+        self.assertEqual(list(json_stream.iter_array(['{"data": []}'], "data")), [])
+        self.assertEqual(list(json_stream.iter_array(['{"errors": [{"code": 1}]}'], "data")), [])
+
+    def test_bytes_split_inside_a_character(self):
+        encoded = DOCUMENT.encode("utf-8")
+        items = list(json_stream.iter_array(chunked(encoded, 5), "data"))
+        self.assertEqual(items, json.loads(DOCUMENT)["data"])
+
+
+if __name__ == "__main__":
+    unittest.main()
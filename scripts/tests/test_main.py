@@ -0,0 +1,168 @@
+# Description: Tests of main.py.
+import json
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+import main
+from AccessPoints import amadeus as amad
+from AccessPoints import meteoblue as meb
+from Tools import csv_processor as csvp
+
+
+def trip(city, country, state=None):
+    """
+    Get a trip as suggested by Gemini.
+    """
+    return {"location": {"city": city, "state": state, "country": country}}
+
+
+def suggestion(city, country, airport):
+    """
+    Get a trip as suggested by Gemini, with its destination airport and price.
+    """
+    return dict(trip(city, country), destination_airport=airport, price=900)
+
+
+DATA_DAY = {column: [1.0, 2.0, 3.0] for fields in meb.Forecast.FIELDS.values() for column in fields.values()}
+SUGGESTIONS = {
+    "beach": [suggestion("Nice", "France", "Nice Cote d'Azur Airport"),
+              suggestion("Atlantis", "Atlantis", "Lynden Pindling International Airport")],
+    "ski": [suggestion("Nice", "France", "Nice Cote d'Azur Airport"),
+            suggestion("Denver", "United States", "Denver International Airport")],
+    "broken": [{"location": {"city": "Nowhere"}}],
+    "flightless": [suggestion("Anchorage", "United States", "Ted Stevens Anchorage International Airport")]
+}
+
+
+class TripCoordinatesTest(unittest.TestCase):
+
+    def test_destination_airport(self):
+        airports = [csvp.resolve_code(csvp.AIRPORTS_PATH, "LHR")]
+        self.assertEqual(main.trip_coordinates(trip("London", "United Kingdom"), airports),
+                         csvp.row_coordinates(airports[0]))
+
+    def test_city_centroid_without_airport(self):
+        self.assertEqual(main.trip_coordinates(trip("London", "United Kingdom"), []),
+                         csvp.get_airport_index().city_centroid("London", "United Kingdom"))
+
+    def test_unknown_place_is_geocoded(self):
+        self.assertIsNone(main.trip_coordinates(trip("Atlantis", "Atlantis"), []))
+
+
+class OfferDetailsTest(unittest.TestCase):
+
+    def test_template_shape(self):
+        segments = [{"carrierCode": "AF", "departure": {"at": "2030-01-01T10:00:00", "iataCode": "JFK"},
+                     "arrival": {"at": "2030-01-01T22:00:00", "iataCode": "CDG"}},
+                    {"carrierCode": "AF", "departure": {"at": "2030-01-02T07:00:00", "iataCode": "CDG"},
+                     "arrival": {"at": "2030-01-02T08:30:00", "iataCode": "NCE"}}]
+        offer = amad.summarize_offer({"price": {"total": "420.00", "currency": "USD"}, "validatingAirlineCodes": ["AF"],
+                                      "numberOfBookableSeats": 4,
+                                      "itineraries": [{"duration": "PT16H30M", "segments": segments}]})
+        details = main.offer_details(offer)
+        self.assertEqual(details["departure"], {"date": "2030-01-01", "time": "10:00:00",
+                                                "airport": main.airport_name("JFK")})
+        self.assertEqual(details["arrival"], {"date": "2030-01-02", "time": "08:30:00",
+                                              "airport": main.airport_name("NCE")})
+        self.assertEqual((details["duration"], details["stops"]), ("PT16H30M", 1))
+        self.assertEqual(details["layovers"], [csvp.resolve_code(csvp.AIRPORTS_PATH, "CDG")[1]])
+
+    def test_price_only_offer(self):
+        result = amad.destination_result({"origin": "JFK", "destination": "NCE", "departureDate": "2030-01-01",
+                                          "price": {"total": "420.00"}}, "USD")
+        details = main.offer_details(result["data"][0])
+        self.assertEqual(details["departure"]["date"], "2030-01-01")
+        self.assertIsNone(details["departure"]["time"])
+        self.assertEqual(details["arrival"]["date"], None)
+        self.assertEqual((details["duration"], details["stops"], details["layovers"]), (None, None, None))
+
+    def test_unknown_airport_keeps_code(self):
+        self.assertEqual(main.airport_name("ZZZZZ"), "ZZZZZ")
+
+
+class SearchBatchTest(unittest.TestCase):
+    """
+    search_batch() against stand-ins for the Gemini, Amadeus, OpenCage and meteoblue calls, counting each call.
+    """
+
+    def setUp(self):
+        self.calls = {"gemini": [], "flight": [], "geocode": [], "weather": []}
+        clients = dict.fromkeys(("gemini", "amadeus", "geocoding", "meteoblue"))
+        self.enterContext(mock.patch.object(main, "clients", clients))
+        self.enterContext(mock.patch.object(main.gem, "get_location", self.get_location))
+        self.enterContext(mock.patch.object(main, "get_flight_info", self.get_flight_info))
+        self.enterContext(mock.patch.object(main.meb, "geocode", self.geocode))
+        self.enterContext(mock.patch.object(main.meb, "get_weather_at", self.get_weather_at))
+        coordinates = main.trip_coordinates
+        # Atlantis has to be geocoded, even though it flies to Nassau
+        self.enterContext(mock.patch.object(main, "trip_coordinates", lambda trip, airports: (
+            None if trip["location"]["city"] == "Atlantis" else coordinates(trip, airports))))
+
+    def get_location(self, client, request):
+        descriptors = json.loads(request)["descriptors"]
+        self.calls["gemini"].append(descriptors)
+        if descriptors == ["down"]:
+            raise RuntimeError("Gemini is down")
+        return SUGGESTIONS[descriptors[0]]
+
+    def get_flight_info(self, search, destination):
+        self.calls["flight"].append(destination)
+        if destination == "ANC":
+            raise RuntimeError("Amadeus is down")
+        return {"data": [amad.summarize_offer({
+            "price": {"total": "420.00", "currency": "USD"}, "validatingAirlineCodes": ["AF"],
+            "itineraries": [{"duration": "PT9H", "segments": [
+                {"carrierCode": "AF", "departure": {"at": "2030-01-01T10:00:00", "iataCode": "JFK"},
+                 "arrival": {"at": "2030-01-01T19:00:00", "iataCode": destination}}]}]})]}
+
+    def geocode(self, client, place):
+        self.calls["geocode"].append(place)
+        return 24.0, -75.0
+
+    def get_weather_at(self, client, lat, lng):
+        self.calls["weather"].append((lat, lng))
+        return {"data_day": DATA_DAY}
+
+    @staticmethod
+    def query(descriptors, **overrides):
+        query = {"origin_airport": "Kennedy", "descriptors": descriptors,
+                 "departure_date": (date.today() + timedelta(days=30)).strftime("%m/%d/%Y"),
+                 "max_price": 1000, "adults": 1}
+        query.update(overrides)
+        return query
+
+    def test_upstream_calls_are_shared(self):
+        results = main.search_batch([self.query("beach"), self.query("Beach"), self.query("ski"),
+                                     self.query("ski", origin_airport="kennedy")])
+        # Each distinct intent, flight, place and forecast cell is looked up once
+        self.assertEqual(self.calls["gemini"], [["beach"], ["ski"]])
+        self.assertEqual(sorted(self.calls["flight"]), ["DEN", "NAS", "NCE"])
+        self.assertEqual(self.calls["geocode"], ["Atlantis, Atlantis"])
+        self.assertEqual(len(self.calls["weather"]), 3)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([[item["trip"]["location"]["city"] for item in result] for result in results],
+                         [["Nice", "Atlantis"]] * 2 + [["Nice", "Denver"]] * 2)
+        self.assertEqual(results[0][0]["flight"], results[2][0]["flight"])
+
+    def test_results_follow_the_queries(self):
+        queries = [self.query("ski"), self.query("beach"), self.query("ski", max_price=900)]
+        results = main.search_batch(queries)
+        self.assertEqual([result[1]["trip"]["location"]["city"] for result in results],
+                         ["Denver", "Atlantis", "Denver"])
+        self.assertEqual(results[1], main.search_batch([queries[1]])[0])
+
+    def test_failures_stay_with_their_query(self):
+        results = main.search_batch([self.query("beach", adults="none"), self.query("down"), self.query("broken"),
+                                     self.query("flightless"), self.query("beach", max_workers=2), self.query("ski")])
+        self.assertIsInstance(results[0], main.ce.CustomException)
+        self.assertIsInstance(results[0].error, ValueError)
+        self.assertEqual(str(results[1].error), "Gemini is down")
+        self.assertIsInstance(results[2].error, KeyError)
+        self.assertEqual(str(results[3].error), "Amadeus is down")
+        self.assertIsInstance(results[4].error, TypeError)
+        self.assertEqual([item["trip"]["location"]["city"] for item in results[5]], ["Nice", "Denver"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# Description: Tests of AccessPoints/meteoblue.py.
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+import httpx
+
+from AccessPoints import meteoblue as meb
+import init_clients
+from Tools import cache
+from Tools import resilience
+
+
+def data_day(days):
+    """
+    Get a "data_day" section with every column the forecast reads.
+    """
+    columns = {column: [float(day) for day in range(days)]
+               for fields in meb.Forecast.FIELDS.values() for column in fields.values()}
+    columns["time"] = [f"2030-01-0{day + 1}" for day in range(days)]
+    return columns
+
+
+class ForecastTest(unittest.TestCase):
+
+    def test_json_dumps(self):
+        forecast = meb.Forecast(data_day(4))
+        dumped = json.loads(json.dumps({"weather": forecast}))["weather"]
+        self.assertEqual(dumped["days"], 4)
+        self.assertEqual(dumped["dates"], data_day(4)["time"])
+        self.assertEqual(dumped["real_temp"]["min"], [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(json.loads(json.dumps(forecast[1])), forecast[1].__json__())
+
+    def test_days(self):
+        columns = data_day(3)
+        columns["temperature_max"].append(9.0)
+        forecast = meb.Forecast(columns)
+        self.assertEqual(forecast.days, 3)
+        self.assertEqual(forecast["real_temp"]["max"], [0.0, 1.0, 2.0])
+        self.assertEqual(forecast[-1]["precipitation"]["amount"], 2.0)
+        self.assertEqual([day.day for day in forecast[1:]], [1, 2])
+        with self.assertRaises(IndexError):
+            forecast[3]
+
+
+class GeocodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.enterContext(mock.patch.object(meb, "GEOCODE_CACHE", cache.LRUCache()))
+        meb.GEOCODING.breaker.record_success()
+        self.enterContext(mock.patch.object(meb.GEOCODING, "limiter", None))
+
+    def geocode(self, status, body):
+        transport = httpx.MockTransport(lambda request: httpx.Response(status, json=body))
+        client = init_clients.Auth(key="key", http_config={**init_clients.HTTP_CONFIG, "transport": transport})
+        return asyncio.run(meb.geocode_async(client, "Nice, France"))
+
+    def test_center_of_best_match(self):
+        body = {"status": {"code": 200}, "results": [
+            {"bounds": {"northeast": {"lat": 43.8, "lng": 7.4}, "southwest": {"lat": 43.6, "lng": 7.2}}},
+            {"bounds": {"northeast": {"lat": 0, "lng": 0}, "southwest": {"lat": 0, "lng": 0}}}
+        ]}
+        lat, lng = self.geocode(200, body)
+        self.assertAlmostEqual(lat, 43.7)
+        self.assertAlmostEqual(lng, 7.3)
+        self.assertEqual(meb.GEOCODE_CACHE.get("nice, france"), (lat, lng))
+
+    def test_rejected_request(self):
+        with self.assertRaisesRegex(resilience.UpstreamUnavailable, "HTTP 403"):
+            self.geocode(403, {"status": {"code": 403, "message": "invalid API key"}, "results": []})
+        self.assertEqual(len(meb.GEOCODE_CACHE), 0)
+
+    def test_place_not_found(self):
+        for body in ({"status": {"code": 200}, "results": []}, {"status": {"code": 200}}, [],
+                     {"results": [{"geometry": {"lat": 43.7, "lng": 7.3}}]}):
+            with self.subTest(body=body), self.assertRaises(resilience.UpstreamUnavailable):
+                self.geocode(200, body)
+        self.assertEqual(len(meb.GEOCODE_CACHE), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+# Description: Tests of Tools/rate_limit.py.
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from Tools import rate_limit
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "rate_limits.sqlite3")
+
+    def bucket(self, **options) -> rate_limit.TokenBucket:
+        options = {"rate": 100, "capacity": 2, **options}
+        return rate_limit.TokenBucket("test", path=self.path, **options)
+
+    def test_burst_then_queue(self):
+        bucket = self.bucket()
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+        started = time.monotonic()
+        waited = bucket.acquire()
+        self.assertTrue(0 < waited <= 0.01, waited)
+        self.assertGreaterEqual(time.monotonic() - started, waited * 0.9)
+
+    def test_turned_away_past_max_wait(self):
+        bucket = self.bucket(rate=1, capacity=1, max_wait=0.5)
+        bucket.acquire()
+        with self.assertRaises(rate_limit.RateLimited) as raised:
+            bucket.acquire()
+        self.assertAlmostEqual(raised.exception.retry_after, 1, delta=0.1)
+        # A caller turned away reserves nothing
+        self.assertAlmostEqual(bucket.utilization()["queue_seconds"], 0, delta=0.1)
+
+    def test_daily_limit(self):
+        bucket = self.bucket(daily_limit=3)
+        bucket.acquire(2)
+        with self.assertRaises(rate_limit.RateLimited) as raised:
+            bucket.acquire(2)
+        self.assertIn("daily quota", raised.exception.reason)
+        self.assertEqual(bucket.utilization()["today"], 2)
+
+    def test_shared_between_instances(self):
+        first, second = self.bucket(rate=1, capacity=2), self.bucket(rate=1, capacity=2)
+        first.acquire(2)
+        with self.assertRaises(rate_limit.RateLimited):
+            second.acquire(max_wait=0.1)
+        self.assertLess(second.utilization()["tokens"], 1)
+
+    def test_acquire_async(self):
+        bucket = self.bucket(capacity=1)
+
+        async def both():
+            return await asyncio.gather(bucket.acquire_async(), bucket.acquire_async())
+
+        waits = sorted(asyncio.run(both()))
+        self.assertEqual(waits[0], 0)
+        self.assertTrue(0 < waits[1] <= 0.01, waits)
+
+    def test_unusable_file_lets_calls_through(self):
+        bucket = rate_limit.TokenBucket("test", rate=1, capacity=1, path=os.path.join(self.path, "missing", "rl"))
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.utilization()["today"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,254 @@
+# Description: Tests of Tools/resilience.py.
+import asyncio
+import time
+import unittest
+
+from Tools import rate_limit
+from Tools import resilience
+
+
+class Response:
+    """
+    A stand-in for an HTTP response.
+    """
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class ClientError(Exception):
+    """
+    A stand-in for an SDK error carrying the HTTP status, like genai's ClientError.
+    """
+
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class FullBucket:
+    """
+    A rate limiter that turns every caller away.
+    """
+
+    def acquire(self):
+        raise rate_limit.RateLimited("test", "the queue is 60.0s long", 60)
+
+    async def acquire_async(self):
+        raise rate_limit.RateLimited("test", "the queue is 60.0s long", 60)
+
+
+class HalfOpenTrialTest(unittest.TestCase):
+
+    def half_open_upstream(self) -> resilience.Upstream:
+        """
+        Get an upstream whose circuit has opened and is now half-open.
+        """
+        upstream = resilience.Upstream("test", max_attempts=1, failure_threshold=1, reset_timeout=0.01,
+                                       budget=resilience.RetryBudget())
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            upstream.call(lambda: Response(503))
+        time.sleep(0.02)
+        self.assertEqual(upstream.breaker.state, "half-open")
+        return upstream
+
+    def assert_recovers(self, upstream):
+        self.assertEqual(upstream.call(lambda: Response(200)).status_code, 200)
+        self.assertEqual(upstream.breaker.state, "closed")
+
+    def test_success_closes(self):
+        upstream = self.half_open_upstream()
+        self.assert_recovers(upstream)
+
+    def test_failure_reopens(self):
+        upstream = self.half_open_upstream()
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            upstream.call(lambda: Response(500))
+        self.assertEqual(upstream.breaker.state, "open")
+
+    def test_client_error_response_closes(self):
+        upstream = self.half_open_upstream()
+        self.assertEqual(upstream.call(lambda: Response(400)).status_code, 400)
+        self.assertEqual(upstream.breaker.state, "closed")
+
+    def test_client_error_exception_closes(self):
+        upstream = self.half_open_upstream()
+
+        def fail():
+            raise ClientError(400)
+
+        with self.assertRaises(ClientError):
+            upstream.call(fail)
+        self.assertEqual(upstream.breaker.state, "closed")
+
+    def test_local_error_releases_trial(self):
+        upstream = self.half_open_upstream()
+
+        def fail():
+            raise ValueError("bad payload")
+
+        with self.assertRaises(ValueError):
+            upstream.call(fail)
+        self.assertEqual(upstream.breaker.state, "half-open")
+        self.assert_recovers(upstream)
+
+    def test_rate_limited_releases_trial(self):
+        upstream = self.half_open_upstream()
+        upstream.limiter = FullBucket()
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            upstream.call(lambda: Response(200))
+        self.assertEqual(upstream.breaker.state, "half-open")
+        upstream.limiter = None
+        self.assert_recovers(upstream)
+
+    def test_rate_limited_async_releases_trial(self):
+        upstream = self.half_open_upstream()
+        upstream.limiter = FullBucket()
+
+        async def ok():
+            return Response(200)
+
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            asyncio.run(upstream.call_async(ok))
+        self.assertEqual(upstream.breaker.state, "half-open")
+
+    def test_cancelled_releases_trial(self):
+        upstream = self.half_open_upstream()
+
+        async def hang():
+            await asyncio.sleep(10)
+
+        async def cancel():
+            task = asyncio.create_task(upstream.call_async(hang))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel())
+        self.assertEqual(upstream.breaker.state, "half-open")
+        self.assert_recovers(upstream)
+
+    def test_only_one_trial(self):
+        upstream = self.half_open_upstream()
+        self.assertEqual(upstream.breaker.admit(), "trial")
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            upstream.call(lambda: Response(200))
+        upstream.breaker.release()
+        self.assert_recovers(upstream)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = resilience.CircuitBreaker(failure_threshold=2, reset_timeout=0.02)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 0)
+        time.sleep(0.03)
+        self.assertEqual(breaker.state, "half-open")
+
+    def test_success_resets_count(self):
+        breaker = resilience.CircuitBreaker(failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_hold(self):
+        breaker = resilience.CircuitBreaker()
+        breaker.hold(60)
+        self.assertEqual(breaker.state, "open")
+        self.assertAlmostEqual(breaker.retry_after(), 60, delta=1)
+
+
+class RetryBudgetTest(unittest.TestCase):
+
+    def test_spends_and_refills_on_calls(self):
+        budget = resilience.RetryBudget(ratio=0.5, min_per_second=0, max_tokens=2)
+        self.assertTrue(budget.try_spend())
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+        budget.deposit()
+        self.assertFalse(budget.try_spend())
+        budget.deposit()
+        self.assertTrue(budget.try_spend())
+
+
+class RetryAfterTest(unittest.TestCase):
+
+    def test_seconds_and_dates(self):
+        self.assertEqual(resilience.retry_after_seconds("3"), 3.0)
+        self.assertEqual(resilience.retry_after_seconds("-3"), 0.0)
+        self.assertEqual(resilience.retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        self.assertIsNone(resilience.retry_after_seconds("soon"))
+        self.assertIsNone(resilience.retry_after_seconds(None))
+
+
+class UpstreamCallTest(unittest.TestCase):
+
+    def upstream(self, **options) -> resilience.Upstream:
+        """
+        Get an upstream that retries without waiting.
+        """
+        options = {"max_attempts": 3, "base_delay": 0, "failure_threshold": 5, "budget": resilience.RetryBudget(),
+                   **options}
+        return resilience.Upstream("test", **options)
+
+    def test_retries_transient_failures(self):
+        upstream = self.upstream()
+        responses = iter([Response(503), Response(502), Response(200)])
+        self.assertEqual(upstream.call(lambda: next(responses)).status_code, 200)
+        self.assertEqual(upstream.breaker.state, "closed")
+
+    def test_retries_transport_errors_async(self):
+        upstream = self.upstream()
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionResetError("reset")
+            return Response(200)
+
+        self.assertEqual(asyncio.run(upstream.call_async(flaky)).status_code, 200)
+        self.assertEqual(len(attempts), 3)
+
+    def test_gives_up_after_max_attempts(self):
+        upstream = self.upstream()
+        attempts = []
+        with self.assertRaises(resilience.UpstreamUnavailable) as raised:
+            upstream.call(lambda: attempts.append(1) or Response(500))
+        self.assertEqual(len(attempts), 3)
+        self.assertIn("HTTP 500 after 3 attempts", str(raised.exception))
+
+    def test_long_retry_after_opens_circuit(self):
+        upstream = self.upstream()
+        with self.assertRaises(resilience.UpstreamUnavailable) as raised:
+            upstream.call(lambda: Response(429, {"Retry-After": "120"}))
+        self.assertEqual(raised.exception.retry_after, 120)
+        self.assertEqual(upstream.breaker.state, "open")
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            upstream.call(lambda: Response(200))
+
+    def test_retry_budget_exhausted(self):
+        upstream = self.upstream(budget=resilience.RetryBudget(min_per_second=0, max_tokens=0))
+        attempts = []
+        with self.assertRaises(resilience.UpstreamUnavailable) as raised:
+            upstream.call(lambda: attempts.append(1) or Response(503))
+        self.assertEqual(len(attempts), 1)
+        self.assertIn("retry budget exhausted", str(raised.exception))
+
+    def test_client_errors_pass_through(self):
+        upstream = self.upstream()
+        attempts = []
+        self.assertEqual(upstream.call(lambda: attempts.append(1) or Response(404)).status_code, 404)
+        self.assertEqual(len(attempts), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
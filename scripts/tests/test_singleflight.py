@@ -0,0 +1,106 @@
+# Description: Tests of Tools/singleflight.py.
+import asyncio
+import threading
+import time
+import unittest
+
+from Tools import singleflight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_concurrent_callers_share_one_call(self):
+        flights = singleflight.SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            release.wait(1)
+            return "result"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.do("key", fn)))
+        leader.start()
+        started.wait(1)
+        followers = [threading.Thread(target=lambda: results.append(flights.do("key", fn))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        for _ in range(100):
+            if flights.stats()["shared"] == 3:
+                break
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(1)
+        self.assertEqual(results, ["result"] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.stats(), {"calls": 1, "shared": 3, "in_flight": 0})
+        # Nothing is kept once the call is over
+        self.assertEqual(flights.do("key", lambda: "again"), "again")
+
+    def test_error_is_shared(self):
+        flights = singleflight.SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def many():
+            return await asyncio.gather(*(flights.do_async("key", fn) for _ in range(3)), return_exceptions=True)
+
+        errors = asyncio.run(many())
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors))
+        self.assertEqual(flights.stats(), {"calls": 1, "shared": 2, "in_flight": 0})
+
+    def test_cancelled_caller_leaves_call_running(self):
+        flights = singleflight.SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def run():
+            impatient = asyncio.ensure_future(flights.do_async("key", fn))
+            patient = asyncio.ensure_future(flights.do_async("key", fn))
+            await asyncio.sleep(0.01)
+            impatient.cancel()
+            return await patient
+
+        self.assertEqual(asyncio.run(run()), "result")
+
+    def test_call_cancelled_once_every_caller_is(self):
+        flights = singleflight.SingleFlight()
+        cancelled = []
+
+        async def fn():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(asyncio.gather(flights.do_async("key", fn), flights.do_async("key", fn)), 0.02)
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(flights.stats()["in_flight"], 0)
+
+    def test_keys_are_per_event_loop(self):
+        flights = singleflight.SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0)
+            return asyncio.get_running_loop()
+
+        first, second = asyncio.run(flights.do_async("key", fn)), asyncio.run(flights.do_async("key", fn))
+        self.assertIsNot(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()